@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks de PyPaint (à lancer depuis la racine : python -m benchmarks.<nom>)
+"""
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Comparaison du remplissage pixel par pixel historique et du remplissage scanline
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from pypaint_core import scanline_fill
+
+from .common import measure, report
+
+
+WIDTH, HEIGHT = 800, 550
+COLOR = (255, 0, 0)
+
+
+def legacy_flood_fill(image, x, y, color_rgb):
+    """Ancienne implémentation de PyPaint.flood_fill (pile + set, limite 100000)"""
+    target_color = image.getpixel((x, y))
+    if target_color == color_rgb:
+        return
+    pixels = image.load()
+    stack = [(x, y)]
+    filled = set()
+    while stack and len(filled) < 100000:
+        px, py = stack.pop()
+        if (px, py) in filled:
+            continue
+        if px < 0 or px >= image.width or py < 0 or py >= image.height:
+            continue
+        if pixels[px, py] != target_color:
+            continue
+        pixels[px, py] = color_rgb
+        filled.add((px, py))
+        stack.extend([(px+1, py), (px-1, py), (px, py+1), (px, py-1)])
+
+
+def blank_image(width=WIDTH, height=HEIGHT):
+    """Canvas entièrement blanc"""
+    return Image.new("RGB", (width, height), "white")
+
+
+def fragmented_image(width=WIDTH, height=HEIGHT):
+    """Canvas parsemé de traits noirs aléatoires"""
+    rng = np.random.default_rng(0)
+    image = blank_image(width, height)
+    draw = ImageDraw.Draw(image)
+    for _ in range(400 * width * height // (WIDTH * HEIGHT)):
+        x, y = rng.integers(0, width), rng.integers(0, height)
+        dx, dy = rng.integers(-60, 60, size=2)
+        draw.line([x, y, x + dx, y + dy], fill="black", width=2)
+    return image
+
+
+def maze_image(width=WIDTH, height=HEIGHT):
+    """Labyrinthe en serpentin : couloirs de 3 px séparés par des murs de 1 px"""
+    image = blank_image(width, height)
+    draw = ImageDraw.Draw(image)
+    for i, x in enumerate(range(4, width, 4)):
+        if i % 2:
+            draw.line([x, 4, x, height - 1], fill="black")
+        else:
+            draw.line([x, 0, x, height - 5], fill="black")
+    return image
+
+
+def main():
+    scenarios = [
+        ("plein canvas", blank_image),
+        ("fragmenté", fragmented_image),
+        ("labyrinthe", maze_image),
+    ]
+    for name, factory in scenarios:
+        source = factory()
+
+        def run_legacy(image):
+            legacy_flood_fill(image, 1, 1, COLOR)
+
+        def run_scanline(pixels):
+            scanline_fill(pixels, 1, 1, COLOR)
+
+        report(f"{name} / historique", measure(run_legacy, source.copy, repeat=3))
+        report(f"{name} / scanline", measure(run_scanline, lambda: np.array(source), repeat=10))
+
+        # Pixels effectivement remplis par chaque version
+        legacy = source.copy()
+        legacy_flood_fill(legacy, 1, 1, COLOR)
+        pixels = np.array(source)
+        scanline_fill(pixels, 1, 1, COLOR)
+        legacy_count = int((np.array(legacy) == COLOR).all(axis=2).sum())
+        scanline_count = int((pixels == COLOR).all(axis=2).sum())
+        print(f"{'':<40} pixels remplis : historique {legacy_count}, scanline {scanline_count}")
+
+
+if __name__ == "__main__":
+    main()
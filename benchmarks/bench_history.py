@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Mémoire et latence de l'historique : instantanés complets contre tuiles modifiées
+
+La mémoire de l'historique par tuiles inclut sa copie de référence.
+"""
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from pypaint_core import TileHistory
+
+from .common import measure, percentile
+
+
+STROKES = 50
+
+
+class SnapshotHistory:
+    """Ancien historique de PyPaint : une copie complète de l'image par action"""
+
+    def __init__(self, image, max_history=50):
+        self.history = [image.copy()]
+        self.index = 0
+        self.max_history = max_history
+
+    @property
+    def memory_used(self):
+        return sum(len(state.tobytes()) for state in self.history)
+
+    def commit(self, image, box=None):
+        self.history = self.history[:self.index + 1]
+        self.history.append(image.copy())
+        self.index += 1
+        if len(self.history) > self.max_history:
+            self.history.pop(0)
+            self.index -= 1
+
+    def undo(self, image):
+        if self.index > 0:
+            self.index -= 1
+            return self.history[self.index].copy()
+        return image
+
+    def redo(self, image):
+        if self.index < len(self.history) - 1:
+            self.index += 1
+            return self.history[self.index].copy()
+        return image
+
+
+def strokes(width, height, count):
+    """Traits aléatoires de taille réaliste (boîte englobante comprise)"""
+    rng = np.random.default_rng(0)
+    for _ in range(count):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        dx, dy = (int(v) for v in rng.integers(-120, 120, size=2))
+        yield [x, y, x + dx, y + dy], (min(x, x + dx) - 5, min(y, y + dy) - 5,
+                                       max(x, x + dx) + 6, max(y, y + dy) + 6)
+
+
+def run(history_factory, size):
+    """Dessiner STROKES traits puis tout annuler et rétablir"""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    history = history_factory(image)
+    commit_times, undo_times, redo_times = [], [], []
+
+    for line, box in strokes(*size, STROKES):
+        draw.line(line, fill="black", width=5)
+        commit_times += measure(lambda: history.commit(image, box), repeat=1)
+    memory = getattr(history, "total_memory", history.memory_used)
+
+    for _ in range(STROKES):
+        def undo():
+            nonlocal image
+            result = history.undo(image)
+            if isinstance(result, Image.Image):
+                image = result
+        undo_times += measure(undo, repeat=1)
+    for _ in range(STROKES):
+        def redo():
+            nonlocal image
+            result = history.redo(image)
+            if isinstance(result, Image.Image):
+                image = result
+        redo_times += measure(redo, repeat=1)
+    return memory, commit_times, undo_times, redo_times
+
+
+def main():
+    for size in [(800, 550), (2000, 1500), (4000, 3000)]:
+        print(f"Canvas {size[0]}x{size[1]}, {STROKES} traits")
+        variants = [
+            ("instantanés", SnapshotHistory),
+            ("tuiles", TileHistory),
+            ("tuiles brutes", lambda image: TileHistory(image, compress=False)),
+        ]
+        for name, factory in variants:
+            memory, commits, undos, redos = run(factory, size)
+            print(
+                f"  {name:<14} mémoire {memory / 1024 / 1024:8.2f} Mo"
+                f"   save_state p50 {percentile(commits, 50):7.2f} ms"
+                f"   undo p50 {percentile(undos, 50):7.2f} ms"
+                f"   redo p50 {percentile(redos, 50):7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
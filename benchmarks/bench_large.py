@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Grand format : document de 20 000 x 20 000 px stocké par tuiles projetées en mémoire
+
+Mesure le temps des opérations locales, le nombre de tuiles résidentes et
+le pic de mémoire du processus.
+
+    python -m benchmarks.bench_large [--size 20000x20000] [--save fichier.png]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from pypaint_core import Document, Fill, Line, Rect, Undo
+
+from .common import max_rss_kb, measure, percentile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark grand format de PyPaint")
+    parser.add_argument("--size", default="20000x20000", help="taille LxH du document")
+    parser.add_argument("--strokes", type=int, default=200, help="nombre de traits")
+    parser.add_argument("--save", help="enregistrer le résultat en PNG (bande par bande)")
+    args = parser.parse_args(argv)
+    width, height = (int(v) for v in args.size.lower().split("x"))
+
+    start = time.perf_counter()
+    document = Document(width, height)
+    print(f"Document {width}x{height} créé en {(time.perf_counter() - start) * 1000:.1f} ms"
+          f" (par tuiles : {document.tiled})")
+
+    rng = np.random.default_rng(0)
+    strokes = []
+    for _ in range(args.strokes):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        points = [x, y]
+        for _ in range(20):
+            x = int(np.clip(x + rng.integers(-30, 31), 0, width - 1))
+            y = int(np.clip(y + rng.integers(-30, 31), 0, height - 1))
+            points += [x, y]
+        strokes.append(points)
+    stroke_iter = iter(strokes)
+    timings = measure(lambda: document.apply(Line(next(stroke_iter), "#000000", 5)), repeat=len(strokes))
+    print(f"trait + commit        p50 {percentile(timings, 50):8.2f} ms   p99 {percentile(timings, 99):8.2f} ms")
+
+    # Remplissage d'une zone fermée de 1000 x 1000 px
+    cx, cy = width // 2, height // 2
+    document.apply(Rect([cx - 500, cy - 500, cx + 500, cy + 500], "#000000", 3))
+    timings = measure(lambda: document.apply(Fill(cx, cy, "#FF0000")), repeat=1)
+    print(f"remplissage 1000²     {timings[0]:8.2f} ms")
+
+    timings = measure(lambda: document.apply(Undo()), repeat=10)
+    print(f"undo                  p50 {percentile(timings, 50):8.2f} ms")
+
+    image = document.image
+    if document.tiled:
+        total = image.rows * image.cols
+        print(f"tuiles résidentes     {image.resident_tiles} / {total}")
+    print(f"pic mémoire (RSS)     {max_rss_kb() / 1024:.1f} Mo"
+          f"   (image complète : {width * height * 3 / 1024 / 1024:.0f} Mo)")
+
+    if args.save:
+        import pypaint_core
+
+        timings = measure(lambda: pypaint_core.save_image(image, args.save), repeat=1)
+        print(f"sauvegarde PNG        {timings[0]:8.2f} ms   pic RSS {max_rss_kb() / 1024:.1f} Mo")
+
+    document.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+Stress test du crayon : temps par trait et nombre d'éléments Tk après 10 000 traits
+
+Nécessite un affichage (par exemple : xvfb-run python -m benchmarks.bench_strokes).
+"""
+
+import sys
+import tkinter as tk
+from types import SimpleNamespace
+
+import numpy as np
+
+from pypaint import PyPaint
+
+from .common import measure, percentile
+
+
+STROKES = 10000
+POINTS_PER_STROKE = 20
+CHECKPOINT = 1000
+
+
+def stroke_events(rng, width, height):
+    """Suite de positions d'un trait aléatoire"""
+    x, y = int(rng.integers(20, width - 20)), int(rng.integers(20, height - 20))
+    events = []
+    for _ in range(POINTS_PER_STROKE):
+        x = int(np.clip(x + rng.integers(-8, 9), 1, width - 1))
+        y = int(np.clip(y + rng.integers(-8, 9), 1, height - 1))
+        events.append(SimpleNamespace(x=x, y=y))
+    return events
+
+
+def main():
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Affichage indisponible : {e}")
+        sys.exit(1)
+
+    app = PyPaint(root)
+    root.update()
+    rng = np.random.default_rng(0)
+    timings = []
+
+    def draw_stroke():
+        events = stroke_events(rng, app.canvas_width, app.canvas_height)
+        app.on_press(events[0])
+        for event in events[1:]:
+            app.on_drag(event)
+        app.on_release(events[-1])
+        root.update()
+
+    print(f"{'traits':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} {'éléments Tk':>12}")
+    for done in range(1, STROKES + 1):
+        timings += measure(draw_stroke, repeat=1)
+        if done % CHECKPOINT == 0:
+            window = timings[-CHECKPOINT:]
+            items = len(app.canvas.find_all())
+            print(f"{done:>8} {percentile(window, 50):>10.2f} {percentile(window, 99):>10.2f} {items:>12}")
+
+    root.destroy()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Outils communs aux benchmarks de PyPaint
+"""
+
+import time
+
+
+def measure(func, setup=None, repeat=5):
+    """Exécuter func `repeat` fois et retourner les durées en millisecondes.
+
+    `setup` est appelé avant chaque mesure (hors chronomètre) et son
+    résultat est passé à func.
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        if setup:
+            func(arg)
+        else:
+            func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def percentile(values, pct):
+    """Percentile par rang le plus proche"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def report(name, timings):
+    """Afficher une ligne de résultat"""
+    print(f"{name:<40} min {min(timings):9.2f} ms   p50 {percentile(timings, 50):9.2f} ms")
+
+
+def summarize(timings):
+    """Statistiques d'une série de durées (ms)"""
+    return {
+        "count": len(timings),
+        "mean_ms": round(sum(timings) / len(timings), 4) if timings else 0.0,
+        "p50_ms": round(percentile(timings, 50), 4),
+        "p99_ms": round(percentile(timings, 99), 4),
+        "min_ms": round(min(timings), 4) if timings else 0.0,
+        "max_ms": round(max(timings), 4) if timings else 0.0,
+    }
+
+
+def peak_memory(func):
+    """Pic d'allocation (Ko) pendant func, mesuré avec tracemalloc.
+
+    NumPy déclare ses tableaux à tracemalloc ; les tampons internes de
+    Pillow n'y figurent pas, d'où aussi le relevé ru_maxrss du processus.
+    """
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024, 1)
+
+
+def max_rss_kb():
+    """Pic de mémoire résidente du processus (Ko), si la plateforme le fournit"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
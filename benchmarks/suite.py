@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+Suite de benchmarks des chemins critiques de PyPaint
+
+Les cas « document » passent par pypaint_core (sans affichage). Les cas
+« tk » (aperçu des formes, refresh_canvas, événements souris) ne sont
+lancés que si un affichage est disponible, par exemple sous xvfb-run.
+
+    python -m benchmarks.suite --sizes 800x550 2000x1500 --output bench.json
+    python -m benchmarks.suite --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image
+
+import pypaint_core
+from pypaint_core import (
+    AddShape, ApplyFilter, Document, Ellipse, Erase, Fill, GaussianBlur, Journal, Line, MoveRegion, Rect, Redo, ReshapeShape,
+    Spray, Stroke, Undo, make_proxy, preview_filter,
+)
+
+from .bench_fill import fragmented_image, maze_image
+from .common import max_rss_kb, measure, peak_memory, summarize
+
+
+DEFAULT_SIZES = ["800x550", "2000x1500", "4000x3000"]
+
+
+def random_segments(rng, size, count, length=12):
+    """Segments de crayon de longueur réaliste pour un mouvement de souris"""
+    width, height = size
+    x, y = width // 2, height // 2
+    segments = []
+    for _ in range(count):
+        nx = int(np.clip(x + rng.integers(-length, length + 1), 0, width - 1))
+        ny = int(np.clip(y + rng.integers(-length, length + 1), 0, height - 1))
+        segments.append([x, y, nx, ny])
+        x, y = nx, ny
+    return segments
+
+
+def random_boxes(rng, size, count):
+    """Boîtes de formes aléatoires (jusqu'à un quart du canvas)"""
+    width, height = size
+    boxes = []
+    for _ in range(count):
+        x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        x1 = int(np.clip(x0 + rng.integers(-width // 4, width // 4), 0, width))
+        y1 = int(np.clip(y0 + rng.integers(-height // 4, height // 4), 0, height))
+        boxes.append([x0, y0, x1, y1])
+    return boxes
+
+
+def case(results, name, size, timings, peak_kb=None, **extra):
+    """Ajouter le résultat d'un cas ; `extra` : mesures supplémentaires (mémoire occupée...)"""
+    entry = {"case": name, "size": f"{size[0]}x{size[1]}"}
+    entry.update(summarize(timings))
+    entry["peak_kb"] = peak_kb
+    entry.update(extra)
+    results.append(entry)
+    print(
+        f"{name:<28} {entry['size']:>10} {entry['count']:>6}"
+        f" {entry['p50_ms']:>10.3f} {entry['p99_ms']:>10.3f} {entry['mean_ms']:>10.3f}"
+        f" {peak_kb if peak_kb is not None else '-':>10}"
+        + "".join(f"   {key} {value}" for key, value in extra.items())
+    )
+
+
+def document_cases(results, size, quick):
+    """Cas sans affichage : opérations, remplissage, historique, fichiers"""
+    rng = np.random.default_rng(0)
+    n = 50 if quick else 500
+
+    # Segments de crayon et de gomme (un segment par mouvement de souris)
+    for name, factory in [
+        ("pencil_segment", lambda seg: Stroke(seg, "#000000", 3)),
+        ("eraser_segment", lambda seg: Erase(seg, 6)),
+    ]:
+        document = Document(*size)
+        segments = iter(random_segments(rng, size, n + 1))
+        timings = measure(lambda: document.apply(factory(next(segments)), commit=False), repeat=n)
+        peak = peak_memory(lambda: document.apply(factory(next(segments)), commit=False))
+        case(results, name, size, timings, peak)
+
+    # Trait complet : polyligne de 20 points puis commit dans l'historique
+    document = Document(*size)
+    strokes = iter([sum(random_segments(rng, size, 20), []) for _ in range(n // 5 + 1)])
+    timings = measure(lambda: document.apply(Stroke(next(strokes), "#FF0000", 5)), repeat=n // 5)
+    peak = peak_memory(lambda: document.apply(Stroke(next(strokes), "#FF0000", 5)))
+    case(results, "stroke_commit", size, timings, peak)
+
+    # Pinceaux larges, net et estompé (empreintes en cache)
+    for name, hardness in [("brush_hard_40", 1.0), ("brush_soft_40", 0.3)]:
+        document = Document(*size)
+        strokes = iter([sum(random_segments(rng, size, 20), []) for _ in range(n // 5 + 1)])
+        timings = measure(lambda: document.apply(Stroke(next(strokes), "#0000FF", 40, hardness)), repeat=n // 5)
+        case(results, name, size, timings)
+
+    # Aérographe : un lot de gouttes par image (taille 15, un segment de souris)
+    document = Document(*size)
+    segments = iter(random_segments(rng, size, n + 1))
+    seeds = iter(range(n + 1))
+    timings = measure(
+        lambda: document.apply(Spray(next(segments), "#000000", 45, 265, next(seeds)), commit=False), repeat=n
+    )
+    case(results, "spray_batch", size, timings)
+
+    # Pose d'une sélection déplacée (un quart du canvas) : une seule opération à la validation
+    document = Document(*size)
+    width, height = size
+    moves = iter([(int(rng.integers(0, width // 2)), int(rng.integers(0, height // 2))) for _ in range(n // 5 + 1)])
+    timings = measure(
+        lambda: document.apply(MoveRegion([0, 0, width // 2, height // 2], *next(moves))), repeat=n // 5
+    )
+    case(results, "selection_move", size, timings)
+
+    # Formes vectorielles : clic (index en grille) et déplacement parmi 1000 formes
+    document = Document(*size)
+    for box in random_boxes(rng, size, 1000):
+        document.apply(AddShape("rect", box, "#008000", 3))
+    clicks = iter([(int(rng.integers(0, width)), int(rng.integers(0, height))) for _ in range(n + 1)])
+    timings = measure(lambda: document.vectors.hit(*next(clicks)), repeat=n)
+    case(results, "shape_hit_test", size, timings)
+    moves = iter(random_boxes(rng, size, n // 5 + 1))
+    timings = measure(lambda: document.apply(ReshapeShape(1, next(moves))), repeat=n // 5)
+    case(results, "shape_move", size, timings)
+
+    # Finalisation des formes (dessin + commit)
+    for name, cls in [("shape_line", Line), ("shape_rect", Rect), ("shape_ellipse", Ellipse)]:
+        document = Document(*size)
+        boxes = iter(random_boxes(rng, size, n // 5))
+        timings = measure(lambda: document.apply(cls(next(boxes), "#0000FF", 3)), repeat=n // 5)
+        peak = peak_memory(lambda: document.apply(cls(random_boxes(rng, size, 1)[0], "#0000FF", 3)))
+        case(results, name, size, timings, peak)
+
+    # Remplissage sur plusieurs formes de régions
+    for name, factory in [
+        ("fill_blank", lambda: Image.new("RGB", size, "white")),
+        ("fill_fragmented", lambda: fragmented_image(*size)),
+        ("fill_maze", lambda: maze_image(*size)),
+    ]:
+        source = factory()
+
+        def setup():
+            document = Document(*size)
+            document.image.paste(source)
+            document.history.reset(document.image)
+            return document
+
+        repeat = 3 if quick else 10
+        timings = measure(lambda document: document.apply(Fill(1, 1, "#FF0000")), setup, repeat=repeat)
+        document = setup()
+        peak = peak_memory(lambda: document.apply(Fill(1, 1, "#FF0000")))
+        case(results, name, size, timings, peak)
+
+    # Chaînes save_state / undo / redo
+    document = Document(*size)
+    steps = 20 if quick else 50
+    commits = []
+    for segment in random_segments(rng, size, steps, length=80):
+        document.apply(Line(segment, "#00AA00", 7), commit=False)
+        commits += measure(document.commit, repeat=1)
+    undos = measure(lambda: document.apply(Undo()), repeat=steps)
+    undo_peak = peak_memory(lambda: document.apply(Undo()))
+    redos = measure(lambda: document.apply(Redo()), repeat=steps)
+    redo_peak = peak_memory(lambda: document.apply(Redo()))
+    case(results, "save_state", size, commits)
+    case(results, "undo", size, undos, undo_peak)
+    case(results, "redo", size, redos, redo_peak)
+
+    # Mémoire d'un dessin au trait (quelques couleurs en aplats) : référence de l'historique
+    # en copie complète ou en tuiles compactes, puis tuiles d'une TiledImage
+    colors = ["#000000", "#FF0000", "#0000FF", "#00AA00", "#FFFF00"]
+    strokes = [
+        (sum(random_segments(rng, size, 20, length=40), []), colors[i % len(colors)])
+        for i in range(n // 5)
+    ]
+    for name, compact in [("memory_lineart_full", False), ("memory_lineart_compact", True)]:
+        document = Document(*size)
+        document.history.compact = compact
+        document.history.reset(document.image)
+        timings = []
+        for points, color in strokes:
+            timings += measure(lambda: document.apply(Stroke(points, color, 5)), repeat=1)
+        history = document.history
+        case(results, name, size, timings,
+             reference_kb=round((history.total_memory - history.memory_used) / 1024, 1),
+             history_kb=round(history.total_memory / 1024, 1))
+    document = Document(*size, tiled=True)
+    timings = []
+    for points, color in strokes:
+        timings += measure(lambda: document.apply(Stroke(points, color, 5)), repeat=1)
+    image = document.image
+    stored = image.resident_tiles + len(image.packed)
+    case(results, "memory_tiled_lineart", size, timings,
+         tiles_kb=round(image.stored_bytes / 1024, 1),
+         raw_tiles_kb=round(stored * image.tile_size * image.tile_size * 3 / 1024, 1))
+    document.close()
+
+    # Filtres : aperçu sur copie réduite, puis application complète (une entrée d'historique)
+    source = fragmented_image(*size)
+    proxy, factor = make_proxy(source)
+    timings = measure(lambda: preview_filter(proxy, GaussianBlur(8), factor), repeat=3 if quick else 10)
+    case(results, "filter_preview", size, timings)
+    for name, params in [("blur", {"radius": 8}), ("brightness_contrast", {"brightness": 10, "contrast": 30})]:
+        def setup():
+            document = Document(*size)
+            document.image.paste(source)
+            document.history.reset(document.image)
+            return document
+
+        timings = measure(lambda document: document.apply(ApplyFilter(name, params)), setup, repeat=2 if quick else 5)
+        case(results, f"filter_{name}", size, timings)
+
+    # Ouverture et sauvegarde de fichiers
+    image = fragmented_image(*size)
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in ["png", "jpg", "bmp"]:
+            path = os.path.join(tmp, f"bench.{ext}")
+            repeat = 2 if quick else 5
+            timings = measure(lambda: pypaint_core.save_image(image, path), repeat=repeat)
+            peak = peak_memory(lambda: pypaint_core.save_image(image, path))
+            case(results, f"save_image_{ext}", size, timings, peak)
+            timings = measure(lambda: pypaint_core.open_image(path, (800, 550)), repeat=repeat)
+            peak = peak_memory(lambda: pypaint_core.open_image(path, (800, 550)))
+            case(results, f"open_image_{ext}", size, timings, peak)
+
+    # Reprise de session : dernier point de reprise + fin du journal
+    with tempfile.TemporaryDirectory() as tmp:
+        document = Document(*size)
+        journal = Journal(tmp)
+        journal.start(document)
+        for segment in random_segments(rng, size, n, length=40):
+            document.apply(Line(segment, "#AA00AA", 5))
+        journal.close()
+        repeat = 2 if quick else 5
+        timings = measure(lambda: Journal.recover(tmp).close(), repeat=repeat)
+        case(results, "journal_recover", size, timings)
+
+    # Projet PyPaint : enregistrement complet, puis incrémental après un trait, ouverture
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.ppx")
+        document = Document.from_image(fragmented_image(*size))
+        repeat = 2 if quick else 5
+        timings = measure(lambda: pypaint_core.write_project(pypaint_core.DocumentCapture(document), path),
+                          repeat=repeat)
+        case(results, "project_save", size, timings)
+        pypaint_core.save_project(document, path)
+        segments = iter(random_segments(rng, size, repeat, length=40))
+
+        def stroke_and_save():
+            document.apply(Line(next(segments), "#AA00AA", 5))
+            pypaint_core.save_project(document, path)
+
+        case(results, "project_save_incremental", size, measure(stroke_and_save, repeat=repeat))
+        timings = measure(lambda: pypaint_core.open_project(path).close(), repeat=repeat)
+        case(results, "project_open", size, timings)
+
+
+def tk_cases(results, quick):
+    """Cas nécessitant Tk : événements souris, aperçu des formes, refresh_canvas"""
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"(cas Tk ignorés : {e})")
+        return
+
+    from pypaint import PyPaint
+
+    # Sans session : le journal de l'utilisateur n'est pas touché
+    app = PyPaint(root, session=False)
+    root.update()
+    size = (app.canvas_width, app.canvas_height)
+    rng = np.random.default_rng(0)
+    n = 50 if quick else 500
+
+    def event(x, y):
+        return SimpleNamespace(x=x, y=y, state=0)
+
+    def drag_frame(points):
+        # Mouvements reçus pendant une image, puis leur traitement groupé
+        for x, y in points:
+            app.on_drag(event(x, y))
+        app.motion.flush()
+
+    # Crayon via les gestionnaires d'événements : un mouvement par image, puis huit
+    app.select_tool("pencil")
+    segments = random_segments(rng, size, n)
+    app.on_press(event(*segments[0][:2]))
+    moves = iter(segments)
+    timings = measure(lambda: drag_frame([next(moves)[2:]]), repeat=n)
+    app.on_release(event(*segments[-1][2:]))
+    case(results, "tk_pencil_drag", size, timings)
+
+    app.on_press(event(*segments[0][:2]))
+    frames = iter([[segment[2:] for segment in random_segments(rng, size, 8)] for _ in range(n)])
+    timings = measure(lambda: drag_frame(next(frames)), repeat=n)
+    app.on_release(event(*segments[-1][2:]))
+    case(results, "tk_pencil_frame", size, timings)
+
+    # Aperçu et finalisation des formes
+    for tool in ["line", "rectangle", "ellipse"]:
+        app.select_tool(tool)
+        app.on_press(event(size[0] // 2, size[1] // 2))
+        boxes = iter(random_boxes(rng, size, n))
+        timings = measure(lambda: drag_frame([next(boxes)[2:]]), repeat=n)
+        case(results, f"tk_preview_{tool}", size, timings)
+        timings = measure(lambda: app.on_release(event(10, 10)), repeat=1)
+        case(results, f"tk_finalize_{tool}", size, timings)
+
+    # refresh_canvas : petite zone puis image entière
+    timings = measure(lambda: app.refresh_canvas((10, 10, 60, 60)), repeat=n)
+    case(results, "tk_refresh_partial", size, timings)
+    timings = measure(lambda: app.refresh_canvas((0, 0) + size), repeat=n // 5)
+    case(results, "tk_refresh_full", size, timings)
+
+    root.destroy()
+
+    # Démarrage à froid (nouveau processus) : première image affichée, puis premier trait
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pypaint.py")
+    marks = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "startup.json")
+        for _ in range(3 if quick else 10):
+            subprocess.run([sys.executable, script, "--startup-bench", "--output", path], capture_output=True)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    marks.append(json.load(f))
+                os.remove(path)
+    if marks:
+        case(results, "startup_first_frame", size, [m["first_frame_ms"] for m in marks])
+        case(results, "startup_first_stroke", size, [m["first_stroke_ms"] for m in marks])
+
+
+def compare(results, baseline_path):
+    """Afficher le rapport p50 courant / p50 de référence pour chaque cas"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["case"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\nComparaison avec {baseline_path} (p50 courant / p50 référence)")
+    for result in results:
+        previous = baseline.get((result["case"], result["size"]))
+        if previous and previous["p50_ms"] > 0:
+            ratio = result["p50_ms"] / previous["p50_ms"]
+            flag = "  <-- régression" if ratio > 1.2 else ""
+            print(f"{result['case']:<28} {result['size']:>10} {ratio:8.2f}x{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins critiques de PyPaint")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="tailles de canvas LxH")
+    parser.add_argument("--output", default="bench_results.json", help="fichier JSON des résultats")
+    parser.add_argument("--baseline", help="résultats JSON précédents à comparer")
+    parser.add_argument("--quick", action="store_true", help="moins d'itérations")
+    parser.add_argument("--no-tk", action="store_true", help="ne pas lancer les cas Tk")
+    args = parser.parse_args(argv)
+
+    results = []
+    print(f"{'cas':<28} {'taille':>10} {'n':>6} {'p50 (ms)':>10} {'p99 (ms)':>10} {'moy (ms)':>10} {'pic (Ko)':>10}")
+    for text in args.sizes:
+        width, height = (int(v) for v in text.lower().split("x"))
+        document_cases(results, (width, height), args.quick)
+    if not args.no_tk:
+        tk_cases(results, args.quick)
+
+    report = {
+        "version": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "max_rss_kb": max_rss_kb(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\nRésultats écrits dans {args.output}")
+
+    if args.baseline:
+        compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
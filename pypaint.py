@@ -4,14 +4,507 @@
 PyPaint - Application de dessin simple style Paint
 """
 
+import time
+
+# Instant du lancement, noté avant les autres imports (voir --startup-bench)
+LAUNCH_TIME = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, colorchooser, filedialog, messagebox, simpledialog
-from PIL import Image, ImageDraw, ImageTk
+from tkinter import ttk
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from PIL import Image
+import math
 import os
+import random
+import sys
+
+import pypaint_core
+from pypaint_core import (
+    DEFAULT_FAMILY, FILTERS, AddLayer, AddShape, ApplyFilter, Clear, ClearRegion, Document, Ellipse, Erase, Fill,
+    FlattenShapes, ImagePyramid, PROJECT_EXTENSION, Journal, Profiler, LayerProperties, Line, MoveRegion, Paste, Rect, Redo,
+    RemoveLayer, RemoveShape, ReshapeShape, SelectLayer, Spray, Stroke, Text, Undo, box_area, clip_box, font_index, make_proxy,
+    preview_filter, render_text, union_box,
+)
+
+
+# Intervalle (ms) entre deux écritures du journal de session sur disque
+JOURNAL_FLUSH_DELAY = 1000
+
+# Intervalle (ms) entre deux traitements des mouvements de souris, soit une image à 60 Hz
+FRAME_INTERVAL = 16
+
+# Intervalle (ms) entre deux mises à jour du panneau d'instrumentation
+PROFILER_REFRESH = 500
+
+# Aérographe : rayon du jet (en tailles de pinceau) et gouttes par seconde par pixel du disque
+SPRAY_SCALE = 3
+SPRAY_RATE = 2.5
+
+# Budget (ms) du lancement jusqu'à la première image affichée, vérifié par --startup-bench
+STARTUP_BUDGET = 1000
+
+# Facteurs de zoom proposés (zoom avant / arrière)
+ZOOM_LEVELS = [1 / 16, 1 / 8, 1 / 4, 1 / 3, 1 / 2, 2 / 3, 1, 1.5, 2, 3, 4, 6, 8, 12, 16]
+
+# Classes Tk des champs de saisie : les raccourcis à une touche n'y sont pas interceptés
+TEXT_INPUT_CLASSES = {"Entry", "TEntry", "TCombobox", "Spinbox", "TSpinbox", "Text"}
+
+
+# Position d'un événement souris dans les coordonnées de l'image
+ImagePoint = namedtuple("ImagePoint", "x y")
+
+
+def photo_image(image):
+    """PhotoImage Tk d'une image PIL (ImageTk n'est importé qu'au premier affichage)"""
+    from PIL import ImageTk
+
+    return ImageTk.PhotoImage(image)
+
+
+class CanvasRenderer:
+    """Affichage de l'image PIL dans le canvas via une PhotoImage persistante.
+
+    Seules les zones déclarées modifiées (invalidate) sont recopiées
+    dans la PhotoImage lors de flush.
+    """
+
+    # Au-delà de cette fraction de l'image, une copie complète est plus simple
+    FULL_REFRESH_RATIO = 0.5
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.photo = None
+        self.item = None
+        self.dirty = None
+        self.full = True
+
+    def invalidate(self, box=None):
+        """Marquer une zone à redessiner (None : toute l'image)"""
+        if box is None:
+            self.full = True
+        else:
+            self.dirty = union_box(self.dirty, box)
+
+    def flush(self, image):
+        """Recopier les zones modifiées de l'image dans la PhotoImage"""
+        # Les tracés Tk temporaires sont déjà dans l'image PIL (la sélection flottante, non)
+        self.canvas.delete("!pixels&&!selection")
+
+        if self.photo is None or (self.photo.width(), self.photo.height()) != image.size:
+            self.photo = photo_image(image)
+            if self.item is None:
+                self.item = self.canvas.create_image(0, 0, anchor="nw", image=self.photo, tags="pixels")
+            else:
+                self.canvas.itemconfig(self.item, image=self.photo)
+        elif self.full or box_area(self.dirty) > self.FULL_REFRESH_RATIO * image.width * image.height:
+            self.photo.paste(image)
+        else:
+            box = clip_box(self.dirty, image.size)
+            if box:
+                patch = photo_image(image.crop(box))
+                self.photo.tk.call(str(self.photo), "copy", str(patch), "-to", box[0], box[1])
+
+        self.dirty = None
+        self.full = False
+
+    def scrolled(self, image):
+        """La PhotoImage couvre toute l'image : rien à faire au défilement"""
+
+    def clear(self):
+        """Oublier la PhotoImage (changement de document)"""
+        if self.item is not None:
+            self.canvas.delete(self.item)
+        self.photo = None
+        self.item = None
+        self.dirty = None
+        self.full = True
+
+
+class TiledCanvasRenderer:
+    """Affichage par tuiles d'écran : seules les tuiles visibles (plus une
+    marge) ont une PhotoImage, créée à leur apparition dans la vue.
+
+    Les tuiles sont découpées dans l'espace du canvas, c'est-à-dire après
+    zoom. Hors du zoom 1, leur contenu vient de la pyramide d'images
+    réduites, qui choisit le niveau le plus proche.
+    """
+
+    # Tuiles conservées autour de la zone visible
+    MARGIN = 1
+
+    def __init__(self, canvas, tile_size=256, zoom=1.0, pyramid=None):
+        self.canvas = canvas
+        self.tile_size = tile_size
+        self.zoom = zoom
+        self.pyramid = pyramid
+        self.tiles = {}
+        self.dirty = set()
+
+    def invalidate(self, box=None):
+        """Marquer les tuiles affichées qui recouvrent une zone de l'image (None : toutes)"""
+        if box is None:
+            self.dirty.update(self.tiles)
+            return
+        size = self.tile_size
+        x0, y0 = int(box[0] * self.zoom), int(box[1] * self.zoom)
+        x1, y1 = math.ceil(box[2] * self.zoom), math.ceil(box[3] * self.zoom)
+        for ty in range(y0 // size, (y1 - 1) // size + 1):
+            for tx in range(x0 // size, (x1 - 1) // size + 1):
+                if (tx, ty) in self.tiles:
+                    self.dirty.add((tx, ty))
+
+    def extent(self, image):
+        """Taille de l'image affichée, en pixels du canvas"""
+        return math.ceil(image.width * self.zoom), math.ceil(image.height * self.zoom)
+
+    def visible_tiles(self, image):
+        """Tuiles d'écran recouvrant la vue du canvas (avec la marge)"""
+        size = self.tile_size
+        left = self.canvas.canvasx(0)
+        top = self.canvas.canvasy(0)
+        right = left + self.canvas.winfo_width()
+        bottom = top + self.canvas.winfo_height()
+        width, height = self.extent(image)
+        cols = -(-width // size)
+        rows = -(-height // size)
+        tx0 = max(0, int(left) // size - self.MARGIN)
+        ty0 = max(0, int(top) // size - self.MARGIN)
+        tx1 = min(cols, int(right) // size + 1 + self.MARGIN)
+        ty1 = min(rows, int(bottom) // size + 1 + self.MARGIN)
+        return {(tx, ty) for ty in range(ty0, ty1) for tx in range(tx0, tx1)}
+
+    def render_tile(self, image, tx, ty):
+        """Image PIL d'une tuile d'écran"""
+        size = self.tile_size
+        width, height = self.extent(image)
+        x0, y0 = tx * size, ty * size
+        x1, y1 = min(width, x0 + size), min(height, y0 + size)
+        if self.zoom == 1:
+            return image.crop((x0, y0, x1, y1))
+        zoom = self.zoom
+        return self.pyramid.render((x0 / zoom, y0 / zoom, x1 / zoom, y1 / zoom), (x1 - x0, y1 - y0))
+
+    def flush(self, image):
+        """Aplatir les tracés Tk temporaires et mettre à jour les tuiles"""
+        self.canvas.delete("!pixels&&!selection")
+        self.scrolled(image)
+
+    def scrolled(self, image):
+        """Créer les tuiles devenues visibles, oublier les autres, rafraîchir les modifiées"""
+        visible = self.visible_tiles(image)
+        for key in list(self.tiles):
+            if key not in visible:
+                item, _ = self.tiles.pop(key)
+                self.canvas.delete(item)
+
+        size = self.tile_size
+        created = False
+        for tx, ty in visible:
+            if (tx, ty) not in self.tiles:
+                photo = photo_image(self.render_tile(image, tx, ty))
+                item = self.canvas.create_image(tx * size, ty * size, anchor="nw", image=photo, tags="pixels")
+                self.tiles[(tx, ty)] = (item, photo)
+                created = True
+            elif (tx, ty) in self.dirty:
+                self.tiles[(tx, ty)][1].paste(self.render_tile(image, tx, ty))
+        self.dirty.clear()
+
+        # Garder les tracés en cours au-dessus des tuiles
+        if created:
+            self.canvas.tag_lower("pixels")
+
+    def clear(self):
+        """Supprimer toutes les tuiles (changement de document ou de zoom)"""
+        for item, _ in self.tiles.values():
+            self.canvas.delete(item)
+        self.tiles.clear()
+        self.dirty.clear()
+
+
+class InputScheduler:
+    """Mouvements de souris mis en attente et traités une fois par image affichée.
+
+    Chaque événement est seulement noté ; un unique rappel `after` traite
+    ensuite tous ceux de l'image en cours (voir PyPaint.process_motion).
+    Un clic ou un relâchement vide d'abord le tampon (flush()), si bien
+    que l'ordre des événements est respecté. La latence entrée → affichage
+    va de l'arrivée du plus ancien événement en attente au rappel
+    `after_idle` qui suit le redessin du canvas par Tk.
+    """
+
+    def __init__(self, root, handler, interval=FRAME_INTERVAL, latency=None):
+        self.root = root
+        self.handler = handler
+        self.interval = interval
+        self.latency = latency
+        self.events = []
+        self.arrival = None
+        self._timer = None
+
+    def push(self, kind, point):
+        """Noter un événement ; le premier de l'image programme le traitement"""
+        if not self.events:
+            self.arrival = time.perf_counter()
+        self.events.append((kind, point))
+        if self._timer is None:
+            self._timer = self.root.after(self.interval, self.flush)
+
+    def flush(self):
+        """Traiter tout de suite les événements en attente"""
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = None
+        if not self.events:
+            return
+        events, self.events = self.events, []
+        self.handler(events)
+        if self.latency is not None:
+            arrival = self.arrival
+            self.root.after_idle(lambda: self.latency.record((time.perf_counter() - arrival) * 1000))
+
+
+class LatencyMonitor:
+    """Latences entrée → affichage des dernières images, en millisecondes"""
+
+    def __init__(self, size=240):
+        self.samples = deque(maxlen=size)
+        self.frames = 0
+
+    def record(self, latency):
+        self.samples.append(latency)
+        self.frames += 1
+
+    def summary(self):
+        """Médiane, 95e centile et maximum des mesures récentes (None sans mesure)"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return {
+            "p50_ms": ordered[len(ordered) // 2],
+            "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+            "max_ms": ordered[-1],
+        }
+
+
+class FloatingSelection:
+    """Zone sélectionnée, soulevée dans un tampon affiché par un seul élément image.
+
+    Tant qu'elle flotte, le document n'est pas modifié : la déplacer ne
+    change que les coordonnées de ses éléments Tk, et ses pixels ne sont
+    recollés dans le calque qu'à la validation, en une seule opération.
+    `source` est la boîte d'origine dans le calque (None pour un collage) ;
+    une fois soulevée pour un déplacement, ce qu'elle laisse voir à sa
+    place (`hole`) est affiché dessous.
+    """
+
+    def __init__(self, canvas, pixels, x, y, source=None):
+        self.canvas = canvas
+        self.pixels = pixels
+        self.x = x
+        self.y = y
+        self.source = source
+        self.copy = False
+        self.hole = None
+        self.zoom = 1.0
+        self.photos = []
+
+    @property
+    def box(self):
+        return (self.x, self.y, self.x + self.pixels.width, self.y + self.pixels.height)
+
+    @property
+    def moved(self):
+        """Vrai si la sélection a quitté sa boîte d'origine"""
+        return self.source is not None and (self.x, self.y) != tuple(self.source[:2])
+
+    def contains(self, point):
+        x0, y0, x1, y1 = self.box
+        return x0 <= point.x < x1 and y0 <= point.y < y1
+
+    def show(self, zoom):
+        """(Re)créer les éléments Tk au zoom donné"""
+        self.hide()
+        self.zoom = zoom
+        if self.hole is not None:
+            photo = photo_image(self._scaled(self.hole))
+            self.canvas.create_image(self.source[0] * zoom, self.source[1] * zoom,
+                                     anchor="nw", image=photo, tags="selection")
+            self.photos.append(photo)
+        photo = photo_image(self._scaled(self.pixels.convert("RGBA")))
+        self.canvas.create_image(self.x * zoom, self.y * zoom, anchor="nw", image=photo,
+                                 tags=("selection", "floating"))
+        self.photos.append(photo)
+        self.canvas.create_rectangle(*[v * zoom for v in self.box], outline="black", dash=(4, 4),
+                                     tags=("selection", "floating"))
+
+    def move_to(self, x, y):
+        """Déplacer la sélection : seules les coordonnées des éléments Tk changent"""
+        self.canvas.move("floating", (x - self.x) * self.zoom, (y - self.y) * self.zoom)
+        self.x = x
+        self.y = y
+
+    def hide(self):
+        self.canvas.delete("selection")
+        self.photos = []
+
+    def _scaled(self, image):
+        if self.zoom == 1:
+            return image
+        size = (max(1, round(image.width * self.zoom)), max(1, round(image.height * self.zoom)))
+        return image.resize(size, Image.NEAREST)
+
+
+class FilterDialog:
+    """Réglage d'un filtre : l'aperçu est calculé sur une copie réduite du calque"""
+
+    # Délai (ms) qui regroupe les mouvements rapides des curseurs en un seul aperçu
+    PREVIEW_DELAY = 40
+
+    def __init__(self, app, name):
+        self.app = app
+        self.name = name
+        self.filter_class = FILTERS[name]
+        self.proxy, self.factor = make_proxy(app.document.image)
+        self.pending = None
+
+        self.window = tk.Toplevel(app.root)
+        self.window.title(self.filter_class.label)
+        self.window.transient(app.root)
+        self.window.grab_set()
+
+        self.preview = ttk.Label(self.window)
+        self.preview.pack(side=tk.TOP, padx=10, pady=10)
+
+        defaults = self.filter_class()
+        self.variables = {}
+        for attribute, label, low, high in self.filter_class.PARAMETERS:
+            variable = tk.DoubleVar(value=getattr(defaults, attribute))
+            self.variables[attribute] = variable
+            row = ttk.Frame(self.window)
+            row.pack(side=tk.TOP, fill=tk.X, padx=10)
+            ttk.Label(row, text=label, width=12).pack(side=tk.LEFT)
+            ttk.Scale(
+                row,
+                from_=low,
+                to=high,
+                variable=variable,
+                orient=tk.HORIZONTAL,
+                length=240,
+                command=lambda value: self.schedule_preview()
+            ).pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(side=tk.TOP, pady=10)
+        ttk.Button(buttons, text="Appliquer", command=self.confirm).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Annuler", command=self.window.destroy).pack(side=tk.LEFT, padx=5)
+
+        self.update_preview()
+
+    def params(self):
+        """Paramètres choisis (arrondis au dixième)"""
+        return {attribute: round(variable.get(), 1) for attribute, variable in self.variables.items()}
+
+    def schedule_preview(self):
+        if self.pending is None:
+            self.pending = self.window.after(self.PREVIEW_DELAY, self.update_preview)
+
+    def update_preview(self):
+        """Filtrer la copie réduite avec les réglages courants"""
+        self.pending = None
+        image = preview_filter(self.proxy, self.filter_class(**self.params()), self.factor)
+        self.photo = photo_image(image)
+        self.preview.configure(image=self.photo)
+
+    def confirm(self):
+        """Fermer la fenêtre et appliquer le filtre en pleine résolution"""
+        params = self.params()
+        self.window.destroy()
+        self.app.run_filter(ApplyFilter(self.name, params))
+
+
+class ProfilerPanel:
+    """Panneau d'instrumentation : latences glissantes des gestionnaires et compteurs.
+
+    L'ouvrir active la mesure des gestionnaires (app.profiler) ; le
+    fermer la désactive, ce qui ramène leur coût à un simple test.
+    """
+
+    COLUMNS = (("count", "Appels", 60), ("p50_ms", "p50 (ms)", 80), ("p95_ms", "p95 (ms)", 80),
+               ("max_ms", "max (ms)", 80))
+
+    def __init__(self, app):
+        self.app = app
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Instrumentation")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.table = ttk.Treeview(self.window, columns=[c for c, _, _ in self.COLUMNS], height=12)
+        self.table.heading("#0", text="Gestionnaire")
+        self.table.column("#0", width=140)
+        for column, label, width in self.COLUMNS:
+            self.table.heading(column, text=label)
+            self.table.column(column, width=width, anchor="e")
+        self.table.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+
+        self.counters = ttk.Label(self.window, text="")
+        self.counters.pack(side=tk.TOP, anchor="w", padx=10)
+
+        buttons = ttk.Frame(self.window)
+        buttons.pack(side=tk.TOP, pady=5)
+        ttk.Button(buttons, text="Enregistrer la trace...", command=app.dump_trace).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Remettre à zéro", command=app.reset_profiler).pack(side=tk.LEFT, padx=5)
+
+        # Résumé de la dernière capture cProfile
+        self.report = tk.Text(self.window, width=90, height=12, font=("Courier", 9))
+        self.report.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+        self.timer = None
+        self.update()
+
+    def update(self):
+        """Échantillonner les compteurs et réafficher les latences"""
+        self.app.sample_counters()
+        profiler = self.app.profiler
+        self.table.delete(*self.table.get_children())
+        for name, stats in sorted(profiler.summary().items()):
+            values = [stats["count"]] + [f"{stats[c]:.2f}" for c, _, _ in self.COLUMNS[1:]]
+            self.table.insert("", tk.END, text=name, values=values)
+        counters = profiler.counters
+        self.counters.config(
+            text=f"Éléments du canvas: {counters['canvas_items']}    "
+                 f"Historique: {counters['history_bytes'] / (1024 * 1024):.1f} Mo"
+        )
+        self.timer = self.app.root.after(PROFILER_REFRESH, self.update)
+
+    def show_report(self, text):
+        self.report.delete("1.0", tk.END)
+        self.report.insert("1.0", text)
+
+    def close(self):
+        if self.timer is not None:
+            self.app.root.after_cancel(self.timer)
+        self.window.destroy()
+        self.app.close_profiler()
+
+
+def instrumented(method):
+    """Mesurer un gestionnaire quand l'instrumentation est active (sinon, un seul test)"""
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = self.profiler
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        with profiler.timing(name):
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class PyPaint:
-    def __init__(self, root):
+    def __init__(self, root, session=True):
         self.root = root
         self.root.title("PyPaint - Application de Dessin")
         self.root.geometry("1000x700")
@@ -19,6 +512,20 @@ class PyPaint:
         # Variables
         self.current_color = "#000000"
         self.brush_size = 3
+        self.brush_hardness = 1.0
+        self.fill_tolerance = 0
+        self.zoom = 1.0
+        self.text_family = DEFAULT_FAMILY
+        self.pending_text = None
+        self.text_item = None
+        self.text_photo = None
+        self.filter_executor = None
+        self.save_job = None
+        self.open_job = None
+        self.journal = None
+        # Instrumentation des gestionnaires (None : désactivée) et son panneau
+        self.profiler = None
+        self.profiler_panel = None
         self.current_tool = "pencil"
         self.start_x = None
         self.start_y = None
@@ -27,29 +534,59 @@ class PyPaint:
         # Pour les formes temporaires
         self.temp_shape = None
 
-        # Historique pour Undo/Redo
-        self.history = []
-        self.history_index = -1
-        self.max_history = 50
+        # Sélection flottante, prise de la souris sur celle-ci, et presse-papiers (pixels seuls)
+        self.selection = None
+        self.selection_grab = None
+        self.clipboard = None
+
+        # Forme vectorielle sélectionnée (identifiant) et prise en cours : ("move", point) ou ("resize", extrémité)
+        self.selected_shape = None
+        self.shape_grab = None
+
+        # Mouvements de souris regroupés par image affichée, et leur latence
+        self.latency = LatencyMonitor()
+        self.motion = InputScheduler(self.root, self.process_motion, latency=self.latency)
 
-        # Image PIL pour sauvegarde
+        # Trait en cours : un seul élément Tk prolongé à chaque mouvement
+        self.stroke_item = None
+        self.stroke_points = []
+        self.stroke_style = None
+
+        # Jet d'aérographe en cours : dernière position, heure du dernier lot, minuterie
+        self.spray_at = None
+        self.spray_time = None
+        self.spray_timer = None
+
+        # Document (image PIL + historique par tuiles, budget mémoire en octets)
         self.canvas_width = 800
         self.canvas_height = 550
-        self.image = Image.new("RGB", (self.canvas_width, self.canvas_height), "white")
-        self.draw = ImageDraw.Draw(self.image)
+        self.history_budget = 64 * 1024 * 1024
+        self.document = Document(self.canvas_width, self.canvas_height, history_budget=self.history_budget)
+        self.pyramid = None
 
         # Setup UI
         self.setup_menu()
         self.setup_toolbar()
+        self.setup_layers_panel()
         self.setup_canvas()
         self.setup_color_palette()
         self.setup_statusbar()
 
-        # Sauvegarder l'état initial
-        self.save_state()
+        # Sélectionner crayon par défaut (une fois le canvas et la barre de statut créés)
+        self.select_tool("pencil")
 
         # Raccourcis clavier
         self.setup_shortcuts()
+        self.root.protocol("WM_DELETE_WINDOW", self.quit_app)
+
+        # Journal de session (reprise après un arrêt brutal), une fois la fenêtre affichée
+        if session:
+            self.root.after_idle(self.start_session)
+
+    @property
+    def image(self):
+        """Image affichée : le document aplati (calques visibles)"""
+        return self.document.composite
 
     def setup_menu(self):
         """Créer la barre de menu"""
@@ -60,8 +597,23 @@ class PyPaint:
         file_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Fichier", menu=file_menu)
         file_menu.add_command(label="Nouveau", command=self.new_canvas, accelerator="Ctrl+N")
+        file_menu.add_command(label="Nouveau format...", command=self.new_document)
         file_menu.add_command(label="Ouvrir...", command=self.open_image, accelerator="Ctrl+O")
-        file_menu.add_command(label="Sauvegarder...", command=self.save_image, accelerator="Ctrl+S")
+        file_menu.add_command(label="Sauvegarder", command=self.save_document, accelerator="Ctrl+S")
+        file_menu.add_command(label="Sauvegarder sous...", command=self.save_image, accelerator="Ctrl+Maj+S")
+
+        # Options d'enregistrement : compression PNG (0 à 9) et qualité JPEG
+        self.png_compression = tk.IntVar(value=6)
+        self.jpeg_quality = tk.IntVar(value=90)
+        options_menu = tk.Menu(file_menu, tearoff=0)
+        file_menu.add_cascade(label="Options d'enregistrement", menu=options_menu)
+        for level, label in [(1, "rapide"), (6, "normale"), (9, "maximale")]:
+            options_menu.add_radiobutton(
+                label=f"Compression PNG {label}", variable=self.png_compression, value=level
+            )
+        options_menu.add_separator()
+        for quality in [75, 90, 95]:
+            options_menu.add_radiobutton(label=f"Qualité JPEG {quality}", variable=self.jpeg_quality, value=quality)
         file_menu.add_separator()
         file_menu.add_command(label="Quitter", command=self.quit_app, accelerator="Ctrl+Q")
 
@@ -71,11 +623,46 @@ class PyPaint:
         edit_menu.add_command(label="Annuler", command=self.undo, accelerator="Ctrl+Z")
         edit_menu.add_command(label="Rétablir", command=self.redo, accelerator="Ctrl+Y")
         edit_menu.add_separator()
+        edit_menu.add_command(label="Couper", command=self.cut_selection, accelerator="Ctrl+X")
+        edit_menu.add_command(label="Copier", command=self.copy_selection, accelerator="Ctrl+C")
+        edit_menu.add_command(label="Coller", command=self.paste_clipboard, accelerator="Ctrl+V")
+        edit_menu.add_command(label="Effacer la sélection", command=self.delete_selected, accelerator="Suppr")
+        edit_menu.add_separator()
+        self.vector_shapes = tk.BooleanVar(value=False)
+        edit_menu.add_checkbutton(label="Formes modifiables (vectorielles)", variable=self.vector_shapes)
+        edit_menu.add_command(label="Aplatir les formes", command=self.flatten_shapes)
+        edit_menu.add_separator()
         edit_menu.add_command(label="Effacer tout", command=self.clear_canvas)
 
+        # Menu Filtres
+        filter_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Filtres", menu=filter_menu)
+        for name, filter_class in FILTERS.items():
+            filter_menu.add_command(
+                label=f"{filter_class.label}...",
+                command=lambda name=name: FilterDialog(self, name)
+            )
+
+        # Menu Affichage
+        view_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Affichage", menu=view_menu)
+        view_menu.add_command(label="Zoom avant", command=self.zoom_in, accelerator="Ctrl++")
+        view_menu.add_command(label="Zoom arrière", command=self.zoom_out, accelerator="Ctrl+-")
+        view_menu.add_command(label="Taille réelle", command=lambda: self.set_zoom(1), accelerator="Ctrl+0")
+        view_menu.add_separator()
+        self.show_latency = tk.BooleanVar(value=False)
+        view_menu.add_checkbutton(
+            label="Latence de saisie", variable=self.show_latency, command=self.toggle_latency
+        )
+
         # Menu Aide
         help_menu = tk.Menu(menubar, tearoff=0)
         menubar.add_cascade(label="Aide", menu=help_menu)
+        help_menu.add_command(label="Instrumentation...", command=self.open_profiler)
+        help_menu.add_command(label="Enregistrer la trace...", command=self.dump_trace)
+        self.cprofile_var = tk.BooleanVar(value=False)
+        help_menu.add_checkbutton(label="Capture cProfile", variable=self.cprofile_var, command=self.toggle_cprofile)
+        help_menu.add_separator()
         help_menu.add_command(label="À propos", command=self.show_about)
 
     def setup_toolbar(self):
@@ -101,6 +688,9 @@ class PyPaint:
             ("ellipse", "⭕ Ellipse", "O"),
             ("fill", "🪣 Remplir", "F"),
             ("text", "📝 Texte", "T"),
+            ("spray", "💨 Aérographe", "A"),
+            ("select", "⬚ Sélection", "S"),
+            ("shapes", "🔷 Formes", "V"),
         ]
 
         for tool_id, tool_name, shortcut in tools:
@@ -113,9 +703,6 @@ class PyPaint:
             btn.pack(side=tk.LEFT, padx=2)
             self.tool_buttons[tool_id] = btn
 
-        # Sélectionner crayon par défaut
-        self.select_tool("pencil")
-
         # Frame pour la taille du pinceau
         size_frame = ttk.LabelFrame(toolbar, text="Taille")
         size_frame.pack(side=tk.LEFT, padx=10)
@@ -134,6 +721,46 @@ class PyPaint:
         self.size_label = ttk.Label(size_frame, text="3 px")
         self.size_label.pack(side=tk.LEFT, padx=5)
 
+        # Frame pour la tolérance du remplissage
+        tolerance_frame = ttk.LabelFrame(toolbar, text="Tolérance")
+        tolerance_frame.pack(side=tk.LEFT, padx=10)
+
+        self.tolerance_var = tk.IntVar(value=0)
+        ttk.Spinbox(
+            tolerance_frame,
+            from_=0,
+            to=255,
+            textvariable=self.tolerance_var,
+            command=self.change_tolerance,
+            width=4
+        ).pack(side=tk.LEFT, padx=5, pady=2)
+
+        # Frame pour la dureté du pinceau (bord net à 100 %, estompé en dessous)
+        hardness_frame = ttk.LabelFrame(toolbar, text="Dureté")
+        hardness_frame.pack(side=tk.LEFT, padx=10)
+
+        self.hardness_var = tk.IntVar(value=100)
+        ttk.Spinbox(
+            hardness_frame,
+            from_=0,
+            to=100,
+            increment=10,
+            textvariable=self.hardness_var,
+            command=self.change_hardness,
+            width=4
+        ).pack(side=tk.LEFT, padx=5, pady=2)
+
+        # Frame pour la police du texte (liste remplie à la première ouverture)
+        font_frame = ttk.LabelFrame(toolbar, text="Police")
+        font_frame.pack(side=tk.LEFT, padx=10)
+
+        self.family_var = tk.StringVar(value=self.text_family)
+        family_box = ttk.Combobox(font_frame, textvariable=self.family_var, width=16)
+        family_box.configure(postcommand=lambda: family_box.configure(values=font_index().families))
+        family_box.bind("<<ComboboxSelected>>", lambda e: self.change_family())
+        family_box.bind("<Return>", lambda e: self.change_family())
+        family_box.pack(side=tk.LEFT, padx=5, pady=2)
+
         # Bouton couleur personnalisée
         color_frame = ttk.LabelFrame(toolbar, text="Couleur")
         color_frame.pack(side=tk.LEFT, padx=10)
@@ -147,6 +774,88 @@ class PyPaint:
             command=self.choose_color
         ).pack(side=tk.LEFT, padx=5)
 
+    def setup_layers_panel(self):
+        """Créer le panneau des calques (à droite du canvas)"""
+        panel = ttk.LabelFrame(self.root, text="Calques")
+        panel.pack(side=tk.RIGHT, fill=tk.Y, padx=5, pady=5)
+
+        # Calques du haut vers le bas, comme dans la plupart des logiciels
+        self.layers_list = tk.Listbox(panel, width=18, height=10, exportselection=False)
+        self.layers_list.pack(side=tk.TOP, fill=tk.Y, expand=True, padx=5, pady=5)
+        self.layers_list.bind("<<ListboxSelect>>", lambda e: self.on_layer_selected())
+
+        buttons = ttk.Frame(panel)
+        buttons.pack(side=tk.TOP, fill=tk.X, padx=5)
+        ttk.Button(buttons, text="+", width=3, command=self.add_layer).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="-", width=3, command=self.remove_layer).pack(side=tk.LEFT)
+
+        self.layer_visible_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(
+            panel, text="Visible", variable=self.layer_visible_var, command=self.change_layer_properties
+        ).pack(side=tk.TOP, anchor="w", padx=5, pady=2)
+
+        ttk.Label(panel, text="Opacité").pack(side=tk.TOP, anchor="w", padx=5)
+        self.layer_opacity_var = tk.IntVar(value=100)
+        ttk.Scale(
+            panel,
+            from_=0,
+            to=100,
+            variable=self.layer_opacity_var,
+            orient=tk.HORIZONTAL,
+            command=lambda value: self.change_layer_properties()
+        ).pack(side=tk.TOP, fill=tk.X, padx=5, pady=(0, 5))
+
+        self.update_layers_panel()
+
+    def update_layers_panel(self):
+        """Recopier la pile de calques du document dans le panneau"""
+        layers = self.document.layers
+        self.layers_list.delete(0, tk.END)
+        for layer in reversed(layers):
+            mark = "" if layer.visible else " (masqué)"
+            self.layers_list.insert(tk.END, f"{layer.name} {round(layer.opacity * 100)}%{mark}")
+        self.layers_list.selection_set(len(layers) - 1 - self.document.active)
+        self.layer_visible_var.set(self.document.layer.visible)
+        self.layer_opacity_var.set(round(self.document.layer.opacity * 100))
+
+    def apply_layer_operation(self, operation):
+        """Appliquer une opération sur les calques puis rafraîchir l'affichage"""
+        from tkinter import messagebox
+        self.commit_selection()
+        try:
+            self.document.apply(operation)
+        except ValueError as e:
+            messagebox.showerror("Calques", str(e))
+            return
+        # L'image aplatie peut avoir changé d'objet : rebrancher l'affichage
+        self.reset_view()
+        self.update_layers_panel()
+
+    def add_layer(self):
+        """Ajouter un calque au-dessus du calque actif"""
+        self.apply_layer_operation(AddLayer())
+
+    def remove_layer(self):
+        """Supprimer le calque actif"""
+        self.apply_layer_operation(RemoveLayer(self.document.active))
+
+    def on_layer_selected(self):
+        """Activer le calque choisi dans la liste"""
+        selection = self.layers_list.curselection()
+        if not selection:
+            return
+        index = len(self.document.layers) - 1 - selection[0]
+        if index != self.document.active:
+            self.apply_layer_operation(SelectLayer(index))
+
+    def change_layer_properties(self):
+        """Appliquer l'opacité et la visibilité du panneau au calque actif"""
+        layer = self.document.layer
+        opacity = self.layer_opacity_var.get() / 100
+        visible = self.layer_visible_var.get()
+        if round(layer.opacity * 100) != round(opacity * 100) or layer.visible != visible:
+            self.apply_layer_operation(LayerProperties(self.document.active, opacity, visible))
+
     def setup_canvas(self):
         """Créer le canvas de dessin"""
         canvas_frame = ttk.Frame(self.root)
@@ -160,13 +869,133 @@ class PyPaint:
             bg="white",
             cursor="crosshair"
         )
-        self.canvas.pack(fill=tk.BOTH, expand=True)
+        xscroll = ttk.Scrollbar(canvas_frame, orient=tk.HORIZONTAL, command=self.scroll_x)
+        yscroll = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.scroll_y)
+        self.canvas.config(xscrollcommand=xscroll.set, yscrollcommand=yscroll.set)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        yscroll.grid(row=0, column=1, sticky="ns")
+        xscroll.grid(row=1, column=0, sticky="ew")
+        canvas_frame.rowconfigure(0, weight=1)
+        canvas_frame.columnconfigure(0, weight=1)
+
+        self.renderer = None
+        self.attach_document()
 
         # Bindings souris
         self.canvas.bind("<Button-1>", self.on_press)
         self.canvas.bind("<B1-Motion>", self.on_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_release)
         self.canvas.bind("<Motion>", self.on_motion)
+        self.canvas.bind("<MouseWheel>", self.on_wheel)
+        self.canvas.bind("<Shift-MouseWheel>", lambda e: self.on_wheel(e, horizontal=True))
+        self.canvas.bind("<Button-4>", lambda e: self.scroll_y("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll_y("scroll", 1, "units"))
+        self.canvas.bind("<Control-MouseWheel>", self.on_zoom_wheel)
+        self.canvas.bind("<Control-Button-4>", lambda e: self.zoom_in((e.x, e.y)))
+        self.canvas.bind("<Control-Button-5>", lambda e: self.zoom_out((e.x, e.y)))
+        self.canvas.bind("<Configure>", lambda e: self.renderer.scrolled(self.image))
+
+    def attach_document(self):
+        """Brancher l'affichage sur le document courant, au zoom courant"""
+        if self.renderer is not None:
+            self.renderer.clear()
+            if self.renderer.invalidate in self.document.observers:
+                self.document.observers.remove(self.renderer.invalidate)
+
+        if self.document.tiled or self.zoom != 1:
+            tile_size = self.document.image.tile_size if self.document.tiled else 256
+            pyramid = self.get_pyramid() if self.zoom != 1 else None
+            self.renderer = TiledCanvasRenderer(self.canvas, tile_size, self.zoom, pyramid)
+        else:
+            self.renderer = CanvasRenderer(self.canvas)
+        self.document.observers.append(self.renderer.invalidate)
+
+        width = math.ceil(self.document.width * self.zoom)
+        height = math.ceil(self.document.height * self.zoom)
+        self.canvas.config(scrollregion=(0, 0, width, height))
+
+    def reset_view(self):
+        """Oublier la pyramide et rebrancher l'affichage sur l'image aplatie"""
+        if self.pyramid is not None:
+            self.document.observers.remove(self.pyramid.invalidate)
+            self.pyramid = None
+        self.attach_document()
+        self.refresh_canvas((0, 0, self.document.width, self.document.height))
+
+    def get_pyramid(self):
+        """Pyramide d'images réduites du document, créée au premier zoom"""
+        if self.pyramid is None:
+            self.pyramid = ImagePyramid(self.image)
+            self.document.observers.append(self.pyramid.invalidate)
+        return self.pyramid
+
+    def set_zoom(self, zoom, anchor=None):
+        """Changer le zoom en gardant fixe le point sous `anchor` (centre de la vue par défaut)"""
+        zoom = max(ZOOM_LEVELS[0], min(ZOOM_LEVELS[-1], zoom))
+        if zoom == self.zoom:
+            return
+        if anchor is None:
+            anchor = (self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2)
+
+        # Point de l'image sous l'ancre avant le changement
+        image_x = self.canvas.canvasx(anchor[0]) / self.zoom
+        image_y = self.canvas.canvasy(anchor[1]) / self.zoom
+
+        self.zoom = zoom
+        self.attach_document()
+
+        # Replacer la vue pour que ce point reste sous l'ancre
+        width = math.ceil(self.document.width * zoom)
+        height = math.ceil(self.document.height * zoom)
+        self.canvas.xview_moveto(max(0, image_x * zoom - anchor[0]) / width)
+        self.canvas.yview_moveto(max(0, image_y * zoom - anchor[1]) / height)
+
+        self.refresh_canvas((0, 0, self.document.width, self.document.height))
+        if self.selection is not None:
+            self.selection.show(zoom)
+        self.show_shape_handles()
+        self.status_zoom.config(text=f"Zoom: {round(zoom * 100)}%")
+
+    def zoom_in(self, anchor=None):
+        """Passer au facteur de zoom supérieur"""
+        larger = [z for z in ZOOM_LEVELS if z > self.zoom]
+        if larger:
+            self.set_zoom(larger[0], anchor)
+
+    def zoom_out(self, anchor=None):
+        """Passer au facteur de zoom inférieur"""
+        smaller = [z for z in ZOOM_LEVELS if z < self.zoom]
+        if smaller:
+            self.set_zoom(smaller[-1], anchor)
+
+    def on_zoom_wheel(self, event):
+        """Ctrl + molette : zoomer autour du pointeur"""
+        if event.delta > 0:
+            self.zoom_in((event.x, event.y))
+        else:
+            self.zoom_out((event.x, event.y))
+
+    def to_canvas(self, coords):
+        """Convertir des coordonnées de l'image en coordonnées du canvas (zoom)"""
+        return [v * self.zoom for v in coords]
+
+    def scroll_x(self, *args):
+        """Défilement horizontal (barre ou molette)"""
+        self.canvas.xview(*args)
+        self.renderer.scrolled(self.image)
+
+    def scroll_y(self, *args):
+        """Défilement vertical (barre ou molette)"""
+        self.canvas.yview(*args)
+        self.renderer.scrolled(self.image)
+
+    def on_wheel(self, event, horizontal=False):
+        """Faire défiler le canvas à la molette"""
+        step = -1 if event.delta > 0 else 1
+        if horizontal:
+            self.scroll_x("scroll", step, "units")
+        else:
+            self.scroll_y("scroll", step, "units")
 
     def setup_color_palette(self):
         """Créer la palette de couleurs"""
@@ -201,29 +1030,67 @@ class PyPaint:
         self.status_tool = ttk.Label(self.statusbar, text="Outil: Crayon")
         self.status_tool.pack(side=tk.LEFT, padx=10)
 
+        # Ouverture / enregistrement en arrière-plan
+        self.status_task = ttk.Label(self.statusbar, text="")
+        self.status_task.pack(side=tk.LEFT, padx=10)
+
         self.status_size = ttk.Label(self.statusbar, text=f"Canvas: {self.canvas_width}x{self.canvas_height}")
         self.status_size.pack(side=tk.RIGHT, padx=10)
 
+        self.status_zoom = ttk.Label(self.statusbar, text="Zoom: 100%")
+        self.status_zoom.pack(side=tk.RIGHT, padx=10)
+
+        # Latence entrée → affichage, montrée à la demande (menu Affichage)
+        self.status_latency = ttk.Label(self.statusbar, text="Latence: -")
+        self.latency_shown = 0.0
+
     def setup_shortcuts(self):
         """Configurer les raccourcis clavier"""
         self.root.bind("<Control-n>", lambda e: self.new_canvas())
         self.root.bind("<Control-o>", lambda e: self.open_image())
-        self.root.bind("<Control-s>", lambda e: self.save_image())
+        self.root.bind("<Control-s>", lambda e: self.save_document())
+        self.root.bind("<Control-S>", lambda e: self.save_image())
         self.root.bind("<Control-z>", lambda e: self.undo())
         self.root.bind("<Control-y>", lambda e: self.redo())
         self.root.bind("<Control-q>", lambda e: self.quit_app())
-
-        # Raccourcis outils
-        self.root.bind("p", lambda e: self.select_tool("pencil"))
-        self.root.bind("e", lambda e: self.select_tool("eraser"))
-        self.root.bind("l", lambda e: self.select_tool("line"))
-        self.root.bind("r", lambda e: self.select_tool("rectangle"))
-        self.root.bind("o", lambda e: self.select_tool("ellipse"))
-        self.root.bind("f", lambda e: self.select_tool("fill"))
-        self.root.bind("t", lambda e: self.select_tool("text"))
+        self.root.bind("<Control-plus>", lambda e: self.zoom_in())
+        self.root.bind("<Control-equal>", lambda e: self.zoom_in())
+        self.root.bind("<Control-minus>", lambda e: self.zoom_out())
+        self.root.bind("<Control-0>", lambda e: self.set_zoom(1))
+        self.root.bind("<Escape>", lambda e: self.cancel_text())
+        self.root.bind("<Escape>", lambda e: self.cancel_selection(), add="+")
+        self.root.bind("<Return>", self.shortcut(self.commit_selection))
+        self.root.bind("<Delete>", self.shortcut(self.delete_selected))
+        self.root.bind("<Control-c>", self.shortcut(self.copy_selection))
+        self.root.bind("<Control-x>", self.shortcut(self.cut_selection))
+        self.root.bind("<Control-v>", self.shortcut(self.paste_clipboard))
+
+        # Raccourcis outils (ignorés pendant la saisie, comme Entrée, Suppr et le presse-papiers)
+        self.root.bind("p", self.shortcut(self.select_tool, "pencil"))
+        self.root.bind("e", self.shortcut(self.select_tool, "eraser"))
+        self.root.bind("l", self.shortcut(self.select_tool, "line"))
+        self.root.bind("r", self.shortcut(self.select_tool, "rectangle"))
+        self.root.bind("o", self.shortcut(self.select_tool, "ellipse"))
+        self.root.bind("f", self.shortcut(self.select_tool, "fill"))
+        self.root.bind("t", self.shortcut(self.select_tool, "text"))
+        self.root.bind("a", self.shortcut(self.select_tool, "spray"))
+        self.root.bind("s", self.shortcut(self.select_tool, "select"))
+        self.root.bind("v", self.shortcut(self.select_tool, "shapes"))
+
+    def shortcut(self, action, *args):
+        """Gestionnaire de raccourci qui laisse passer les touches tapées dans un champ de saisie"""
+        def handler(event):
+            widget = event.widget
+            if hasattr(widget, "winfo_class") and widget.winfo_class() in TEXT_INPUT_CLASSES:
+                return
+            action(*args)
+        return handler
 
     def select_tool(self, tool):
         """Sélectionner un outil"""
+        self.cancel_text()
+        self.commit_selection()
+        self.select_shape(None)
         self.current_tool = tool
 
         # Mettre à jour l'apparence des boutons
@@ -241,7 +1108,10 @@ class PyPaint:
             "rectangle": "crosshair",
             "ellipse": "crosshair",
             "fill": "spraycan",
-            "text": "xterm"
+            "text": "xterm",
+            "spray": "spraycan",
+            "select": "fleur",
+            "shapes": "arrow"
         }
         self.canvas.config(cursor=cursors.get(tool, "crosshair"))
 
@@ -253,7 +1123,10 @@ class PyPaint:
             "rectangle": "Rectangle",
             "ellipse": "Ellipse",
             "fill": "Remplissage",
-            "text": "Texte"
+            "text": "Texte",
+            "spray": "Aérographe",
+            "select": "Sélection",
+            "shapes": "Formes"
         }
         self.status_tool.config(text=f"Outil: {tool_names.get(tool, tool)}")
 
@@ -264,6 +1137,7 @@ class PyPaint:
 
     def choose_color(self):
         """Ouvrir le sélecteur de couleur"""
+        from tkinter import colorchooser
         color = colorchooser.askcolor(color=self.current_color, title="Choisir une couleur")
         if color[1]:
             self.set_color(color[1])
@@ -273,12 +1147,89 @@ class PyPaint:
         self.brush_size = int(float(value))
         self.size_label.config(text=f"{self.brush_size} px")
 
+    def change_tolerance(self):
+        """Changer la tolérance du remplissage"""
+        try:
+            self.fill_tolerance = max(0, min(255, int(self.tolerance_var.get())))
+        except (tk.TclError, ValueError):
+            self.fill_tolerance = 0
+
+    def change_hardness(self):
+        """Changer la dureté du pinceau (en %)"""
+        try:
+            self.brush_hardness = max(0, min(100, int(self.hardness_var.get()))) / 100
+        except (tk.TclError, ValueError):
+            self.brush_hardness = 1.0
+
+    def change_family(self):
+        """Changer la police du texte"""
+        self.text_family = self.family_var.get().strip() or DEFAULT_FAMILY
+        if self.pending_text is not None:
+            self.show_text_preview(self.start_x, self.start_y)
+
+    def image_point(self, event):
+        """Convertir la position d'un événement en coordonnées de l'image (défilement compris)"""
+        return ImagePoint(
+            int(self.canvas.canvasx(event.x) / self.zoom),
+            int(self.canvas.canvasy(event.y) / self.zoom)
+        )
+
     def on_motion(self, event):
-        """Gérer le mouvement de la souris"""
-        self.status_coords.config(text=f"Position: {event.x}, {event.y}")
+        """Gérer le mouvement de la souris (traité à la prochaine image)"""
+        self.motion.push("move", self.image_point(event))
+
+    @instrumented
+    def process_motion(self, events):
+        """Traiter d'un coup les mouvements reçus depuis la dernière image"""
+        last = events[-1][1]
+        self.status_coords.config(text=f"Position: {last.x}, {last.y}")
+        drags = [point for kind, point in events if kind == "drag"]
+        if drags and self.drawing:
+            if self.current_tool == "pencil":
+                self.draw_pencil(drags)
+            elif self.current_tool == "eraser":
+                self.draw_eraser(drags)
+            elif self.current_tool == "spray":
+                self.spray(drags)
+            elif self.current_tool == "shapes":
+                self.drag_shape(drags[-1])
+            elif self.current_tool in ["line", "rectangle", "ellipse"]:
+                # Seule la dernière position compte pour l'aperçu
+                self.draw_shape_preview(drags[-1])
+            elif self.current_tool == "select":
+                self.drag_selection(drags[-1])
+        elif self.pending_text is not None:
+            self.show_text_preview(last.x, last.y)
+        if self.show_latency.get():
+            self.update_latency_status()
+
+    def update_latency_status(self):
+        """Afficher la latence entrée → affichage (au plus deux fois par seconde)"""
+        now = time.perf_counter()
+        if now - self.latency_shown < 0.5:
+            return
+        self.latency_shown = now
+        summary = self.latency.summary()
+        if summary is not None:
+            self.status_latency.config(
+                text=f"Latence: {summary['p50_ms']:.0f} ms (p95 {summary['p95_ms']:.0f}, max {summary['max_ms']:.0f})"
+            )
 
+    def toggle_latency(self):
+        """Afficher ou masquer la latence dans la barre de statut"""
+        if self.show_latency.get():
+            self.latency_shown = 0.0
+            self.status_latency.pack(side=tk.LEFT, padx=10)
+        else:
+            self.status_latency.pack_forget()
+
+    @instrumented
     def on_press(self, event):
         """Gérer le clic de souris"""
+        self.motion.flush()
+        # Ctrl enfoncé : copier la sélection au lieu de la déplacer
+        copy = bool(event.state & 0x4)
+        event = self.image_point(event)
         self.start_x = event.x
         self.start_y = event.y
         self.drawing = True
@@ -287,280 +1238,770 @@ class PyPaint:
             self.flood_fill(event.x, event.y)
         elif self.current_tool == "text":
             self.add_text(event.x, event.y)
-
+        elif self.current_tool == "select":
+            self.grab_selection(event, copy)
+        elif self.current_tool == "spray":
+            self.start_spray(event)
+        elif self.current_tool == "shapes":
+            self.grab_shape(event)
+
+    @instrumented
     def on_drag(self, event):
-        """Gérer le glissement de souris"""
-        if not self.drawing:
-            return
-
-        if self.current_tool == "pencil":
-            self.draw_pencil(event)
-        elif self.current_tool == "eraser":
-            self.draw_eraser(event)
-        elif self.current_tool in ["line", "rectangle", "ellipse"]:
-            self.draw_shape_preview(event)
+        """Gérer le glissement de souris (traité à la prochaine image)"""
+        if self.drawing:
+            self.motion.push("drag", self.image_point(event))
 
+    @instrumented
     def on_release(self, event):
         """Gérer le relâchement de souris"""
+        self.motion.flush()
         if not self.drawing:
             return
+        event = self.image_point(event)
 
         if self.current_tool in ["line", "rectangle", "ellipse"]:
             self.finalize_shape(event)
+        elif self.current_tool in ["pencil", "eraser"]:
+            self.finish_stroke()
+        elif self.current_tool == "select":
+            self.finish_selection(event)
+        elif self.current_tool == "spray":
+            self.finish_spray()
+        elif self.current_tool == "shapes":
+            self.release_shape()
 
         self.drawing = False
         self.start_x = None
         self.start_y = None
 
-        # Sauvegarder l'état pour undo
-        if self.current_tool not in ["fill", "text"]:
+        # Aplatir les tracés Tk dans la PhotoImage et sauvegarder l'état pour undo
+        if self.current_tool not in ["fill", "text", "select", "shapes"]:
+            self.refresh_canvas()
             self.save_state()
 
-    def draw_pencil(self, event):
+    def draw_pencil(self, points):
         """Dessiner avec le crayon"""
-        if self.start_x and self.start_y:
-            # Dessiner sur le canvas
-            self.canvas.create_line(
-                self.start_x, self.start_y, event.x, event.y,
-                fill=self.current_color,
-                width=self.brush_size,
-                capstyle=tk.ROUND,
-                smooth=True
-            )
-            # Dessiner sur l'image PIL
-            self.draw.line(
-                [self.start_x, self.start_y, event.x, event.y],
-                fill=self.current_color,
-                width=self.brush_size
-            )
+        self.extend_stroke(points, self.current_color, self.brush_size)
 
-        self.start_x = event.x
-        self.start_y = event.y
-
-    def draw_eraser(self, event):
+    def draw_eraser(self, points):
         """Effacer (dessiner en blanc)"""
+        self.extend_stroke(points, self.document.background, self.brush_size * 2)
+
+    def extend_stroke(self, points, color, width):
+        """Prolonger le trait en cours de plusieurs points (une seule polyligne Tk par trait)"""
+        coords = [v for point in points for v in point]
         if self.start_x and self.start_y:
-            self.canvas.create_line(
-                self.start_x, self.start_y, event.x, event.y,
-                fill="white",
-                width=self.brush_size * 2,
-                capstyle=tk.ROUND,
-                smooth=True
-            )
-            self.draw.line(
-                [self.start_x, self.start_y, event.x, event.y],
-                fill="white",
-                width=self.brush_size * 2
-            )
+            if self.stroke_item is None:
+                self.stroke_points = [self.start_x, self.start_y] + coords
+                self.stroke_style = (color, width)
+                self.stroke_item = self.canvas.create_line(
+                    *self.to_canvas(self.stroke_points),
+                    fill=color,
+                    width=width * self.zoom,
+                    capstyle=tk.ROUND,
+                    joinstyle=tk.ROUND
+                )
+            else:
+                self.stroke_points += coords
+                self.canvas.coords(self.stroke_item, *self.to_canvas(self.stroke_points))
 
-        self.start_x = event.x
-        self.start_y = event.y
+        self.start_x, self.start_y = points[-1]
+
+    def finish_stroke(self):
+        """Rastériser le trait en cours dans l'image PIL"""
+        if self.stroke_item is None:
+            return
+
+        color, width = self.stroke_style
+        self.change_hardness()
+        if self.current_tool == "eraser":
+            operation = Erase(self.stroke_points, width, self.brush_hardness)
+        else:
+            operation = Stroke(self.stroke_points, color, width, self.brush_hardness)
+        self.document.apply(operation, commit=False)
+
+        # L'élément Tk sera supprimé au prochain rafraîchissement du canvas
+        self.stroke_item = None
+        self.stroke_points = []
+        self.stroke_style = None
+
+    def start_spray(self, point):
+        """Commencer un jet : il continue tant que le bouton reste enfoncé, même immobile"""
+        self.spray_at = point
+        self.spray_time = time.perf_counter()
+        self.spray_timer = self.root.after(FRAME_INTERVAL, self.spray_tick)
+
+    def spray_tick(self):
+        """Pulvériser à la position courante à chaque image, souris immobile comprise"""
+        self.spray_timer = None
+        if not self.drawing or self.spray_at is None:
+            return
+        self.spray([])
+        self.spray_timer = self.root.after(FRAME_INTERVAL, self.spray_tick)
+
+    def spray(self, points):
+        """Pulvériser un lot de gouttes le long des positions reçues depuis le dernier lot.
+
+        Le nombre de gouttes dépend du temps écoulé et de la surface du
+        jet ; elles sont écrites d'un coup dans l'image PIL, puis seule la
+        zone touchée est recopiée à l'écran.
+        """
+        now = time.perf_counter()
+        radius = self.brush_size * SPRAY_SCALE
+        count = int(SPRAY_RATE * math.pi * radius * radius * (now - self.spray_time))
+        centers = [self.spray_at] + list(points)
+        if count > 0:
+            self.spray_time = now
+            operation = Spray([v for point in centers for v in point], self.current_color, radius, count,
+                              random.getrandbits(31))
+            self.document.apply(operation, commit=False)
+            self.refresh_canvas()
+            self.spray_at = centers[-1]
+
+    def finish_spray(self):
+        """Fin du jet : arrêter la minuterie (le jet entier forme une seule action)"""
+        if self.spray_timer is not None:
+            self.root.after_cancel(self.spray_timer)
+        self.spray_timer = None
+        self.spray_at = None
 
     def draw_shape_preview(self, event):
         """Dessiner un aperçu de la forme"""
-        if self.temp_shape:
-            self.canvas.delete(self.temp_shape)
+        coords = self.to_canvas([self.start_x, self.start_y, event.x, event.y])
+        if self.temp_shape and self.canvas.type(self.temp_shape):
+            # Déplacer l'élément existant plutôt que d'en recréer un
+            self.canvas.coords(self.temp_shape, *coords)
+            return
+
+        width = self.brush_size * self.zoom
 
         if self.current_tool == "line":
             self.temp_shape = self.canvas.create_line(
-                self.start_x, self.start_y, event.x, event.y,
+                *coords,
                 fill=self.current_color,
-                width=self.brush_size
+                width=width
             )
         elif self.current_tool == "rectangle":
             self.temp_shape = self.canvas.create_rectangle(
-                self.start_x, self.start_y, event.x, event.y,
+                *coords,
                 outline=self.current_color,
-                width=self.brush_size
+                width=width
             )
         elif self.current_tool == "ellipse":
             self.temp_shape = self.canvas.create_oval(
-                self.start_x, self.start_y, event.x, event.y,
+                *coords,
                 outline=self.current_color,
-                width=self.brush_size
+                width=width
             )
 
     def finalize_shape(self, event):
-        """Finaliser la forme et la dessiner sur l'image PIL"""
-        if self.current_tool == "line":
-            self.draw.line(
-                [self.start_x, self.start_y, event.x, event.y],
-                fill=self.current_color,
-                width=self.brush_size
-            )
-        elif self.current_tool == "rectangle":
-            self.draw.rectangle(
-                [self.start_x, self.start_y, event.x, event.y],
-                outline=self.current_color,
-                width=self.brush_size
-            )
-        elif self.current_tool == "ellipse":
-            self.draw.ellipse(
-                [self.start_x, self.start_y, event.x, event.y],
-                outline=self.current_color,
-                width=self.brush_size
-            )
-
+        """Finaliser la forme : la dessiner sur l'image PIL, ou la garder modifiable (vectorielle)"""
+        points = [self.start_x, self.start_y, event.x, event.y]
+        if self.vector_shapes.get() and not self.document.tiled:
+            kinds = {"line": "line", "rectangle": "rect", "ellipse": "ellipse"}
+            operation = AddShape(kinds[self.current_tool], points, self.current_color, self.brush_size)
+        else:
+            shapes = {"line": Line, "rectangle": Rect, "ellipse": Ellipse}
+            operation = shapes[self.current_tool](points, self.current_color, self.brush_size)
+        self.document.apply(operation, commit=False)
         self.temp_shape = None
 
-    def flood_fill(self, x, y):
-        """Remplissage par diffusion (flood fill simplifié)"""
-        # Convertir la couleur hex en RGB
-        color_rgb = tuple(int(self.current_color[i:i+2], 16) for i in (1, 3, 5))
+    def grab_shape(self, point):
+        """Prendre une extrémité de la forme sélectionnée, sinon sélectionner la forme cliquée"""
+        vectors = self.document.vectors
+        tolerance = max(3, round(4 / self.zoom))
+        shape = vectors.shapes.get(self.selected_shape)
+        if shape is not None:
+            x0, y0, x1, y1 = shape.points
+            for end, (x, y) in enumerate([(x0, y0), (x1, y1)]):
+                if abs(point.x - x) <= 2 * tolerance and abs(point.y - y) <= 2 * tolerance:
+                    self.shape_grab = ("resize", end)
+                    return
+        # Test de clic : seules les formes des cases voisines de l'index sont examinées
+        shape_id = vectors.hit(point.x, point.y, tolerance)
+        self.select_shape(shape_id)
+        self.shape_grab = ("move", point) if shape_id is not None else None
+
+    def drag_shape(self, point):
+        """Déplacer ou redimensionner la forme prise : seule la zone qu'elle couvre est redessinée"""
+        if self.shape_grab is None:
+            return
+        mode, anchor = self.shape_grab
+        points = list(self.document.vectors.shapes[self.selected_shape].points)
+        if mode == "move":
+            dx, dy = point.x - anchor.x, point.y - anchor.y
+            if not dx and not dy:
+                return
+            points = [points[0] + dx, points[1] + dy, points[2] + dx, points[3] + dy]
+            self.shape_grab = ("move", point)
+        else:
+            points[2 * anchor:2 * anchor + 2] = [point.x, point.y]
+        # Hors journal pendant le glissé : release_shape() enregistre la position finale
+        self.document.reshape_shape(self.selected_shape, points)
+        self.refresh_canvas()
+        self.show_shape_handles()
 
-        # Obtenir la couleur du pixel cliqué
-        try:
-            target_color = self.image.getpixel((x, y))
-        except:
+    def release_shape(self):
+        """Lâcher la forme prise : tout le glissé forme une seule action annulable"""
+        self.shape_grab = None
+        if self.selected_shape not in (self.document.pending_shapes or {}):
             return
+        points = list(self.document.vectors.shapes[self.selected_shape].points)
+        self.document.apply(ReshapeShape(self.selected_shape, points), commit=False)
+        self.save_state()
 
-        if target_color == color_rgb:
+    def select_shape(self, shape_id):
+        """Changer de forme sélectionnée (None : aucune)"""
+        self.selected_shape = shape_id
+        self.shape_grab = None
+        self.show_shape_handles()
+
+    def follow_shapes(self):
+        """Après une annulation : oublier la forme sélectionnée si elle a disparu, sinon suivre sa position"""
+        if self.selected_shape not in self.document.vectors.shapes:
+            self.select_shape(None)
+        else:
+            self.show_shape_handles()
+
+    def show_shape_handles(self):
+        """Cadre et poignées (extrémités) de la forme sélectionnée"""
+        self.canvas.delete("shape_handles")
+        shape = self.document.vectors.shapes.get(self.selected_shape)
+        if shape is None:
             return
+        # Marqués « selection » : le rafraîchissement du canvas les conserve
+        tags = ("selection", "shape_handles")
+        self.canvas.create_rectangle(*self.to_canvas(shape.box), outline="#0078d7", dash=(4, 4), tags=tags)
+        for x, y in zip(shape.points[0::2], shape.points[1::2]):
+            cx, cy = self.to_canvas((x, y))
+            self.canvas.create_rectangle(cx - 4, cy - 4, cx + 4, cy + 4, outline="#0078d7", fill="white", tags=tags)
+
+    def flatten_shapes(self):
+        """Dessiner les formes vectorielles dans le calque actif (une action annulable)"""
+        if not self.document.vectors:
+            return
+        self.select_shape(None)
+        self.document.apply(FlattenShapes(), commit=False)
+        self.refresh_canvas()
+        self.save_state()
 
-        # Flood fill simple avec pile
-        pixels = self.image.load()
-        stack = [(x, y)]
-        filled = set()
+    def delete_selected(self):
+        """Supprimer la sélection, ou la forme vectorielle sélectionnée"""
+        if self.selection is not None:
+            self.delete_selection()
+        elif self.selected_shape is not None:
+            shape_id = self.selected_shape
+            self.select_shape(None)
+            self.document.apply(RemoveShape(shape_id))
+            self.refresh_canvas()
 
-        while stack and len(filled) < 100000:  # Limite pour éviter les boucles infinies
-            px, py = stack.pop()
+    @instrumented
+    def flood_fill(self, x, y):
+        """Remplissage par segments horizontaux (scanline)"""
+        self.change_tolerance()
+        if self.document.apply(Fill(x, y, self.current_color, self.fill_tolerance), commit=False):
+            # Redessiner le canvas
+            self.refresh_canvas()
+            self.save_state()
 
-            if (px, py) in filled:
-                continue
-            if px < 0 or px >= self.canvas_width or py < 0 or py >= self.canvas_height:
-                continue
+    def add_text(self, x, y):
+        """Saisir un texte, puis le placer au clic suivant (aperçu sous le pointeur)"""
+        from tkinter import simpledialog
+        if self.pending_text is None:
+            text = simpledialog.askstring("Texte", "Entrez votre texte:")
+            if text:
+                self.pending_text = text
+                self.show_text_preview(x, y)
+            return
 
-            current = pixels[px, py]
-            if current != target_color:
-                continue
+        text = self.pending_text
+        self.cancel_text()
+        self.document.apply(Text(x, y, text, self.current_color, self.text_size(), self.text_family), commit=False)
+        self.refresh_canvas()
+        self.save_state()
 
-            pixels[px, py] = color_rgb
-            filled.add((px, py))
+    def text_size(self):
+        """Taille du texte en points, liée à la taille du pinceau"""
+        return self.brush_size * 4
 
-            stack.extend([(px+1, py), (px-1, py), (px, py+1), (px, py-1)])
+    def show_text_preview(self, x, y):
+        """Afficher le texte en attente en (x, y), rendu comme il sera enregistré"""
+        raster = render_text(self.pending_text, self.text_family, self.text_size())
+        x0, y0, x1, y1 = raster.bbox
+        if x1 <= x0 or y1 <= y0:
+            return
 
-        # Redessiner le canvas
+        # Même masque que l'opération Text : l'aperçu est exactement le résultat
+        preview = Image.new("RGBA", raster.mask.size, self.current_color)
+        preview.putalpha(raster.mask)
+        if self.zoom != 1:
+            width = max(1, round(preview.width * self.zoom))
+            height = max(1, round(preview.height * self.zoom))
+            preview = preview.resize((width, height), Image.BILINEAR)
+
+        self.text_photo = photo_image(preview)
+        position = self.to_canvas((x + x0, y + y0))
+        if self.text_item is not None:
+            self.canvas.delete(self.text_item)
+        self.text_item = self.canvas.create_image(*position, anchor="nw", image=self.text_photo)
+        self.start_x, self.start_y = x, y
+
+    def cancel_text(self):
+        """Abandonner le texte en attente de placement"""
+        if self.text_item is not None:
+            self.canvas.delete(self.text_item)
+        self.pending_text = None
+        self.text_item = None
+        self.text_photo = None
+
+    def grab_selection(self, point, copy=False):
+        """Prendre la sélection sous le pointeur, sinon valider l'actuelle et en commencer une"""
+        selection = self.selection
+        if selection is not None and selection.contains(point):
+            self.selection_grab = (point.x - selection.x, point.y - selection.y)
+            if selection.source is not None and selection.hole is None and not selection.moved:
+                # Premier déplacement : soulever les pixels, leur place apparaît effacée
+                selection.copy = copy
+                if not copy:
+                    selection.hole = self.document.backdrop(selection.source)
+                    selection.show(self.zoom)
+            return
+        self.commit_selection()
+        self.selection_grab = None
+
+    def drag_selection(self, point):
+        """Déplacer la sélection prise, ou agrandir le rectangle de sélection"""
+        if self.selection_grab is not None:
+            gx, gy = self.selection_grab
+            self.selection.move_to(point.x - gx, point.y - gy)
+            return
+        coords = self.to_canvas([self.start_x, self.start_y, point.x, point.y])
+        if self.temp_shape and self.canvas.type(self.temp_shape):
+            self.canvas.coords(self.temp_shape, *coords)
+        else:
+            self.temp_shape = self.canvas.create_rectangle(*coords, outline="black", dash=(4, 4))
+
+    def finish_selection(self, point):
+        """Fin du glissement : poser la sélection déplacée, ou soulever la boîte tracée"""
+        if self.selection_grab is not None:
+            self.selection_grab = None
+            return
+        if self.temp_shape is not None:
+            self.canvas.delete(self.temp_shape)
+            self.temp_shape = None
+        box = clip_box((min(self.start_x, point.x), min(self.start_y, point.y),
+                        max(self.start_x, point.x) + 1, max(self.start_y, point.y) + 1), self.document.size)
+        if box is None or box[2] - box[0] < 2 or box[3] - box[1] < 2:
+            return
+        self.selection = FloatingSelection(self.canvas, self.document.image.crop(box), box[0], box[1], box)
+        self.selection.show(self.zoom)
+
+    def commit_selection(self):
+        """Recoller la sélection flottante dans le calque (une seule opération), puis l'oublier"""
+        selection = self.selection
+        if selection is None:
+            return
+        self.cancel_selection()
+        if selection.source is None:
+            operation = Paste.from_image(selection.pixels, selection.x, selection.y)
+        elif selection.moved:
+            operation = MoveRegion(list(selection.source), selection.x, selection.y, selection.copy)
+        else:
+            return
+        self.document.apply(operation, commit=False)
         self.refresh_canvas()
         self.save_state()
 
-    def add_text(self, x, y):
-        """Ajouter du texte"""
-        text = simpledialog.askstring("Texte", "Entrez votre texte:")
-        if text:
-            # Dessiner sur le canvas
-            self.canvas.create_text(
-                x, y,
-                text=text,
-                fill=self.current_color,
-                font=("Arial", self.brush_size * 4),
-                anchor="nw"
-            )
-            # Dessiner sur l'image PIL
-            from PIL import ImageFont
-            try:
-                font = ImageFont.truetype("arial.ttf", self.brush_size * 4)
-            except:
-                font = ImageFont.load_default()
-            self.draw.text((x, y), text, fill=self.current_color, font=font)
-            self.save_state()
+    def cancel_selection(self):
+        """Abandonner la sélection (le calque n'a pas été modifié)"""
+        if self.selection is not None:
+            self.selection.hide()
+        self.selection = None
+        self.selection_grab = None
+
+    def copy_selection(self):
+        """Copier les pixels de la sélection dans le presse-papiers"""
+        if self.selection is not None:
+            self.clipboard = self.selection.pixels
+
+    def cut_selection(self):
+        """Copier la sélection puis l'effacer"""
+        self.copy_selection()
+        self.delete_selection()
+
+    def delete_selection(self):
+        """Poser la sélection puis effacer la zone qu'elle couvre"""
+        selection = self.selection
+        if selection is None:
+            return
+        self.commit_selection()
+        self.document.apply(ClearRegion(list(selection.box)), commit=False)
+        self.refresh_canvas()
+        self.save_state()
 
-    def refresh_canvas(self):
-        """Rafraîchir le canvas depuis l'image PIL"""
-        self.canvas.delete("all")
-        self.photo = ImageTk.PhotoImage(self.image)
-        self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+    def paste_clipboard(self):
+        """Coller le presse-papiers en sélection flottante, en haut à gauche de la vue"""
+        if self.clipboard is None:
+            return
+        self.select_tool("select")
+        x = int(self.canvas.canvasx(0) / self.zoom)
+        y = int(self.canvas.canvasy(0) / self.zoom)
+        self.selection = FloatingSelection(self.canvas, self.clipboard, x, y)
+        self.selection.show(self.zoom)
+
+    @instrumented
+    def refresh_canvas(self, box=None):
+        """Rafraîchir le canvas depuis l'image PIL (zones modifiées seulement)"""
+        if self.pyramid is not None and self.pyramid.image is not self.image:
+            # Formes ajoutées ou aplaties : l'image aplatie a changé d'objet
+            self.reset_view()
+            return
+        if box is not None:
+            self.renderer.invalidate(box)
+        self.renderer.flush(self.image)
 
+    @instrumented
     def save_state(self):
-        """Sauvegarder l'état actuel pour undo"""
-        # Supprimer les états après l'index actuel (pour redo)
-        self.history = self.history[:self.history_index + 1]
-
-        # Ajouter le nouvel état
-        self.history.append(self.image.copy())
-        self.history_index += 1
-
-        # Limiter la taille de l'historique
-        if len(self.history) > self.max_history:
-            self.history.pop(0)
-            self.history_index -= 1
+        """Sauvegarder l'état actuel pour undo (seules les tuiles modifiées sont conservées)"""
+        self.document.commit()
 
+    @instrumented
     def undo(self):
-        """Annuler la dernière action"""
-        if self.history_index > 0:
-            self.history_index -= 1
-            self.image = self.history[self.history_index].copy()
-            self.draw = ImageDraw.Draw(self.image)
+        """Annuler la dernière action (avec une sélection flottante : l'abandonner)"""
+        if self.selection is not None:
+            self.cancel_selection()
+            return
+        if self.document.apply(Undo()):
             self.refresh_canvas()
+            self.follow_shapes()
 
+    @instrumented
     def redo(self):
         """Rétablir l'action annulée"""
-        if self.history_index < len(self.history) - 1:
-            self.history_index += 1
-            self.image = self.history[self.history_index].copy()
-            self.draw = ImageDraw.Draw(self.image)
+        self.cancel_selection()
+        if self.document.apply(Redo()):
             self.refresh_canvas()
+            self.follow_shapes()
+
+    def run_filter(self, operation):
+        """Calculer un filtre sur le pool de threads, l'interface restant active"""
+        self.commit_selection()
+        if self.filter_executor is None:
+            self.filter_executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        job = operation.prepare(self.document, self.filter_executor)
+
+        # Fenêtre modale : pas de dessin pendant le calcul, mais l'affichage suit
+        window = tk.Toplevel(self.root)
+        window.title("Filtre")
+        window.transient(self.root)
+        window.grab_set()
+        ttk.Label(window, text="Application du filtre...").pack(side=tk.TOP, padx=20, pady=(10, 5))
+        bar = ttk.Progressbar(window, length=240, maximum=100)
+        bar.pack(side=tk.TOP, padx=20, pady=(0, 10))
+
+        self.root.after(50, self.poll_filter, operation, job, window, bar)
+
+    def poll_filter(self, operation, job, window, bar):
+        """Suivre l'avancement du filtre, écrire les rangées prêtes ; valider une fois terminé"""
+        job.advance(self.document.image)
+        if not job.done():
+            bar["value"] = job.progress * 100
+            self.root.after(50, self.poll_filter, operation, job, window, bar)
+            return
+        window.destroy()
+        self.document.apply(operation, commit=False)
+        self.refresh_canvas()
+        self.save_state()
+
+    def set_document(self, document):
+        """Remplacer le document courant (nouveau format, image ouverte)"""
+        if self.save_job is not None:
+            # L'instantané lit encore l'ancien document : finir l'enregistrement
+            self.save_job.wait()
+        self.cancel_selection()
+        self.select_shape(None)
+        previous, self.document = self.document, document
+        if self.journal is not None:
+            # Le point de reprise en cours lit encore l'ancien document
+            self.journal.start(document)
+        previous.close()
+        self.pyramid = None
+        self.canvas_width, self.canvas_height = document.size
+        self.attach_document()
+        self.status_size.config(text=f"Canvas: {self.canvas_width}x{self.canvas_height}")
+        self.update_layers_panel()
+        self.refresh_canvas((0, 0, self.canvas_width, self.canvas_height))
+
+    def new_document(self):
+        """Créer un document vierge d'une taille choisie (stocké par tuiles s'il est grand)"""
+        from tkinter import messagebox, simpledialog
+        answer = simpledialog.askstring(
+            "Nouveau format",
+            "Taille (largeur x hauteur):",
+            initialvalue=f"{self.canvas_width}x{self.canvas_height}"
+        )
+        if not answer:
+            return
+        try:
+            width, height = (int(v) for v in answer.lower().replace(" ", "").split("x"))
+            if width <= 0 or height <= 0:
+                raise ValueError(answer)
+        except ValueError:
+            messagebox.showerror("Erreur", f"Taille invalide: {answer}")
+            return
+        self.set_document(Document(width, height, history_budget=self.history_budget))
 
     def new_canvas(self):
         """Créer un nouveau canvas vierge"""
+        from tkinter import messagebox
         if messagebox.askyesno("Nouveau", "Effacer le dessin actuel et créer un nouveau document?"):
-            self.clear_canvas()
+            self.set_document(Document(self.canvas_width, self.canvas_height, history_budget=self.history_budget))
 
     def clear_canvas(self):
-        """Effacer le canvas"""
-        self.canvas.delete("all")
-        self.image = Image.new("RGB", (self.canvas_width, self.canvas_height), "white")
-        self.draw = ImageDraw.Draw(self.image)
+        """Effacer le canvas (calque actif)"""
+        self.cancel_selection()
+        self.document.apply(Clear(), commit=False)
+        self.refresh_canvas()
         self.save_state()
 
+    def save_document(self):
+        """Réenregistrer le projet ouvert (tuiles modifiées seulement), sinon choisir un fichier"""
+        if self.document.project is None:
+            self.save_image()
+        else:
+            self.start_save(self.document.project.path)
+
+    @instrumented
     def save_image(self):
-        """Sauvegarder l'image"""
+        """Choisir un fichier puis sauvegarder : projet PyPaint ou image aplatie"""
+        from tkinter import filedialog
+        if self.save_job is not None:
+            self.status_task.config(text="Enregistrement déjà en cours...")
+            return
         filepath = filedialog.asksaveasfilename(
             defaultextension=".png",
             filetypes=[
                 ("PNG", "*.png"),
                 ("JPEG", "*.jpg"),
                 ("BMP", "*.bmp"),
+                ("Projet PyPaint", f"*{PROJECT_EXTENSION}"),
                 ("Tous les fichiers", "*.*")
             ]
         )
         if filepath:
-            self.image.save(filepath)
-            messagebox.showinfo("Sauvegarde", f"Image sauvegardée: {filepath}")
+            self.start_save(filepath)
+
+    def start_save(self, filepath):
+        """Sauvegarder dans un thread, à partir d'un instantané"""
+        if self.save_job is not None:
+            self.status_task.config(text="Enregistrement déjà en cours...")
+            return
+        self.commit_selection()
+        document = self.document
+        if os.path.splitext(filepath)[1].lower() == PROJECT_EXTENSION:
+            self.save_job = pypaint_core.save_project_in_background(document, filepath)
+        else:
+            document = None
+            self.save_job = pypaint_core.save_in_background(self.image, filepath, **self.save_options(filepath))
+        self.watch_job(self.save_job, "Enregistrement", lambda job: self.save_finished(job, filepath, document))
+
+    def save_options(self, filepath):
+        """Options d'enregistrement selon le format du fichier"""
+        ext = os.path.splitext(filepath)[1].lower()
+        if ext == ".png":
+            return {"compress_level": self.png_compression.get()}
+        if ext in (".jpg", ".jpeg"):
+            return {"quality": self.jpeg_quality.get()}
+        return {}
+
+    def save_finished(self, job, filepath, document=None):
+        from tkinter import messagebox
+        self.save_job = None
+        if job.error is not None:
+            self.status_task.config(text="")
+            messagebox.showerror("Erreur", f"Impossible de sauvegarder l'image: {job.error}")
+        else:
+            if document is not None:
+                # Projet enregistré : rangé ici, dans le thread de l'interface, comme open_finished
+                document.project = job.result
+            self.status_task.config(text=f"Sauvegardé: {os.path.basename(filepath)}")
+
+    def watch_job(self, job, label, on_done):
+        """Afficher l'avancement d'un travail de fichier, puis appeler on_done(job)"""
+        if not job.done():
+            self.status_task.config(text=f"{label}... {round(job.progress * 100)}%")
+            self.root.after(100, self.watch_job, job, label, on_done)
+            return
+        on_done(job)
 
+    @instrumented
     def open_image(self):
-        """Ouvrir une image"""
+        """Ouvrir une image (décodage dans un thread, réduit si elle dépasse le canvas)"""
+        from tkinter import filedialog, messagebox
+        if self.open_job is not None:
+            return
         filepath = filedialog.askopenfilename(
             filetypes=[
-                ("Images", "*.png *.jpg *.jpeg *.bmp *.gif"),
+                ("Images et projets", f"*.png *.jpg *.jpeg *.bmp *.gif *{PROJECT_EXTENSION}"),
+                ("Projet PyPaint", f"*{PROJECT_EXTENSION}"),
                 ("Tous les fichiers", "*.*")
             ]
         )
-        if filepath:
-            try:
-                img = Image.open(filepath)
-                img = img.convert("RGB")
-
-                # Redimensionner si nécessaire
-                if img.width > self.canvas_width or img.height > self.canvas_height:
-                    img.thumbnail((self.canvas_width, self.canvas_height))
-
-                # Créer une nouvelle image blanche et coller l'image ouverte
-                self.image = Image.new("RGB", (self.canvas_width, self.canvas_height), "white")
-                self.image.paste(img, (0, 0))
-                self.draw = ImageDraw.Draw(self.image)
+        if not filepath:
+            return
+        if os.path.splitext(filepath)[1].lower() == PROJECT_EXTENSION:
+            # Seuls l'index et les tuiles affichées sont lus
+            self.open_job = pypaint_core.open_project_in_background(filepath, self.history_budget)
+            self.watch_job(self.open_job, "Ouverture", self.open_finished)
+            return
+        try:
+            _, (width, height) = pypaint_core.image_info(filepath)
+        except Exception as e:
+            messagebox.showerror("Erreur", f"Impossible d'ouvrir l'image: {e}")
+            return
 
-                self.refresh_canvas()
-                self.save_state()
-            except Exception as e:
-                messagebox.showerror("Erreur", f"Impossible d'ouvrir l'image: {e}")
+        # Par défaut l'image garde sa taille (stockée par tuiles si elle est grande) ;
+        # réduite, un JPEG est décodé directement à l'échelle voulue
+        max_size = None
+        if width > self.canvas_width or height > self.canvas_height:
+            if messagebox.askyesno(
+                "Ouvrir",
+                f"L'image ({width}x{height}) dépasse le canvas "
+                f"({self.canvas_width}x{self.canvas_height}).\n"
+                "L'ouvrir réduite à la taille du canvas (plus rapide) ?"
+            ):
+                max_size = (self.canvas_width, self.canvas_height)
+
+        self.open_job = pypaint_core.open_in_background(filepath, max_size)
+        self.watch_job(self.open_job, "Ouverture", self.open_finished)
+
+    def open_finished(self, job):
+        from tkinter import messagebox
+        self.open_job = None
+        self.status_task.config(text="")
+        if job.error is not None:
+            messagebox.showerror("Erreur", f"Impossible d'ouvrir l'image: {job.error}")
+            return
+        if isinstance(job.result, Document):
+            self.set_document(job.result)
+        else:
+            self.set_document(Document.from_image(job.result, history_budget=self.history_budget))
+
+    def start_session(self):
+        """Proposer de reprendre une session interrompue, puis journaliser le document"""
+        from tkinter import messagebox
+        journal = Journal()
+        if Journal.has_session():
+            if messagebox.askyesno(
+                "Reprise",
+                "PyPaint ne s'est pas fermé correctement.\n"
+                "Restaurer le dessin de la session précédente ?"
+            ):
+                try:
+                    document = Journal.recover(history_budget=self.history_budget)
+                except Exception as e:
+                    messagebox.showerror("Erreur", f"Impossible de restaurer la session: {e}")
+                else:
+                    self.journal = journal
+                    self.set_document(document)
+                    self.root.after(JOURNAL_FLUSH_DELAY, self.flush_journal)
+                    return
+        try:
+            journal.start(self.document)
+        except OSError:
+            # Dossier de session inaccessible : PyPaint fonctionne sans journal
+            return
+        self.journal = journal
+        self.root.after(JOURNAL_FLUSH_DELAY, self.flush_journal)
+
+    def flush_journal(self):
+        """Écrire régulièrement les opérations journalisées (par lots, synchronisées)"""
+        if self.journal is not None:
+            self.journal.flush()
+        self.root.after(JOURNAL_FLUSH_DELAY, self.flush_journal)
+
+    def open_profiler(self):
+        """Activer l'instrumentation et afficher son panneau"""
+        if self.profiler is None:
+            self.profiler = Profiler()
+        if self.profiler_panel is None:
+            self.profiler_panel = ProfilerPanel(self)
+        else:
+            self.profiler_panel.window.lift()
+
+    def close_profiler(self):
+        """Désactiver l'instrumentation (panneau fermé) ; une capture cProfile en cours est abandonnée"""
+        if self.profiler is not None:
+            self.profiler.stop_profile()
+        self.cprofile_var.set(False)
+        self.profiler = None
+        self.profiler_panel = None
+
+    def reset_profiler(self):
+        """Oublier les mesures (la capture cProfile éventuelle continue)"""
+        if self.profiler is not None:
+            self.profiler.reset()
+
+    def sample_counters(self):
+        """Relever les compteurs suivis : éléments du canvas et mémoire de l'historique"""
+        if self.profiler is None:
+            return
+        self.profiler.sample("canvas_items", len(self.canvas.find_all()))
+        self.profiler.sample("history_bytes", sum(layer.history.total_memory for layer in self.document.layers))
+        summary = self.latency.summary()
+        if summary is not None:
+            self.profiler.sample("input_latency_p50_ms", summary["p50_ms"])
+
+    def dump_trace(self):
+        """Enregistrer la trace de l'instrumentation (JSON, format Trace Event de Chrome)"""
+        from tkinter import filedialog, messagebox
+        if self.profiler is None:
+            messagebox.showinfo("Instrumentation", "Activez d'abord l'instrumentation (menu Aide).")
+            return
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".json", filetypes=[("Trace JSON", "*.json"), ("Tous les fichiers", "*.*")]
+        )
+        if not filepath:
+            return
+        self.sample_counters()
+        try:
+            self.profiler.dump(filepath)
+        except OSError as e:
+            messagebox.showerror("Erreur", f"Impossible d'enregistrer la trace: {e}")
+            return
+        self.status_task.config(text=f"Trace enregistrée: {os.path.basename(filepath)}")
+
+    def toggle_cprofile(self):
+        """Démarrer ou arrêter une capture cProfile (résumé affiché dans le panneau)"""
+        from tkinter import filedialog, messagebox
+        if self.cprofile_var.get():
+            self.open_profiler()
+            self.profiler.start_profile()
+            return
+        if self.profiler is None or not self.profiler.profiling:
+            return
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".prof", filetypes=[("Profil pstats", "*.prof"), ("Tous les fichiers", "*.*")]
+        )
+        try:
+            report = self.profiler.stop_profile(filepath or None)
+        except OSError as e:
+            messagebox.showerror("Erreur", f"Impossible d'enregistrer le profil: {e}")
+            return
+        self.profiler_panel.show_report(report)
 
     def quit_app(self):
         """Quitter l'application"""
+        from tkinter import messagebox
         if messagebox.askyesno("Quitter", "Voulez-vous vraiment quitter PyPaint?"):
+            if self.journal is not None:
+                # Fermeture normale : la session n'a pas à être reprise
+                self.journal.close(discard=True)
             self.root.quit()
 
     def show_about(self):
         """Afficher la fenêtre À propos"""
+        from tkinter import messagebox
         messagebox.showinfo(
             "À propos de PyPaint",
             "PyPaint v1.0\n\n"
@@ -573,15 +2014,98 @@ class PyPaint:
             "R - Rectangle\n"
             "O - Ellipse\n"
             "F - Remplissage\n"
-            "T - Texte\n\n"
+            "T - Texte\n"
+            "A - Aérographe\n"
+            "S - Sélection\n"
+            "V - Formes vectorielles\n\n"
             "Ctrl+Z - Annuler\n"
             "Ctrl+Y - Rétablir\n"
+            "Ctrl+C / X / V - Copier / couper / coller\n"
             "Ctrl+S - Sauvegarder\n"
             "Ctrl+O - Ouvrir"
         )
 
 
-def main():
+def startup_bench(budget=STARTUP_BUDGET, output=None):
+    """Mesurer le démarrage jusqu'à la première image affichée, puis un premier trait.
+
+    Les durées sont comptées depuis LAUNCH_TIME (le démarrage de
+    l'interpréteur n'y est pas). Sans session : le journal de
+    l'utilisateur n'est pas touché. Retourne 1 si la première image
+    dépasse `budget` (ms).
+    """
+    import json
+    from types import SimpleNamespace
+
+    def elapsed():
+        return round((time.perf_counter() - LAUNCH_TIME) * 1000, 1)
+
+    marks = {"imports_ms": elapsed()}
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"Pas d'affichage : {e}", file=sys.stderr)
+        return 1
+    app = PyPaint(root, session=False)
+    marks["window_ms"] = elapsed()
+
+    def event(x, y):
+        return SimpleNamespace(x=x, y=y, state=0)
+
+    def first_frame():
+        marks["first_frame_ms"] = elapsed()
+        # Premier trait : ce que le démarrage a différé est payé ici
+        start = time.perf_counter()
+        app.on_press(event(100, 100))
+        for i in range(1, 20):
+            app.on_drag(event(100 + 10 * i, 100 + 5 * i))
+        app.on_release(event(300, 200))
+        root.update_idletasks()
+        marks["first_stroke_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        root.destroy()
+
+    # La première exposition du canvas, puis le redessin qui la suit
+    app.canvas.bind("<Expose>", lambda e: root.after_idle(first_frame) if "first_frame_ms" not in marks else None)
+    root.after(30_000, root.destroy)
+    root.mainloop()
+
+    if "first_frame_ms" not in marks:
+        print("Aucune image affichée (pas d'affichage disponible ?)", file=sys.stderr)
+        return 1
+    for name, value in marks.items():
+        print(f"{name:<18} {value:8.1f} ms")
+    marks["budget_ms"] = budget
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(marks, f, indent=2)
+    if marks["first_frame_ms"] > budget:
+        print(f"Première image après {marks['first_frame_ms']:.0f} ms : budget de {budget:.0f} ms dépassé",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # « pypaint batch ... » : traitement par lots, sans interface
+    if argv[:1] == ["batch"]:
+        from pypaint_core.batch import main as batch_main
+        sys.exit(batch_main(argv[1:]))
+
+    if argv:
+        # argparse n'est chargé que s'il y a des options, pour ne pas retarder le lancement
+        import argparse
+
+        parser = argparse.ArgumentParser(prog="pypaint", description="PyPaint - Application de dessin")
+        parser.add_argument("--startup-bench", action="store_true",
+                            help="mesurer le temps jusqu'à la première image, puis quitter")
+        parser.add_argument("--budget", type=float, default=STARTUP_BUDGET,
+                            help="budget de la première image (ms) : code de sortie 1 au-delà")
+        parser.add_argument("--output", help="résultats JSON de --startup-bench")
+        args = parser.parse_args(argv)
+        if args.startup_bench:
+            sys.exit(startup_bench(args.budget, args.output))
+
     root = tk.Tk()
     app = PyPaint(root)
     root.mainloop()
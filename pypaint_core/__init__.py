@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Moteurs de dessin de PyPaint, indépendants de Tkinter
+"""
+
+from .brush import dab_mask, paint_stroke, spray_particles, stamp_positions, stroke_coverage
+from .compact import CompactTile, encode_tile
+from .document import Document
+from .fileio import FileJob, image_info, open_in_background, open_image, save_image, save_in_background
+from .fill import scanline_fill
+from .filters import (
+    FILTERS,
+    BrightnessContrast,
+    FilterJob,
+    GaussianBlur,
+    TileFilter,
+    make_filter,
+    make_proxy,
+    preview_filter,
+)
+from .fonts import DEFAULT_FAMILY, FontIndex, font_index, get_font, render_text
+from .history import TileHistory
+from .journal import Journal
+from .layers import Compositor, Layer
+from .operations import (
+    OPERATIONS,
+    AddLayer,
+    AddShape,
+    ApplyFilter,
+    Clear,
+    ClearRegion,
+    Commit,
+    Ellipse,
+    Erase,
+    Fill,
+    FlattenShapes,
+    LayerProperties,
+    Line,
+    MoveRegion,
+    Operation,
+    Paste,
+    Rect,
+    Redo,
+    RemoveLayer,
+    RemoveShape,
+    ReshapeShape,
+    SelectLayer,
+    Spray,
+    Stroke,
+    Text,
+    Undo,
+    dump_operations,
+    load_operations,
+    operation_from_dict,
+)
+from .profiling import Profiler
+from .project import (
+    PROJECT_EXTENSION,
+    DocumentCapture,
+    ProjectFile,
+    open_project,
+    open_project_in_background,
+    save_project,
+    save_project_in_background,
+    write_project,
+)
+from .pyramid import ImagePyramid
+from .regions import box_area, clip_box, ordered_box, points_box, union_box
+from .tiles import TiledImage, TileSnapshot
+from .vector import GridIndex, Shape, VectorLayer
+
+__all__ = [
+    "DEFAULT_FAMILY",
+    "Document",
+    "FILTERS",
+    "OPERATIONS",
+    "PROJECT_EXTENSION",
+    "AddLayer",
+    "AddShape",
+    "ApplyFilter",
+    "BrightnessContrast",
+    "Clear",
+    "ClearRegion",
+    "Commit",
+    "CompactTile",
+    "Compositor",
+    "DocumentCapture",
+    "Ellipse",
+    "Erase",
+    "FileJob",
+    "Fill",
+    "FilterJob",
+    "FlattenShapes",
+    "FontIndex",
+    "GaussianBlur",
+    "GridIndex",
+    "ImagePyramid",
+    "Journal",
+    "Layer",
+    "LayerProperties",
+    "Line",
+    "MoveRegion",
+    "Operation",
+    "Paste",
+    "Profiler",
+    "ProjectFile",
+    "Rect",
+    "Redo",
+    "RemoveLayer",
+    "RemoveShape",
+    "ReshapeShape",
+    "SelectLayer",
+    "Shape",
+    "Spray",
+    "Stroke",
+    "Text",
+    "TileFilter",
+    "Undo",
+    "VectorLayer",
+    "dab_mask",
+    "dump_operations",
+    "encode_tile",
+    "font_index",
+    "get_font",
+    "image_info",
+    "load_operations",
+    "make_filter",
+    "make_proxy",
+    "operation_from_dict",
+    "paint_stroke",
+    "render_text",
+    "open_in_background",
+    "open_image",
+    "open_project",
+    "open_project_in_background",
+    "preview_filter",
+    "save_image",
+    "save_in_background",
+    "save_project",
+    "save_project_in_background",
+    "scanline_fill",
+    "spray_particles",
+    "stamp_positions",
+    "stroke_coverage",
+    "TileHistory",
+    "TiledImage",
+    "TileSnapshot",
+    "box_area",
+    "clip_box",
+    "ordered_box",
+    "points_box",
+    "union_box",
+    "write_project",
+]
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Traitement par lots : un script d'opérations appliqué à des dossiers d'images, sur tous les cœurs
+
+    python pypaint.py batch script.jsonl photos/ "scans/*.png" --output sortie/
+    python -m pypaint_core.batch script.jsonl photos/ --output sortie/ --format .png --report rapport.jsonl
+
+Le script est un journal d'opérations (JSON Lines, voir operations.py) :
+les mêmes opérations, donc le même rendu, que les outils de l'interface.
+Ni Tkinter ni affichage ne sont nécessaires.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from .document import Document
+from .fileio import open_image, save_image
+from .operations import load_operations
+from .project import PROJECT_EXTENSION, save_project
+
+
+# Extensions reconnues quand une entrée est un dossier
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+# État d'un processus de travail, préparé une fois par initializer
+_worker = {}
+
+
+def find_inputs(patterns):
+    """Fichiers désignés par des chemins, des dossiers (non récursif) ou des motifs glob, sans doublons"""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = sorted(
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            )
+        elif glob.has_magic(pattern):
+            paths = sorted(glob.glob(pattern))
+        else:
+            paths = [pattern]
+        found.extend(path for path in paths if os.path.isfile(path) or not os.path.exists(path))
+    return list(dict.fromkeys(found))
+
+
+def output_path(filepath, output_dir, extension=None):
+    """Fichier de sortie : même nom dans `output_dir`, extension remplacée si demandé"""
+    stem, ext = os.path.splitext(os.path.basename(filepath))
+    return os.path.join(output_dir, stem + (extension or ext))
+
+
+def output_paths(inputs, output_dir, extension=None):
+    """Fichiers de sortie de toutes les entrées ; ValueError si deux entrées donneraient le même fichier"""
+    destinations = [output_path(filepath, output_dir, extension) for filepath in inputs]
+    seen = {}
+    for filepath, destination in zip(inputs, destinations):
+        key = os.path.normcase(os.path.abspath(destination))
+        if key in seen:
+            # Les processus s'écraseraient en silence : refuser avant de lancer le lot
+            raise ValueError(f"{seen[key]} et {filepath} donneraient tous deux {destination}")
+        seen[key] = filepath
+    return destinations
+
+
+def process_file(filepath, destination, operations, executor=None, save_options=None):
+    """Ouvrir, appliquer les opérations, enregistrer ; retourne les durées des étapes (ms).
+
+    Pas d'historique d'annulation : les opérations sont appliquées sans
+    commit. Un filtre est calculé sur `executor` s'il est fourni.
+    """
+    timings = {}
+    start = time.perf_counter()
+    document = Document.from_image(open_image(filepath), history_budget=0)
+    opened = time.perf_counter()
+    try:
+        for operation in operations:
+            if executor is not None and hasattr(operation, "prepare"):
+                operation.prepare(document, executor)
+            document.apply(operation, commit=False)
+        drawn = time.perf_counter()
+        if os.path.splitext(destination)[1].lower() == PROJECT_EXTENSION:
+            save_project(document, destination)
+        else:
+            save_image(document.composite, destination, **(save_options or {}))
+        saved = time.perf_counter()
+    finally:
+        document.close()
+    timings["open_ms"] = (opened - start) * 1000
+    timings["operations_ms"] = (drawn - opened) * 1000
+    timings["save_ms"] = (saved - drawn) * 1000
+    timings["total_ms"] = (saved - start) * 1000
+    return timings
+
+
+def _init_worker(script, threads, save_options):
+    """Préparer un processus : opérations décodées une fois, pool de threads des filtres"""
+    _worker["operations"] = load_operations(script.splitlines())
+    _worker["executor"] = ThreadPoolExecutor(max_workers=threads)
+    _worker["save_options"] = save_options
+
+
+def _run_one(filepath, destination):
+    """Traiter un fichier dans un processus de travail ; une erreur est rapportée, pas levée"""
+    result = {"input": filepath, "output": destination, "ok": True, "error": None}
+    try:
+        result.update(process_file(
+            filepath, destination, _worker["operations"], _worker["executor"], _worker["save_options"]
+        ))
+    except Exception as e:
+        result.update(ok=False, error=f"{type(e).__name__}: {e}")
+    return result
+
+
+def run_batch(script, inputs, output_dir, extension=None, workers=None, threads=1, save_options=None):
+    """Traiter tous les fichiers sur un pool de processus ; produit les rapports au fil de l'eau.
+
+    `script` est le texte JSON Lines des opérations. Chaque rapport
+    (dictionnaire) donne l'entrée, la sortie, le succès ou l'erreur et
+    les durées des étapes.
+    """
+    # Un script invalide ou des sorties en double sont signalés avant de lancer les processus
+    load_operations(script.splitlines())
+    destinations = output_paths(inputs, output_dir, extension)
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        initializer=_init_worker,
+        initargs=(script, threads, save_options or {}),
+    ) as executor:
+        futures = [
+            executor.submit(_run_one, filepath, destination)
+            for filepath, destination in zip(inputs, destinations)
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="pypaint batch", description="Appliquer un script d'opérations PyPaint à des images"
+    )
+    parser.add_argument("script", help="opérations à appliquer (JSON Lines, une opération par ligne)")
+    parser.add_argument("inputs", nargs="+", help="images, dossiers ou motifs glob")
+    parser.add_argument("--output", "-o", required=True, help="dossier des images produites")
+    parser.add_argument("--format", help="extension de sortie (.png, .jpg, .ppx...), sinon celle de l'entrée")
+    parser.add_argument("--jobs", "-j", type=int, help="nombre de processus (par défaut : un par cœur)")
+    parser.add_argument("--threads", type=int, default=1, help="threads de calcul des filtres par processus")
+    parser.add_argument("--quality", type=int, help="qualité JPEG")
+    parser.add_argument("--compress-level", type=int, help="compression PNG (0 à 9)")
+    parser.add_argument("--report", help="rapport JSON Lines (un fichier par ligne)")
+    args = parser.parse_args(argv)
+
+    with open(args.script, encoding="utf-8") as f:
+        script = f.read()
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        parser.error("aucune image à traiter")
+    extension = args.format
+    if extension and not extension.startswith("."):
+        extension = "." + extension
+    try:
+        output_paths(inputs, args.output, extension)
+    except ValueError as e:
+        parser.error(str(e))
+    save_options = {}
+    if args.quality is not None:
+        save_options["quality"] = args.quality
+    if args.compress_level is not None:
+        save_options["compress_level"] = args.compress_level
+
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+    failures = 0
+    start = time.perf_counter()
+    try:
+        for done, result in enumerate(
+            run_batch(script, inputs, args.output, extension, args.jobs, args.threads, save_options), 1
+        ):
+            if result["ok"]:
+                print(f"[{done}/{len(inputs)}] {result['input']} -> {result['output']}"
+                      f" ({result['total_ms']:.0f} ms)")
+            else:
+                failures += 1
+                print(f"[{done}/{len(inputs)}] {result['input']} : ERREUR {result['error']}", file=sys.stderr)
+            if report is not None:
+                report.write(json.dumps(result, ensure_ascii=False) + "\n")
+                report.flush()
+    finally:
+        if report is not None:
+            report.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(inputs) - failures} image(s) traitée(s), {failures} erreur(s) en {elapsed:.1f} s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Moteur de pinceau : empreintes anticrénelées tamponnées le long du trait
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+
+# Écart entre deux empreintes successives, en fraction du diamètre
+DEFAULT_SPACING = 0.15
+
+# Positions sous-pixel distinguées par axe pour le centre d'une empreinte
+SUBPIXEL_STEPS = 4
+
+# Côté des tuiles du masque de couverture d'un trait
+MASK_TILE = 256
+
+
+@lru_cache(maxsize=256)
+def dab_mask(diameter, hardness=1.0, phase=(0, 0)):
+    """Empreinte anticrénelée d'un disque : tableau carré uint8 (0 à 255), en lecture seule.
+
+    `hardness` (0 à 1) est la part du rayon couverte entièrement ; au-delà,
+    la couverture décroît jusqu'au bord. `phase` (px, py) place le centre
+    à (px + 0.5) / SUBPIXEL_STEPS pixel du coin de la case centrale.
+    """
+    radius = diameter / 2
+    size = int(math.ceil(diameter)) + 3
+    cx = size // 2 + (phase[0] + 0.5) / SUBPIXEL_STEPS
+    cy = size // 2 + (phase[1] + 0.5) / SUBPIXEL_STEPS
+
+    # Distance du centre de chaque pixel au centre de l'empreinte
+    centers = np.arange(size, dtype=np.float32) + 0.5
+    distance = np.hypot(centers[np.newaxis, :] - cx, centers[:, np.newaxis] - cy)
+
+    # Rampe linéaire qui finit un demi-pixel après le bord, adoucie (smoothstep)
+    falloff = max(1.0, radius * (1 - hardness))
+    coverage = np.clip((radius + 0.5 - distance) / falloff, 0, 1)
+    coverage = coverage * coverage * (3 - 2 * coverage)
+
+    dab = np.round(coverage * 255).astype(np.uint8)
+    dab.flags.writeable = False
+    return dab
+
+
+def stamp_positions(points, step):
+    """Centres des empreintes le long d'une polyligne [x0, y0, x1, y1, ...], tous les `step` pixels"""
+    xs = np.asarray(points[0::2], dtype=np.float64)
+    ys = np.asarray(points[1::2], dtype=np.float64)
+    lengths = np.hypot(np.diff(xs), np.diff(ys))
+
+    # Les segments de longueur nulle (souris immobile) n'apportent rien
+    keep = np.concatenate(([True], lengths > 0))
+    xs, ys = xs[keep], ys[keep]
+    distance = np.concatenate(([0.0], np.cumsum(lengths[lengths > 0])))
+    if distance[-1] == 0:
+        return np.column_stack((xs[:1], ys[:1]))
+
+    # Toujours une empreinte sur le dernier point, pour que le trait aille jusqu'au bout
+    samples = np.append(np.arange(0, distance[-1], step), distance[-1])
+    return np.column_stack((np.interp(samples, distance, xs), np.interp(samples, distance, ys)))
+
+
+def stroke_coverage(points, diameter, hardness=1.0, spacing=DEFAULT_SPACING):
+    """Couverture d'un trait par tuiles : ({(tx, ty): tableau uint8}, boîte modifiée).
+
+    Les empreintes sont fusionnées par maximum : leurs recouvrements ne
+    s'additionnent pas et le trait garde une opacité uniforme. Seules les
+    tuiles de MASK_TILE pixels touchées par le trait sont allouées.
+    """
+    step = max(1.0, diameter * spacing)
+    size = MASK_TILE
+    positions = stamp_positions(points, step)
+
+    # Coin entier et phase sous-pixel de chaque empreinte, calculés d'un coup
+    corners = np.floor(positions)
+    phases = np.minimum(SUBPIXEL_STEPS - 1, ((positions - corners) * SUBPIXEL_STEPS).astype(int))
+    dabs = {}
+    extent = dab_mask(diameter, hardness).shape[0]
+    corners = corners.astype(int) - extent // 2
+
+    tiles = {}
+    for (x0, y0), (px, py) in zip(corners.tolist(), phases.tolist()):
+        dab = dabs.get((px, py))
+        if dab is None:
+            dab = dabs[(px, py)] = dab_mask(diameter, hardness, (px, py))
+        x1, y1 = x0 + extent, y0 + extent
+        tx0, ty0 = x0 // size, y0 // size
+        tx1, ty1 = (x1 - 1) // size, (y1 - 1) // size
+        if tx0 == tx1 and ty0 == ty1:
+            # Cas courant : l'empreinte tient dans une seule tuile
+            tile = tiles.get((tx0, ty0))
+            if tile is None:
+                tile = tiles[(tx0, ty0)] = np.zeros((size, size), dtype=np.uint8)
+            target = tile[y0 - ty0 * size:y1 - ty0 * size, x0 - tx0 * size:x1 - tx0 * size]
+            np.maximum(target, dab, out=target)
+            continue
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                tile = tiles.get((tx, ty))
+                if tile is None:
+                    tile = tiles[(tx, ty)] = np.zeros((size, size), dtype=np.uint8)
+                ix0, iy0 = max(x0, tx * size), max(y0, ty * size)
+                ix1, iy1 = min(x1, (tx + 1) * size), min(y1, (ty + 1) * size)
+                target = tile[iy0 - ty * size:iy1 - ty * size, ix0 - tx * size:ix1 - tx * size]
+                np.maximum(target, dab[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0], out=target)
+
+    x_min, y_min = corners.min(axis=0).tolist()
+    x_max, y_max = (corners.max(axis=0) + extent).tolist()
+    return tiles, (x_min, y_min, x_max, y_max)
+
+
+def paint_stroke(document, points, color, diameter, hardness=1.0, spacing=DEFAULT_SPACING):
+    """Tamponner un trait sur le calque actif ; retourner la boîte modifiée"""
+    tiles, box = stroke_coverage(points, diameter, hardness, spacing)
+    size = MASK_TILE
+    for (tx, ty), coverage in tiles.items():
+        mask = Image.fromarray(coverage, "L")
+        # Un seul collage par tuile, réduit à la partie couverte
+        bbox = mask.getbbox()
+        if bbox is not None:
+            document.stamp(color, (tx * size + bbox[0], ty * size + bbox[1]), mask.crop(bbox))
+    return box
+
+
+def spray_particles(points, radius, count, seed=0):
+    """Positions entières (xs, ys) de `count` gouttes tirées uniformément dans des disques.
+
+    Les centres sont répartis le long de la polyligne `points` ; chaque
+    goutte en choisit un au hasard. Tout est tiré en un seul lot NumPy, et
+    `seed` rend le résultat reproductible (rejeu du journal).
+    """
+    rng = np.random.default_rng(seed)
+    centers = stamp_positions(points, max(1.0, radius / 2))
+    which = rng.integers(0, len(centers), count)
+    # Racine du tirage : densité uniforme sur la surface du disque
+    distance = radius * np.sqrt(rng.random(count))
+    angle = rng.random(count) * (2 * np.pi)
+    xs = np.floor(centers[which, 0] + distance * np.cos(angle)).astype(np.int64)
+    ys = np.floor(centers[which, 1] + distance * np.sin(angle)).astype(np.int64)
+    return xs, ys
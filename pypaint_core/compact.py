@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Tuiles compactes : couleur unique, plages (RLE) ou palette pour les dessins en aplats
+"""
+
+import numpy as np
+
+
+# Au-delà d'une plage tous les deux pixels, la tuile est une photo ou un dégradé : gardée brute
+_MAX_RUN_RATIO = 0.5
+
+
+class CompactTile:
+    """Pixels d'une tuile sous la forme la plus petite parmi :
+
+    - « uniform » : une seule couleur ;
+    - « rle » : plages de couleur le long des lignes (début et couleur de chaque plage) ;
+    - « palette » : au plus 256 couleurs, un octet (ou un demi-octet jusqu'à 16) par pixel ;
+    - « raw » : le tableau tel quel.
+
+    Les couleurs sont manipulées comme des entiers 32 bits (canaux
+    juxtaposés), ce qui permet de comparer des pixels d'un seul coup.
+    """
+
+    __slots__ = ("kind", "shape", "colors", "data")
+
+    def __init__(self, kind, shape, colors=None, data=None):
+        self.kind = kind
+        self.shape = shape
+        self.colors = colors
+        self.data = data
+
+    @classmethod
+    def filled(cls, shape, color):
+        """Tuile uniforme de la couleur `color` (une valeur par canal), sans pixels à parcourir"""
+        pixel = np.asarray(color, dtype=np.uint8).reshape(1, 1, -1)
+        return cls("uniform", shape, _codes(pixel)[:1].copy())
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.colors, self.data) if a is not None)
+
+    def decode(self):
+        """Nouveau tableau uint8 des pixels, de la forme de la tuile encodée"""
+        height, width = self.shape[:2]
+        if self.kind == "raw":
+            return self.data.copy()
+        if self.kind == "uniform":
+            codes = np.full(height * width, self.colors[0], dtype=np.uint32)
+        elif self.kind == "rle":
+            lengths = np.diff(np.append(self.data, height * width))
+            codes = np.repeat(self.colors, lengths)
+        else:
+            indices = self.data
+            if len(self.colors) <= 16:
+                # Deux index par octet
+                indices = np.empty(self.data.size * 2, dtype=np.uint8)
+                indices[0::2] = self.data >> 4
+                indices[1::2] = self.data & 0x0F
+                indices = indices[:height * width]
+            codes = self.colors[indices]
+        return _from_codes(codes, self.shape)
+
+    def equals(self, pixels):
+        """Vrai si la tuile vaut exactement `pixels` (sans décoder une tuile uniforme)"""
+        if self.kind == "uniform":
+            return pixels.shape == self.shape and bool((_codes(pixels) == self.colors[0]).all())
+        if self.kind == "raw":
+            return np.array_equal(self.data, pixels)
+        return np.array_equal(self.decode(), pixels)
+
+
+def encode_tile(pixels):
+    """Encoder une tuile (hauteur, largeur[, canaux]) uint8 sous sa forme la plus compacte"""
+    shape = pixels.shape
+    codes = _codes(pixels)
+    count = codes.size
+
+    starts = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1)).astype(np.uint32)
+    if len(starts) == 1:
+        return CompactTile("uniform", shape, codes[:1].copy())
+    if len(starts) > count * _MAX_RUN_RATIO:
+        return CompactTile("raw", shape, data=np.array(pixels, dtype=np.uint8))
+
+    best = CompactTile("rle", shape, codes[starts], starts)
+    # Une palette ne peut faire mieux que les plages qu'au-delà d'un quart d'octet par pixel
+    if best.nbytes > count // 4:
+        colors, indices = np.unique(codes, return_inverse=True)
+        if len(colors) <= 256:
+            indices = indices.astype(np.uint8).ravel()
+            if len(colors) <= 16:
+                if count % 2:
+                    indices = np.append(indices, 0)
+                indices = (indices[0::2] << 4) | indices[1::2]
+            palette = CompactTile("palette", shape, colors.astype(np.uint32), indices)
+            if palette.nbytes < best.nbytes:
+                best = palette
+    if best.nbytes >= pixels.nbytes:
+        return CompactTile("raw", shape, data=np.array(pixels, dtype=np.uint8))
+    return best
+
+
+def _codes(pixels):
+    """Couleur de chaque pixel en entier 32 bits, à plat"""
+    height, width = pixels.shape[:2]
+    channels = pixels.shape[2] if pixels.ndim == 3 else 1
+    if channels == 4:
+        return np.ascontiguousarray(pixels).view(np.uint32).ravel()
+    padded = np.zeros((height, width, 4), dtype=np.uint8)
+    padded[:, :, :channels] = pixels.reshape(height, width, channels)
+    return padded.view(np.uint32).ravel()
+
+
+def _from_codes(codes, shape):
+    height, width = shape[:2]
+    pixels = np.ascontiguousarray(codes, dtype=np.uint32).view(np.uint8).reshape(height, width, 4)
+    if shape[2:] == (4,):
+        return pixels
+    return pixels[:, :, :(shape[2] if len(shape) == 3 else 1)].reshape(shape)
@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+"""
+Document PyPaint sans interface : calques, historique et zones modifiées
+"""
+
+from contextlib import contextmanager
+from dataclasses import replace
+
+import numpy as np
+from PIL import Image, ImageChops, ImageColor, ImageDraw
+
+from .history import TileHistory
+from .layers import Compositor, Layer
+from .operations import Commit
+from .regions import clip_box, union_box
+from .tiles import TiledImage
+from .vector import VectorLayer
+
+
+# Au-delà de ce nombre de pixels, le document est stocké par tuiles (TiledImage)
+TILED_THRESHOLD = 4096 * 4096
+
+
+class OffsetDraw:
+    """ImageDraw sur une région : accepte des coordonnées du document"""
+
+    def __init__(self, draw, offset):
+        self.draw = draw
+        self.offset = offset
+
+    def _shift(self, xy):
+        ox, oy = self.offset
+        if xy and isinstance(xy[0], (tuple, list)):
+            return [(x - ox, y - oy) for x, y in xy]
+        return [v - (ox if i % 2 == 0 else oy) for i, v in enumerate(xy)]
+
+    def line(self, xy, **kwargs):
+        self.draw.line(self._shift(xy), **kwargs)
+
+    def rectangle(self, xy, **kwargs):
+        self.draw.rectangle(self._shift(xy), **kwargs)
+
+    def ellipse(self, xy, **kwargs):
+        self.draw.ellipse(self._shift(xy), **kwargs)
+
+    def polygon(self, xy, **kwargs):
+        self.draw.polygon(self._shift(xy), **kwargs)
+
+    def point(self, xy, **kwargs):
+        self.draw.point(self._shift(xy), **kwargs)
+
+    def bitmap(self, xy, bitmap, **kwargs):
+        self.draw.bitmap(tuple(self._shift(list(xy))), bitmap, **kwargs)
+
+    def text(self, xy, text, **kwargs):
+        self.draw.text(tuple(self._shift(list(xy))), text, **kwargs)
+
+    def textbbox(self, xy, text, **kwargs):
+        ox, oy = self.offset
+        x0, y0, x1, y1 = self.draw.textbbox(tuple(self._shift(list(xy))), text, **kwargs)
+        return (x0 + ox, y0 + oy, x1 + ox, y1 + oy)
+
+
+class Document:
+    """Pile de calques en cours d'édition et leur historique.
+
+    Les opérations (voir operations.py) se dessinent sur le calque actif
+    via painting() ; `image`, `draw` et `history` désignent ceux de ce
+    calque. Au-delà de TILED_THRESHOLD pixels, l'image est une
+    TiledImage projetée en mémoire plutôt qu'une image PIL (un seul
+    calque dans ce cas). `composite` est l'image aplatie à afficher et à
+    enregistrer, formes vectorielles (`vectors`) comprises. Les observateurs enregistrés dans `observers` sont
+    appelés avec la boîte de chaque zone modifiée, ce qui permet à une
+    interface de ne redessiner que ces zones.
+    """
+
+    def __init__(self, width=800, height=550, background="white",
+                 history_budget=64 * 1024 * 1024, record=False, tiled=None):
+        self.background = background
+        self.history_budget = history_budget
+        if tiled is None:
+            tiled = width * height > TILED_THRESHOLD
+        if tiled:
+            image = TiledImage(width, height, background)
+        else:
+            image = Image.new("RGB", (width, height), background)
+        history = TileHistory(image, memory_budget=history_budget, blank=ImageColor.getcolor(background, "RGB"))
+        self.layers = [Layer("Fond", image, history)]
+        self.active = 0
+        # Formes vectorielles modifiables, au-dessus des calques (voir vector.py)
+        self.vectors = VectorLayer()
+        # Aplatissement des calques (None tant que le calque de fond suffit)
+        self.compositor = None
+        self.pending_box = None
+        # État des formes avant leur modification depuis le dernier commit (identifiant -> forme ou None)
+        self.pending_shapes = None
+        self.observers = []
+        # Journal des opérations appliquées (None : pas d'enregistrement)
+        self.log = [] if record else None
+        # Journal de session sur disque (voir journal.py), None s'il n'y en a pas
+        self.journal = None
+        # Fichier projet d'où vient le document ou où il a été enregistré (voir project.py)
+        self.project = None
+
+    @classmethod
+    def from_image(cls, image, **kwargs):
+        """Créer un document de la taille d'une image, dont elle est l'état initial"""
+        document = cls(image.width, image.height, **kwargs)
+        # Historique détaché pendant le collage : une TiledImage copierait sinon chaque tuile
+        document.history.close()
+        document.image.paste(image if image.mode == "RGB" else image.convert("RGB"), (0, 0))
+        document.history.reset(document.image)
+        return document
+
+    @property
+    def layer(self):
+        """Calque actif"""
+        return self.layers[self.active]
+
+    @property
+    def image(self):
+        return self.layer.image
+
+    @property
+    def draw(self):
+        return self.layer.draw
+
+    @property
+    def history(self):
+        return self.layer.history
+
+    @property
+    def composite(self):
+        """Image aplatie des calques visibles"""
+        if self.compositor is None:
+            return self.layers[0].image
+        return self.compositor.image
+
+    @property
+    def erase_color(self):
+        """Couleur de la gomme : le fond pour le calque du fond, la transparence au-dessus"""
+        return self.background if self.active == 0 else (0, 0, 0, 0)
+
+    @property
+    def tiled(self):
+        return isinstance(self.image, TiledImage)
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def width(self):
+        return self.image.width
+
+    @property
+    def height(self):
+        return self.image.height
+
+    def apply(self, operation, commit=True):
+        """Appliquer une opération ; retourner la boîte modifiée ou None"""
+        box = operation.apply(self)
+        # Noté avant le commit, pour que la fin d'action (Commit) le suive dans le journal
+        self._record(operation)
+        if operation.records_history:
+            self.mark_dirty(box)
+            if commit:
+                self.commit()
+        return box
+
+    def _record(self, operation):
+        if self.log is not None:
+            self.log.append(operation)
+        if self.journal is not None:
+            self.journal.record(operation)
+
+    @contextmanager
+    def painting(self, box):
+        """Fournir un objet de dessin (coordonnées du document) limité à `box`.
+
+        Pour une image PIL, c'est directement self.draw. Pour une image par
+        tuiles, seule la région est extraite puis réécrite à la sortie.
+        """
+        if not self.tiled:
+            yield self.draw
+            return
+
+        region_box = clip_box(box, self.size)
+        if region_box is None:
+            # Rien de visible : dessiner dans le vide
+            yield OffsetDraw(ImageDraw.Draw(Image.new(self.image.mode, (1, 1))), (0, 0))
+            return
+        region = self.image.crop(region_box)
+        yield OffsetDraw(ImageDraw.Draw(region), region_box[:2])
+        self.image.paste(region, region_box[:2])
+
+    def stamp(self, color, xy, mask):
+        """Coller `color` sur le calque actif à travers un masque (mode « L ») de coin xy"""
+        if self.image.mode == "RGBA" and color == (0, 0, 0, 0):
+            # Gomme d'un calque : baisser l'alpha sans assombrir les couleurs du bord adouci
+            self._erase_alpha(xy, mask)
+            return
+        if not self.tiled:
+            # Image.paste ignore ce qui dépasse de l'image
+            self.image.paste(color, (xy[0], xy[1], xy[0] + mask.width, xy[1] + mask.height), mask)
+            return
+        region_box = clip_box((xy[0], xy[1], xy[0] + mask.width, xy[1] + mask.height), self.size)
+        if region_box is None:
+            return
+        region = self.image.crop(region_box)
+        region.paste(color, (xy[0] - region_box[0], xy[1] - region_box[1]), mask)
+        self.image.paste(region, region_box[:2])
+
+    def _erase_alpha(self, xy, mask):
+        """Multiplier l'alpha du calque actif par (1 - masque), couleurs inchangées"""
+        x, y = xy
+        box = clip_box((x, y, x + mask.width, y + mask.height), self.size)
+        if box is None:
+            return
+        region = self.image.crop(box)
+        mask = mask.crop((box[0] - x, box[1] - y, box[2] - x, box[3] - y))
+        region.putalpha(ImageChops.multiply(region.getchannel("A"), ImageChops.invert(mask)))
+        self.image.paste(region, box[:2])
+
+    def scatter(self, color, xs, ys):
+        """Poser des pixels isolés (tableaux de coordonnées) en une seule écriture ; retourner la boîte"""
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        xs, ys = xs[inside], ys[inside]
+        if not len(xs):
+            return None
+        box = (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+        region = np.array(self.image.crop(box))
+        region[ys - box[1], xs - box[0]] = ImageColor.getcolor(color, self.image.mode)
+        self.image.paste(Image.fromarray(region, self.image.mode), box[:2])
+        return box
+
+    def clear_region(self, box):
+        """Effacer une boîte du calque actif (couleur de la gomme) ; retourner la boîte bornée"""
+        box = clip_box(box, self.size)
+        if box is None:
+            return None
+        with self.painting(box) as draw:
+            draw.rectangle([box[0], box[1], box[2] - 1, box[3] - 1], fill=self.erase_color)
+        return box
+
+    def paste_region(self, region, xy):
+        """Coller une image PIL sur le calque actif, coin en xy ; retourner la boîte modifiée.
+
+        Une image RGBA est posée par-dessus le contenu (alpha_composite),
+        toute autre image le remplace.
+        """
+        x, y = xy
+        box = clip_box((x, y, x + region.width, y + region.height), self.size)
+        if box is None:
+            return None
+        part = region.crop((box[0] - x, box[1] - y, box[2] - x, box[3] - y))
+        if part.mode == "RGBA":
+            under = self.image.crop(box).convert("RGBA")
+            under.alpha_composite(part)
+            part = under
+        self.image.paste(part.convert(self.image.mode), box[:2])
+        return box
+
+    def backdrop(self, box):
+        """Aspect aplati d'une boîte si le calque actif y était effacé (image RGB)"""
+        if self.compositor is None:
+            return Image.new("RGB", (box[2] - box[0], box[3] - box[1]), self.background)
+        return self.compositor.backdrop(box)
+
+    def replay(self, operations):
+        """Rejouer une suite d'opérations (journal enregistré).
+
+        Les entrées d'historique sont celles de la session : seules les
+        opérations Commit enregistrées par commit() valident les modifications.
+        """
+        for operation in operations:
+            self.apply(operation, commit=False)
+
+    def mark_dirty(self, box):
+        """Noter une zone modifiée depuis le dernier commit"""
+        box = clip_box(box, self.size)
+        if box is None:
+            return
+        self.pending_box = union_box(self.pending_box, box)
+        self._notify(box)
+
+    def mark_all_dirty(self):
+        """Noter que toute l'image a changé"""
+        self.mark_dirty((0, 0, self.width, self.height))
+
+    def commit(self, mark=True):
+        """Enregistrer les zones (et les formes) modifiées dans l'historique.
+
+        Avec `mark`, la fin d'action est notée dans le journal (opération
+        Commit) : un rejeu regroupe les mêmes opérations en une entrée.
+        """
+        if self.pending_box is None and self.pending_shapes is None:
+            return False
+        box, self.pending_box = self.pending_box, None
+        shapes, self.pending_shapes = self.pending_shapes, None
+        committed = self.history.commit(self.image, box, shapes)
+        if box is not None:
+            self._pack(box)
+        if mark:
+            self._record(Commit())
+        return committed
+
+    def undo(self):
+        """Annuler la dernière action ; retourner la boîte restaurée ou None"""
+        box = self.history.undo(self.image, self.vectors)
+        if box:
+            self._restored(box)
+        return box
+
+    def redo(self):
+        """Rétablir l'action annulée ; retourner la boîte restaurée ou None"""
+        box = self.history.redo(self.image, self.vectors)
+        if box:
+            self._restored(box)
+        return box
+
+    def _restored(self, box):
+        self._pack(box)
+        if self._flat() != (self.compositor is None):
+            # Des formes sont réapparues ou ont disparu : l'aplatissement est à créer ou à retirer
+            self.recomposite()
+        else:
+            self._notify(box)
+
+    def _pack(self, box):
+        """Remettre sous forme compacte les tuiles en aplats d'une zone validée (TiledImage)"""
+        if self.tiled:
+            self.image.pack(box)
+
+    def clear(self):
+        """Remplir le document avec la couleur de fond"""
+        self.fill_background()
+        self.mark_all_dirty()
+        self.commit()
+
+    def load_image(self, image):
+        """Remplacer le contenu par `image`, collée en haut à gauche sur le fond"""
+        self.fill_background()
+        self.image.paste(image.convert(self.image.mode), (0, 0))
+        self.mark_all_dirty()
+        self.commit()
+
+    def add_shape(self, shape, shape_id=None):
+        """Ajouter une forme vectorielle ; retourne son identifiant"""
+        self._check_layers()
+        shape_id = self.vectors.add(shape, shape_id)
+        self._remember_shape(shape_id, None)
+        if self.compositor is None:
+            self.recomposite()
+        else:
+            self._notify_clipped(shape.box)
+        return shape_id
+
+    def reshape_shape(self, shape_id, points):
+        """Déplacer ou redimensionner une forme : seule la zone qu'elle couvrait et couvre est redessinée"""
+        self._remember_shape(shape_id, self.vectors.shapes[shape_id])
+        box = self.vectors.reshape(shape_id, points)
+        self._notify_clipped(box)
+        return box
+
+    def remove_shape(self, shape_id):
+        """Retirer une forme vectorielle"""
+        self._remember_shape(shape_id, self.vectors.shapes[shape_id])
+        box = self.vectors.remove(shape_id)
+        if not self.vectors:
+            self.recomposite()
+        else:
+            self._notify_clipped(box)
+        return box
+
+    def flatten_shapes(self):
+        """Dessiner toutes les formes dans le calque actif puis les retirer ; retourne la boîte modifiée"""
+        box = None
+        for shape_id, shape in self.vectors.shapes.items():
+            self._remember_shape(shape_id, shape)
+            with self.painting(shape.box) as draw:
+                shape.draw(draw)
+            box = union_box(box, shape.box)
+        self.vectors.clear()
+        self.recomposite()
+        return box
+
+    def _remember_shape(self, shape_id, shape):
+        """Noter l'état d'une forme (None : absente) avant sa première modification depuis le dernier commit"""
+        if self.pending_shapes is None:
+            self.pending_shapes = {}
+        if shape_id not in self.pending_shapes:
+            # Copie : reshape() change les points de la forme en place
+            self.pending_shapes[shape_id] = None if shape is None else replace(shape, points=list(shape.points))
+
+    def add_layer(self, name=None):
+        """Ajouter un calque transparent au-dessus du calque actif et le rendre actif"""
+        self._check_layers()
+        self.commit()
+        image = Image.new("RGBA", self.size, (0, 0, 0, 0))
+        layer = Layer(name or f"Calque {len(self.layers)}", image,
+                      TileHistory(image, memory_budget=self.history_budget, blank=(0, 0, 0, 0)))
+        self.active += 1
+        self.layers.insert(self.active, layer)
+        self.recomposite()
+        return layer
+
+    def remove_layer(self, index):
+        """Supprimer un calque (le calque du fond est conservé)"""
+        if index == 0:
+            raise ValueError("Le calque de fond ne peut pas être supprimé")
+        self.commit()
+        layer = self.layers.pop(index)
+        layer.history.close()
+        if self.active >= index:
+            self.active -= 1
+        self.recomposite()
+
+    def select_layer(self, index):
+        """Changer de calque actif (chaque calque a son propre historique)"""
+        if not 0 <= index < len(self.layers):
+            raise IndexError(index)
+        if index == self.active:
+            return
+        self.commit()
+        self.active = index
+        self.recomposite()
+
+    def set_layer(self, index, opacity=None, visible=None):
+        """Changer l'opacité (0 à 1) et/ou la visibilité d'un calque"""
+        self._check_layers()
+        layer = self.layers[index]
+        if opacity is not None:
+            layer.opacity = max(0.0, min(1.0, opacity))
+        if visible is not None:
+            layer.visible = visible
+        self.recomposite()
+
+    def close(self):
+        """Libérer le stockage (fichier temporaire des images par tuiles)"""
+        for layer in self.layers:
+            layer.history.close()
+        if self.tiled:
+            self.image.close()
+
+    def _check_layers(self):
+        if self.tiled:
+            raise ValueError("Les calques ne sont pas disponibles pour les images par tuiles")
+
+    def recomposite(self):
+        """Recalculer l'aplatissement (pile de calques modifiée, pixels collés directement)"""
+        if self._flat():
+            self.compositor = None
+        elif self.compositor is None:
+            self.compositor = Compositor(self.layers, self.active, self.background, self.vectors)
+        else:
+            self.compositor.rebuild(self.active)
+        for observer in self.observers:
+            observer((0, 0, self.width, self.height))
+
+    def _flat(self):
+        """Vrai si le calque du fond, seul, opaque et sans formes, suffit à l'affichage"""
+        base = self.layers[0]
+        return len(self.layers) == 1 and base.visible and base.opacity >= 1 and not self.vectors
+
+    def fill_background(self):
+        """Effacer le calque actif (fond : couleur du document, au-dessus : transparence)"""
+        if self.tiled:
+            self.image.clear()
+        else:
+            self.draw.rectangle([0, 0, self.width, self.height], fill=self.erase_color)
+
+    def _notify_clipped(self, box):
+        box = clip_box(box, self.size)
+        if box is not None:
+            self._notify(box)
+
+    def _notify(self, box):
+        # L'image aplatie est à jour avant que les observateurs ne la lisent
+        if self.compositor is not None:
+            self.compositor.update(box)
+        for observer in self.observers:
+            observer(box)
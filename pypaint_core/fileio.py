@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Ouverture et sauvegarde des fichiers image de PyPaint
+"""
+
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+
+# Taille maximale acceptée à l'ouverture (affiches, scans de 20 000 px de côté)
+MAX_IMAGE_PIXELS = 25000 * 25000
+
+
+def _allow_large_images():
+    if Image.MAX_IMAGE_PIXELS is not None and Image.MAX_IMAGE_PIXELS < MAX_IMAGE_PIXELS:
+        Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+def image_info(filepath):
+    """Format et taille (largeur, hauteur) d'une image, lus sans la décoder"""
+    _allow_large_images()
+    with Image.open(filepath) as img:
+        return img.format, img.size
+
+
+def open_image(filepath, max_size=None):
+    """Ouvrir une image en RGB, réduite si besoin pour tenir dans max_size (largeur, hauteur).
+
+    Un JPEG est réduit dès le décodage (draft : DCT à 1/2, 1/4 ou 1/8),
+    les autres formats par reduce() avant le rééchantillonnage final.
+    """
+    _allow_large_images()
+
+    img = Image.open(filepath)
+    if max_size and (img.width > max_size[0] or img.height > max_size[1]):
+        img.draft("RGB", max_size)
+        img.thumbnail(max_size, reducing_gap=2.0)
+    return img.convert("RGB")
+
+
+def save_image(image, filepath, progress=None, **options):
+    """Enregistrer une image ; le format est déduit de l'extension.
+
+    Une TiledImage (ou son instantané) RGB est écrite en PNG bande par
+    bande, sans être assemblée en mémoire, et `progress` (fonction
+    recevant une fraction de 0 à 1) suit l'avancement. Une image PIL,
+    comme les autres formats, passe par l'encodeur de Pillow (qui
+    choisit mieux ses filtres PNG).
+    """
+    if (not isinstance(image, Image.Image) and image.mode == "RGB"
+            and os.path.splitext(filepath)[1].lower() == ".png"):
+        _save_png_by_bands(image, filepath, options.get("compress_level", 6), progress)
+        return
+    if hasattr(image, "to_image"):
+        image = image.to_image()
+    image.save(filepath, **options)
+    if progress:
+        progress(1.0)
+
+
+def _save_png_by_bands(image, filepath, compress_level, progress=None):
+    """Écrire un PNG RGB 8 bits en compressant une bande de lignes à la fois"""
+    width, height = image.size
+    band = getattr(image, "tile_size", 256)
+    compressor = zlib.compressobj(compress_level)
+    with open(filepath, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        _write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+        for y0 in range(0, height, band):
+            rows = _read_rows(image, y0, min(height, y0 + band))
+            flat = rows.reshape(rows.shape[0], width * 3)
+
+            # Filtre PNG « Sub » : écart avec le pixel de gauche (modulo 256)
+            filtered = np.empty((rows.shape[0], width * 3 + 1), dtype=np.uint8)
+            filtered[:, 0] = 1
+            filtered[:, 1:4] = flat[:, :3]
+            np.subtract(flat[:, 3:], flat[:, :-3], out=filtered[:, 4:])
+
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                _write_chunk(f, b"IDAT", data)
+            if progress:
+                progress(min(height, y0 + band) / height)
+
+        _write_chunk(f, b"IDAT", compressor.flush())
+        _write_chunk(f, b"IEND", b"")
+
+
+def _read_rows(image, y0, y1):
+    """Lignes y0..y1 d'une image PIL ou par tuiles, en tableau (lignes, largeur, 3)"""
+    box = (0, y0, image.width, y1)
+    if hasattr(image, "read"):
+        return image.read(box)
+    return np.asarray(image.crop(box))
+
+
+class FileJob:
+    """Ouverture ou enregistrement dans un thread, suivi sans bloquer l'interface.
+
+    `target` reçoit le job lui-même (pour appeler report()) ; sa valeur
+    de retour est rangée dans `result`, son exception dans `error`.
+    """
+
+    def __init__(self, target):
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self._thread = threading.Thread(target=self._run, args=(target,), daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def report(self, fraction):
+        """Noter l'avancement (0 à 1)"""
+        self.progress = fraction
+
+    def done(self):
+        return not self._thread.is_alive()
+
+    def wait(self):
+        """Attendre la fin du travail"""
+        self._thread.join()
+
+    def _run(self, target):
+        try:
+            self.result = target(self)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.progress = 1.0
+
+
+def save_in_background(image, filepath, **options):
+    """Enregistrer dans un thread un instantané de `image` ; retourne le FileJob démarré.
+
+    Une TiledImage fournit un instantané par copie sur écriture ; une
+    image PIL est copiée (opération rapide, en mémoire). L'image peut
+    donc continuer à être modifiée pendant l'enregistrement.
+    """
+    snapshot = image.snapshot() if hasattr(image, "snapshot") else image.copy()
+
+    def target(job):
+        try:
+            save_image(snapshot, filepath, progress=job.report, **options)
+        finally:
+            if hasattr(snapshot, "release"):
+                snapshot.release()
+
+    return FileJob(target).start()
+
+
+def open_in_background(filepath, max_size=None):
+    """Ouvrir une image dans un thread ; retourne le FileJob démarré (résultat : l'image)"""
+    return FileJob(lambda job: open_image(filepath, max_size)).start()
+
+
+def _write_chunk(f, kind, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(kind)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Remplissage par segments horizontaux (scanline) pour PyPaint
+"""
+
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+
+# Nombre de lignes analysées d'un coup lors du calcul des segments
+BAND_HEIGHT = 128
+
+
+class _RowRuns:
+    """Segments de pixels compatibles avec la couleur cible, calculés par bandes"""
+
+    def __init__(self, read_rows, width, height, target, tolerance):
+        self.read_rows = read_rows
+        self.width = width
+        self.height = height
+        self.target = target
+        self.tolerance = tolerance
+        self.rows = {}
+
+    def get(self, y):
+        """Retourner les listes (débuts, fins) des segments de la ligne y"""
+        runs = self.rows.get(y)
+        if runs is None:
+            self._compute_band(y // BAND_HEIGHT)
+            runs = self.rows[y]
+        return runs
+
+    def _compute_band(self, band):
+        """Calculer les segments d'une bande de lignes en une seule passe NumPy"""
+        y0 = band * BAND_HEIGHT
+        y1 = min(self.height, y0 + BAND_HEIGHT)
+        block = self.read_rows(y0, y1)
+
+        # Comparaison canal par canal, plus rapide qu'un all()/max() sur l'axe 2
+        mask = np.ones(block.shape[:2], dtype=bool)
+        for channel, value in enumerate(self.target.tolist()):
+            plane = block[:, :, channel]
+            if self.tolerance > 0:
+                mask &= np.abs(plane.astype(np.int16) - value) <= self.tolerance
+            else:
+                mask &= plane == value
+
+        # Encadrer chaque ligne de False pour que les transitions marquent les bornes
+        padded = np.zeros((y1 - y0, self.width + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        start_rows, start_cols = np.nonzero(edges == 1)
+        end_cols = np.nonzero(edges == -1)[1]
+
+        counts = np.bincount(start_rows, minlength=y1 - y0)
+        offsets = np.concatenate(([0], np.cumsum(counts))).tolist()
+        starts = start_cols.tolist()
+        ends = end_cols.tolist()
+        for i in range(y1 - y0):
+            a, b = offsets[i], offsets[i + 1]
+            self.rows[y0 + i] = (starts[a:b], ends[a:b])
+
+
+def find_spans(read_rows, width, height, x, y, color, tolerance=0):
+    """Trouver la zone connexe (4 voisins) contenant (x, y).
+
+    `read_rows(y0, y1)` retourne les lignes y0..y1 sous forme de tableau
+    (lignes, largeur, canaux). Retourne les tableaux (lignes, débuts, fins)
+    des segments à remplir, ou None si le remplissage ne changerait rien.
+    """
+    if not (0 <= x < width and 0 <= y < height):
+        return None
+
+    target = np.asarray(read_rows(y, y + 1)[0, x]).copy()
+    color = np.asarray(color, dtype=target.dtype).reshape(-1)
+    if tolerance <= 0 and np.array_equal(target, color):
+        return None
+
+    runs = _RowRuns(read_rows, width, height, target, tolerance)
+    rows = runs.rows
+    starts, _ = runs.get(y)
+    seed = bisect_right(starts, x) - 1
+
+    visited = {y: {seed}}
+    stack = [(y, seed)]
+    span_rows = []
+    span_starts = []
+    span_ends = []
+    while stack:
+        row, index = stack.pop()
+        row_starts, row_ends = rows[row]
+        start, end = row_starts[index], row_ends[index]
+        span_rows.append(row)
+        span_starts.append(start)
+        span_ends.append(end)
+
+        for next_row in (row - 1, row + 1):
+            if next_row < 0 or next_row >= height:
+                continue
+            next_runs = rows.get(next_row) or runs.get(next_row)
+            # Segments de la ligne voisine qui chevauchent [start, end)
+            lo = bisect_right(next_runs[1], start)
+            hi = bisect_left(next_runs[0], end)
+            if lo >= hi:
+                continue
+            seen = visited.get(next_row)
+            if seen is None:
+                seen = visited[next_row] = set()
+            for j in range(lo, hi):
+                if j not in seen:
+                    seen.add(j)
+                    stack.append((next_row, j))
+
+    return np.array(span_rows), np.array(span_starts), np.array(span_ends)
+
+
+def spans_box(spans):
+    """Boîte (x0, y0, x1, y1) couverte par des segments"""
+    rows, starts, ends = spans
+    return (int(starts.min()), int(rows.min()), int(ends.max()), int(rows.max()) + 1)
+
+
+def spans_mask(spans, box):
+    """Masque booléen (hauteur, largeur) des segments à l'intérieur de `box`"""
+    x0, y0, x1, y1 = box
+    rows, starts, ends = spans
+    inside = (rows >= y0) & (rows < y1)
+    rows = rows[inside]
+    starts = np.clip(starts[inside], x0, x1)
+    ends = np.clip(ends[inside], x0, x1)
+
+    # +1 au début de chaque segment, -1 à sa fin, puis somme cumulée le long des lignes
+    box_width = x1 - x0 + 1
+    size = (y1 - y0) * box_width
+    offsets = (rows - y0) * box_width - x0
+    marks = np.bincount(offsets + starts, minlength=size).astype(np.int32)
+    marks -= np.bincount(offsets + ends, minlength=size).astype(np.int32)
+    return np.cumsum(marks).reshape(y1 - y0, box_width)[:, :-1] > 0
+
+
+def apply_mask(pixels, mask, color):
+    """Peindre `color` sur les pixels (hauteur, largeur, canaux) désignés par `mask`"""
+    for channel, value in enumerate(np.asarray(color).reshape(-1).tolist()):
+        pixels[:, :, channel][mask] = value
+
+
+def scanline_fill(pixels, x, y, color, tolerance=0):
+    """Remplir en place la zone connexe (4 voisins) contenant (x, y).
+
+    `pixels` est un tableau NumPy (hauteur, largeur[, canaux]) modifié en place.
+    Retourne la boîte (x0, y0, x1, y1) modifiée, bornes hautes exclues,
+    ou None si rien n'a changé.
+    """
+    height, width = pixels.shape[:2]
+    view = pixels if pixels.ndim == 3 else pixels[:, :, np.newaxis]
+    spans = find_spans(lambda y0, y1: view[y0:y1], width, height, x, y, color, tolerance)
+    if spans is None:
+        return None
+
+    box = spans_box(spans)
+    x0, y0, x1, y1 = box
+    apply_mask(view[y0:y1, x0:x1], spans_mask(spans, box), color)
+    return box
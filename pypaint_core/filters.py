@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+"""
+Filtres d'image vectorisés (NumPy), appliqués par tuiles sur un pool de threads
+"""
+
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+
+import numpy as np
+from PIL import Image
+
+from .pyramid import ImagePyramid
+from .regions import clip_box
+
+
+FILTERS = {}
+
+
+def register_filter(cls):
+    """Déclarer une classe de filtre sous son nom `name`"""
+    FILTERS[cls.name] = cls
+    return cls
+
+
+def make_filter(name, params=None):
+    """Construire un filtre depuis son nom et ses paramètres"""
+    try:
+        cls = FILTERS[name]
+    except KeyError:
+        raise ValueError(f"Filtre inconnu: {name}") from None
+    return cls(**(params or {}))
+
+
+class TileFilter:
+    """Base des filtres : un noyau NumPy appliqué indépendamment à chaque tuile"""
+
+    name = None
+    label = None
+
+    # Paramètres réglables : (attribut, libellé, minimum, maximum)
+    PARAMETERS = ()
+
+    @property
+    def margin(self):
+        """Voisinage lu autour de chaque tuile pour que les bords soient exacts"""
+        return 0
+
+    def scaled(self, factor):
+        """Filtre équivalent sur une image réduite d'un facteur `factor` (aperçu)"""
+        return self
+
+    def process(self, pixels):
+        """Filtrer un tableau (hauteur, largeur, canaux) uint8 ; retourner un nouveau tableau"""
+        raise NotImplementedError
+
+
+def _box_blur(data, radius):
+    """Moyenne glissante de largeur 2 * radius + 1 le long du premier axe (sommes cumulées)"""
+    width = 2 * radius + 1
+    padded = np.concatenate((
+        np.repeat(data[:1], radius + 1, axis=0),
+        data,
+        np.repeat(data[-1:], radius, axis=0),
+    ))
+    sums = np.cumsum(padded, axis=0)
+    return (sums[width:] - sums[:-width]) / width
+
+
+@register_filter
+@dataclass
+class GaussianBlur(TileFilter):
+    """Flou gaussien approché par trois flous en boîte successifs"""
+
+    name = "blur"
+    label = "Flou"
+    PARAMETERS = (("radius", "Rayon", 0, 50),)
+
+    radius: float = 2.0
+
+    @property
+    def box_radius(self):
+        # Trois boîtes de largeur w ont la variance d'une gaussienne : 3 (w² - 1) / 12 = σ²
+        return int(round((math.sqrt(4 * self.radius ** 2 + 1) - 1) / 2))
+
+    @property
+    def margin(self):
+        return 3 * self.box_radius
+
+    def scaled(self, factor):
+        return GaussianBlur(self.radius * factor)
+
+    def process(self, pixels):
+        radius = self.box_radius
+        if radius < 1:
+            return pixels.copy()
+        # Les passes commutent : toutes les verticales, puis toutes les
+        # horizontales sur une copie transposée (sommes le long d'un axe contigu)
+        data = pixels.astype(np.float32)
+        alpha = data.shape[2] == 4
+        if alpha:
+            # Couleurs prémultipliées : un pixel transparent ne déteint pas sur les bords
+            data[:, :, :3] *= data[:, :, 3:] / 255
+        for _ in range(3):
+            data = _box_blur(data, radius)
+        data = np.ascontiguousarray(data.swapaxes(0, 1))
+        for _ in range(3):
+            data = _box_blur(data, radius)
+        data = data.swapaxes(0, 1)
+        if alpha:
+            coverage = data[:, :, 3:]
+            data[:, :, :3] = np.where(coverage > 0, data[:, :, :3] * 255 / np.maximum(coverage, 1e-3), 0)
+        return np.clip(data + 0.5, 0, 255).astype(np.uint8)
+
+
+@register_filter
+@dataclass
+class BrightnessContrast(TileFilter):
+    """Luminosité et contraste (-100 à 100), par table de correspondance"""
+
+    name = "brightness_contrast"
+    label = "Luminosité / contraste"
+    PARAMETERS = (("brightness", "Luminosité", -100, 100), ("contrast", "Contraste", -100, 100))
+
+    brightness: float = 0.0
+    contrast: float = 0.0
+
+    def process(self, pixels):
+        c = max(-254.0, min(254.0, self.contrast * 2.55))
+        factor = 259 * (c + 255) / (255 * (259 - c))
+        levels = np.arange(256, dtype=np.float32)
+        lut = np.clip(factor * (levels - 128) + 128 + self.brightness * 2.55 + 0.5, 0, 255).astype(np.uint8)
+        out = lut[pixels]
+        if out.shape[2] == 4:
+            # La transparence n'est pas un niveau de luminosité
+            out[:, :, 3] = pixels[:, :, 3]
+        return out
+
+
+class FilterJob:
+    """Application d'un filtre tuile par tuile sur un pool de threads.
+
+    Chaque tuile est lue avec la marge du filtre, filtrée puis rognée.
+    Les tuiles sont calculées par rangées, quelques-unes à la fois : une
+    rangée est écrite (advance(), write()) dès que les rangées dont la
+    marge la lit sont calculées, puis ses résultats sont oubliés. Seules
+    ces quelques rangées sont donc en mémoire, même pour une grande
+    image par tuiles. L'écriture se fait depuis le thread qui possède
+    l'image (l'interface, par exemple).
+    """
+
+    def __init__(self, image, image_filter, box=None, tile_size=256):
+        self.image = image
+        self.filter = image_filter
+        self.box = clip_box(box or (0, 0) + tuple(image.size), image.size)
+        self.rows = []
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            for ty in range(y0, y1, tile_size):
+                self.rows.append([
+                    (tx, ty, min(x1, tx + tile_size), min(y1, ty + tile_size)) for tx in range(x0, x1, tile_size)
+                ])
+        # Rangées voisines lues par la marge du filtre, de part et d'autre d'une rangée
+        self.reach = -(-image_filter.margin // tile_size)
+        self.executor = None
+        self.futures = {}
+        self.submitted = 0
+        self.written = 0
+
+    def start(self, executor):
+        """Soumettre les premières rangées à un exécuteur (concurrent.futures)"""
+        self.executor = executor
+        self._submit()
+        return self
+
+    def run(self, workers=None):
+        """Calculer et écrire toutes les tuiles sur un pool créé pour l'occasion ; retourner la boîte"""
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            return self.start(executor).write(self.image)
+
+    @property
+    def progress(self):
+        """Fraction des tuiles calculées (0 à 1)"""
+        total = sum(len(row) for row in self.rows)
+        if not total:
+            return 1.0
+        computed = sum(len(row) for row in self.rows[:self.written])
+        computed += sum(future.done() for futures in self.futures.values() for future in futures)
+        return computed / total
+
+    def done(self):
+        """Vrai quand toutes les tuiles sont calculées (advance() soumet les dernières rangées)"""
+        return self.submitted == len(self.rows) and all(
+            future.done() for futures in self.futures.values() for future in futures
+        )
+
+    def cancel(self):
+        """Abandonner les tuiles pas encore calculées (les rangées déjà écrites le restent)"""
+        for futures in self.futures.values():
+            for future in futures:
+                future.cancel()
+
+    def advance(self, image, block=False):
+        """Écrire dans `image` les rangées prêtes et soumettre les suivantes.
+
+        Sans `block`, ne fait qu'écrire ce qui est déjà calculé (appel
+        périodique depuis l'interface).
+        """
+        while self.written < len(self.rows):
+            # Les rangées suivantes lisent celle-ci dans leur marge : attendre qu'elles soient calculées
+            last = min(len(self.rows), self.written + self.reach + 1)
+            needed = [future for row in range(self.written, last) for future in self.futures[row]]
+            if block:
+                wait(needed)
+            elif not all(future.done() for future in needed):
+                return
+            for future in self.futures.pop(self.written):
+                (x0, y0, _, _), pixels = future.result()
+                image.paste(Image.fromarray(pixels, image.mode), (x0, y0))
+            self.written += 1
+            self._submit()
+
+    def write(self, image):
+        """Recopier toutes les tuiles filtrées dans `image` ; retourner la boîte modifiée"""
+        self.advance(image, block=True)
+        return self.box
+
+    def _submit(self):
+        # La rangée écrite, celles que sa marge atteint, et une d'avance pour occuper le pool
+        while self.submitted < min(len(self.rows), self.written + self.reach + 2):
+            self.futures[self.submitted] = [
+                self.executor.submit(self._process, tile_box) for tile_box in self.rows[self.submitted]
+            ]
+            self.submitted += 1
+
+    def _process(self, tile_box):
+        x0, y0, x1, y1 = tile_box
+        margin = self.filter.margin
+        outer = clip_box((x0 - margin, y0 - margin, x1 + margin, y1 + margin), self.image.size)
+        pixels = _read(self.image, outer)
+        out = self.filter.process(pixels)
+        ox, oy = x0 - outer[0], y0 - outer[1]
+        return tile_box, np.ascontiguousarray(out[oy:oy + y1 - y0, ox:ox + x1 - x0])
+
+
+def _read(image, box):
+    """Pixels (hauteur, largeur, canaux) d'une boîte, pour une image PIL ou par tuiles"""
+    if hasattr(image, "read"):
+        return image.read(box)
+    return np.asarray(image.crop(box))
+
+
+def make_proxy(image, max_size=(480, 360)):
+    """Copie réduite d'une image pour l'aperçu des filtres ; retourne (copie, facteur)"""
+    width, height = image.size
+    factor = min(1.0, max_size[0] / width, max_size[1] / height)
+    size = (max(1, round(width * factor)), max(1, round(height * factor)))
+    if isinstance(image, Image.Image):
+        proxy = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    else:
+        proxy = ImagePyramid(image).render((0, 0, width, height), size)
+    return proxy, factor
+
+
+def preview_filter(proxy, image_filter, factor):
+    """Appliquer un filtre à la copie réduite, réglages mis à son échelle"""
+    pixels = image_filter.scaled(factor).process(np.asarray(proxy))
+    return Image.fromarray(pixels, proxy.mode)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Polices du texte : recherche sur le disque, cache des polices et des textes rendus
+"""
+
+import os
+import re
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+# Police demandée par défaut, puis familles équivalentes essayées dans l'ordre
+DEFAULT_FAMILY = "Arial"
+FALLBACK_FAMILIES = ("Arial", "Helvetica", "Liberation Sans", "DejaVu Sans", "Noto Sans", "FreeSans")
+
+FONT_EXTENSIONS = (".ttf", ".otf", ".ttc")
+
+# Suffixes de style retirés pour retrouver la variante normale d'une famille
+_REGULAR_SUFFIXES = ("regular", "book", "roman", "normal")
+
+# Texte rendu : masque de couverture (mode « L ») et sa boîte relative au point d'ancrage
+TextRaster = namedtuple("TextRaster", "mask bbox")
+
+
+def font_directories():
+    """Dossiers de polices du système et de l'utilisateur"""
+    home = os.path.expanduser("~")
+    if sys.platform.startswith("win"):
+        windir = os.environ.get("WINDIR", r"C:\Windows")
+        local = os.environ.get("LOCALAPPDATA", "")
+        return [os.path.join(windir, "Fonts"), os.path.join(local, "Microsoft", "Windows", "Fonts")]
+    if sys.platform == "darwin":
+        return ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.join(home, ".local", "share"))
+    return [
+        "/usr/share/fonts",
+        "/usr/local/share/fonts",
+        os.path.join(data_home, "fonts"),
+        os.path.join(home, ".fonts"),
+    ]
+
+
+def _normalize(name):
+    """Clé de recherche d'une famille : minuscules, sans espaces ni tirets"""
+    return re.sub(r"[^0-9a-z]", "", name.lower())
+
+
+class FontIndex:
+    """Index des fichiers de polices trouvés sur le disque, construit une seule fois.
+
+    Les fichiers sont indexés par leur nom normalisé (« DejaVuSans.ttf »
+    donne « dejavusans ») : on évite ainsi d'ouvrir chaque police au
+    démarrage. Le parcours des dossiers n'a lieu qu'à la première recherche.
+    """
+
+    def __init__(self, directories=None):
+        self.directories = font_directories() if directories is None else directories
+        self._paths = None
+
+    @property
+    def paths(self):
+        """Dictionnaire nom normalisé -> chemin du fichier"""
+        if self._paths is None:
+            self._paths = self._scan()
+        return self._paths
+
+    @property
+    def families(self):
+        """Noms des polices disponibles, triés"""
+        return sorted(os.path.splitext(os.path.basename(path))[0] for path in self.paths.values())
+
+    def _scan(self):
+        paths = {}
+        for directory in self.directories:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    stem, ext = os.path.splitext(name)
+                    if ext.lower() in FONT_EXTENSIONS:
+                        paths.setdefault(_normalize(stem), os.path.join(root, name))
+        return paths
+
+    def find(self, family):
+        """Chemin du fichier de la variante normale d'une famille, ou None"""
+        key = _normalize(family)
+        for candidate in (key,) + tuple(key + suffix for suffix in _REGULAR_SUFFIXES):
+            path = self.paths.get(candidate)
+            if path is not None:
+                return path
+        return None
+
+    def resolve(self, family):
+        """Chemin de la famille demandée, sinon de la première famille de repli présente"""
+        for name in (family,) + FALLBACK_FAMILIES:
+            path = self.find(name)
+            if path is not None:
+                return path
+        return None
+
+
+_index = None
+
+
+def font_index():
+    """Index partagé des polices du système"""
+    global _index
+    if _index is None:
+        _index = FontIndex()
+    return _index
+
+
+@lru_cache(maxsize=32)
+def get_font(family, size):
+    """Police chargée pour (famille, taille), avec repli sur la police intégrée de Pillow"""
+    path = font_index().resolve(family)
+    if path is not None:
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError:
+            pass
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:
+        # Pillow < 10.1 : police bitmap de taille fixe
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=256)
+def render_text(text, family, size):
+    """Rendre un texte une fois pour toutes ; les textes répétés viennent du cache"""
+    font = get_font(family, size)
+    x0, y0, x1, y1 = _MEASURE.textbbox((0, 0), text, font=font)
+    mask = Image.new("L", (max(0, x1 - x0), max(0, y1 - y0)))
+    if x1 > x0 and y1 > y0:
+        ImageDraw.Draw(mask).text((-x0, -y0), text, fill=255, font=font)
+    return TextRaster(mask, (x0, y0, x1, y1))
+
+
+# Surface minimale pour mesurer du texte sans dessiner
+_MEASURE = ImageDraw.Draw(Image.new("L", (1, 1)))
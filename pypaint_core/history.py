@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+"""
+Historique d'annulation par tuiles modifiées pour PyPaint
+"""
+
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from .compact import CompactTile, encode_tile
+from .regions import union_box
+
+
+class _Delta:
+    """Tuiles (et formes vectorielles) à restaurer pour annuler (ou rétablir) une opération"""
+
+    __slots__ = ("tiles", "box", "shapes", "nbytes")
+
+    def __init__(self, tiles, box, shapes=None):
+        # tiles : liste de (boîte de la tuile, octets éventuellement compressés)
+        self.tiles = tiles
+        self.box = box
+        # shapes : état des formes modifiées, par identifiant (voir VectorLayer.restore)
+        self.shapes = shapes
+        self.nbytes = sum(len(data) for _, data in tiles)
+
+
+class _ArrayReference:
+    """Copie complète du dernier état validé, comparée à l'image à chaque commit"""
+
+    def __init__(self, image, tile_size):
+        self.pixels = np.array(image)
+        self.tile_size = tile_size
+
+    @property
+    def nbytes(self):
+        return self.pixels.nbytes
+
+    def changed_tiles(self, image, box):
+        """Tuiles de `box` qui diffèrent de la référence : [(boîte, pixels avant)]"""
+        x0, y0, x1, y1 = box
+        current = np.asarray(image.crop(box))
+        reference = self.pixels[y0:y1, x0:x1]
+        changed = current != reference
+        if changed.ndim == 3:
+            changed = changed.any(axis=2)
+        if not changed.any():
+            return []
+
+        # Réduire le masque des pixels modifiés à un masque par tuile
+        size = self.tile_size
+        rows = np.arange(0, y1 - y0, size)
+        cols = np.arange(0, x1 - x0, size)
+        per_tile = np.logical_or.reduceat(np.logical_or.reduceat(changed, rows, axis=0), cols, axis=1)
+
+        tiles = []
+        for ty, tx in zip(*np.nonzero(per_tile)):
+            tile_box = (
+                x0 + int(cols[tx]),
+                y0 + int(rows[ty]),
+                min(x1, x0 + int(cols[tx]) + size),
+                min(y1, y0 + int(rows[ty]) + size),
+            )
+            tiles.append((tile_box, self.read(tile_box).copy()))
+
+        # Mettre à jour la référence avec l'état courant
+        reference[...] = current
+        return tiles
+
+    def read(self, tile_box):
+        x0, y0, x1, y1 = tile_box
+        return self.pixels[y0:y1, x0:x1]
+
+    def restore(self, image, tile_box, pixels):
+        x0, y0, x1, y1 = tile_box
+        self.pixels[y0:y1, x0:x1] = pixels
+        image.paste(Image.fromarray(pixels, image.mode), tile_box[:2])
+
+    def detach(self):
+        pass
+
+
+class _CompactReference:
+    """Dernier état validé, tuile par tuile sous forme compacte (voir compact.py).
+
+    Un dessin en aplats n'occupe qu'une fraction de la copie complète ;
+    une tuile où l'on peint une photo ou un dégradé est simplement gardée
+    en brut. Pour une image unie de couleur connue (`blank`), rien n'est
+    lu ni encodé : chaque tuile vaut cette couleur jusqu'à son premier
+    commit.
+    """
+
+    def __init__(self, image, tile_size, blank=None):
+        self.tile_size = tile_size
+        self.size = image.size
+        self.tiles = {}
+        self.blank = blank
+        self._pixel_shape = np.asarray(image.crop((0, 0, 1, 1))).shape[2:]
+        if blank is not None:
+            return
+        pixels = np.asarray(image)
+        for y in range(0, image.height, tile_size):
+            for x in range(0, image.width, tile_size):
+                self.tiles[(x // tile_size, y // tile_size)] = encode_tile(pixels[y:y + tile_size, x:x + tile_size])
+
+    @property
+    def nbytes(self):
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def _tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            size = self.tile_size
+            width, height = self.size
+            shape = (min(size, height - key[1] * size), min(size, width - key[0] * size)) + self._pixel_shape
+            tile = self.tiles[key] = CompactTile.filled(shape, self.blank)
+        return tile
+
+    def changed_tiles(self, image, box):
+        """Tuiles de `box` (alignée sur la grille) qui diffèrent de la référence : [(boîte, pixels avant)]"""
+        x0, y0, x1, y1 = box
+        current = np.asarray(image.crop(box))
+        size = self.tile_size
+        tiles = []
+        for y in range(y0, y1, size):
+            for x in range(x0, x1, size):
+                pixels = current[y - y0:y - y0 + size, x - x0:x - x0 + size]
+                key = (x // size, y // size)
+                reference = self._tile(key)
+                if reference.equals(pixels):
+                    continue
+                tile_box = (x, y, x + pixels.shape[1], y + pixels.shape[0])
+                tiles.append((tile_box, reference.decode()))
+                # Mettre à jour la référence avec l'état courant
+                self.tiles[key] = encode_tile(pixels)
+        return tiles
+
+    def read(self, tile_box):
+        return self._tile((tile_box[0] // self.tile_size, tile_box[1] // self.tile_size)).decode()
+
+    def restore(self, image, tile_box, pixels):
+        self.tiles[(tile_box[0] // self.tile_size, tile_box[1] // self.tile_size)] = encode_tile(pixels)
+        image.paste(Image.fromarray(pixels, image.mode), tile_box[:2])
+
+    def detach(self):
+        pass
+
+
+class _CopyOnWriteReference:
+    """Pour une TiledImage : chaque tuile est copiée juste avant sa première modification.
+
+    Aucune copie complète de l'image n'est nécessaire ; seules les tuiles
+    touchées depuis le dernier commit sont conservées.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.saved = {}
+        image.write_hooks.append(self._save)
+
+    @property
+    def nbytes(self):
+        return sum(pixels.nbytes for pixels in self.saved.values())
+
+    def _save(self, tx, ty):
+        if (tx, ty) not in self.saved:
+            self.saved[(tx, ty)] = self.image.read(self.image.tile_box(tx, ty))
+
+    def changed_tiles(self, image, box):
+        tiles = []
+        for (tx, ty), before in sorted(self.saved.items()):
+            tile_box = image.tile_box(tx, ty)
+            if not np.array_equal(image.read(tile_box), before):
+                tiles.append((tile_box, before))
+        self.saved.clear()
+        return tiles
+
+    def read(self, tile_box):
+        return self.image.read(tile_box)
+
+    def restore(self, image, tile_box, pixels):
+        image.write(tile_box[:2], pixels, hook=False)
+
+    def detach(self):
+        if self._save in self.image.write_hooks:
+            self.image.write_hooks.remove(self._save)
+
+
+class TileHistory:
+    """Historique Undo/Redo qui ne conserve que les tuiles modifiées.
+
+    Une copie de référence du dernier état validé permet de calculer le
+    différentiel de chaque opération (pour une TiledImage, les tuiles sont
+    plutôt copiées juste avant d'être modifiées). Avec `compact`, cette
+    référence est gardée par tuiles compactes. Chaque entrée ne garde que l'état
+    des tuiles à restaurer ; annuler et rétablir coûtent donc en
+    proportion de la surface modifiée. La mémoire des entrées est bornée
+    par `memory_budget` (octets) : les plus anciennes sont oubliées.
+    Une entrée garde aussi l'état antérieur des formes vectorielles que
+    l'opération a changées, pour que leur annulation suive le même ordre.
+    """
+
+    def __init__(self, image, tile_size=64, memory_budget=64 * 1024 * 1024, compress=True, compact=True,
+                 blank=None):
+        self.tile_size = tile_size
+        self.memory_budget = memory_budget
+        self.compress = compress
+        self.compact = compact
+        self.reset(image, blank)
+
+    def reset(self, image, blank=None):
+        """Repartir d'un historique vide dont l'état de référence est `image`.
+
+        `blank` est la couleur (une valeur par canal) d'une image encore
+        unie, document neuf ou calque vide : la référence compacte n'a
+        alors pas à être lue.
+        """
+        if getattr(self, "_reference", None) is not None:
+            self._reference.detach()
+        self.mode = image.mode
+        self.size = image.size
+        if hasattr(image, "write_hooks"):
+            self._reference = _CopyOnWriteReference(image)
+        elif self.compact:
+            self._reference = _CompactReference(image, self.tile_size, blank)
+        else:
+            self._reference = _ArrayReference(image, self.tile_size)
+        self._pixel_shape = np.asarray(image.crop((0, 0, 1, 1))).shape[2:]
+        self._undo = []
+        self._redo = []
+        self.memory_used = 0
+
+    def close(self):
+        """Libérer l'état de référence et les entrées"""
+        self._reference.detach()
+        self._reference = None
+        self._undo = []
+        self._redo = []
+        self.memory_used = 0
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    @property
+    def redo_count(self):
+        return len(self._redo)
+
+    @property
+    def total_memory(self):
+        """Mémoire totale : entrées + état de référence"""
+        return self.memory_used + self._reference.nbytes
+
+    def __len__(self):
+        return len(self._undo)
+
+    def commit(self, image, box=None, shapes=None):
+        """Enregistrer les tuiles modifiées depuis le dernier état validé.
+
+        `box` (x0, y0, x1, y1) limite la recherche à la zone touchée par
+        l'opération ; sans boîte, toute l'image est comparée (sauf si
+        seules des formes ont changé). `shapes` est l'état antérieur des
+        formes vectorielles modifiées, restauré avec les tuiles.
+        Retourne True si une entrée a été ajoutée.
+        """
+        if image.mode != self.mode or image.size != self.size:
+            # Document remplacé par une image d'une autre taille : pas de différentiel possible
+            self.reset(image)
+            return False
+
+        tiles = []
+        if box is not None or not shapes:
+            tiles = self._reference.changed_tiles(image, self._snap(box))
+        if not tiles and not shapes:
+            return False
+        tiles = [(tile_box, self._pack(pixels)) for tile_box, pixels in tiles]
+
+        self._drop(self._redo)
+        self._push(self._undo, _Delta(tiles, self._bounds(tiles) if tiles else None, shapes or None))
+        self._trim()
+        return True
+
+    def undo(self, image, vectors=None):
+        """Annuler la dernière entrée sur `image` (et les formes de `vectors`), modifiés en place.
+
+        Retourne la boîte restaurée, ou None s'il n'y a rien à annuler.
+        """
+        if not self._undo:
+            return None
+        return self._swap(image, vectors, self._undo, self._redo)
+
+    def redo(self, image, vectors=None):
+        """Rétablir la dernière entrée annulée. Retourne la boîte restaurée ou None"""
+        if not self._redo:
+            return None
+        return self._swap(image, vectors, self._redo, self._undo)
+
+    def _swap(self, image, vectors, source, target):
+        """Restaurer une entrée de `source` et ranger l'état remplacé dans `target`"""
+        delta = source.pop()
+        self.memory_used -= delta.nbytes
+
+        replaced = []
+        for tile_box, data in delta.tiles:
+            replaced.append((tile_box, self._pack(self._reference.read(tile_box))))
+            self._reference.restore(image, tile_box, self._unpack(data, tile_box))
+
+        shapes = None
+        box = delta.box
+        if delta.shapes is not None:
+            shapes, shapes_box = vectors.restore(delta.shapes)
+            box = union_box(box, shapes_box)
+
+        self._push(target, _Delta(replaced, delta.box, shapes))
+        return box
+
+    def _snap(self, box):
+        """Aligner une boîte sur la grille des tuiles et la borner à l'image"""
+        width, height = self.size
+        if box is None:
+            return (0, 0, width, height)
+        size = self.tile_size
+        x0, y0, x1, y1 = box
+        x0 = max(0, int(x0) // size * size)
+        y0 = max(0, int(y0) // size * size)
+        x1 = min(width, max(x0, -(-int(x1) // size) * size))
+        y1 = min(height, max(y0, -(-int(y1) // size) * size))
+        return (x0, y0, x1, y1)
+
+    def _pack(self, pixels):
+        data = np.ascontiguousarray(pixels).tobytes()
+        return zlib.compress(data, 1) if self.compress else data
+
+    def _unpack(self, data, tile_box):
+        if self.compress:
+            data = zlib.decompress(data)
+        x0, y0, x1, y1 = tile_box
+        shape = (y1 - y0, x1 - x0) + self._pixel_shape
+        return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+
+    @staticmethod
+    def _bounds(tiles):
+        return (
+            min(box[0] for box, _ in tiles),
+            min(box[1] for box, _ in tiles),
+            max(box[2] for box, _ in tiles),
+            max(box[3] for box, _ in tiles),
+        )
+
+    def _push(self, stack, delta):
+        stack.append(delta)
+        self.memory_used += delta.nbytes
+
+    def _drop(self, stack):
+        self.memory_used -= sum(delta.nbytes for delta in stack)
+        stack.clear()
+
+    def _trim(self):
+        """Oublier les entrées les plus anciennes au-delà du budget mémoire"""
+        # On garde toujours la dernière entrée, même si elle dépasse le budget
+        while self.memory_used > self.memory_budget and len(self._undo) > 1:
+            self.memory_used -= self._undo.pop(0).nbytes
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Journal de session : reprise du travail après un arrêt brutal de PyPaint
+"""
+
+import json
+import os
+import re
+import shutil
+
+from .fileio import FileJob
+from .operations import Redo, Undo, operation_from_dict
+from .project import DocumentCapture, ProjectFile, write_project
+
+
+# Dossier de la session en cours (effacé à la fermeture normale)
+SESSION_DIRECTORY = os.path.join(os.path.expanduser("~"), ".pypaint", "session")
+
+# Point de reprise : un projet PyPaint, réenregistré à chaque fois (tuiles modifiées seulement)
+CHECKPOINT_NAME = "checkpoint.ppx"
+
+_SEGMENT = re.compile(r"journal-(\d+)\.jsonl$")
+
+
+class Journal:
+    """Journal des opérations d'un document, avec points de reprise compressés.
+
+    Chaque opération appliquée est ajoutée à un segment JSON Lines ; les
+    lignes sont écrites et synchronisées sur disque par lots (flush()).
+    Un point de reprise (checkpoint) enregistre le document au format
+    projet dans un thread, à partir d'instantanés, et ouvre un nouveau
+    segment : la reprise recharge le dernier point puis rejoue les
+    segments suivants. Le projet n'est complété que des tuiles modifiées,
+    et les anciens segments ne sont supprimés qu'une fois le nouveau point
+    complet, si bien qu'un arrêt pendant son écriture reste récupérable.
+    Chaque commit du document y ajoute une opération Commit : le rejeu
+    reconstitue les mêmes entrées d'historique que la session.
+
+    L'historique d'annulation n'est pas sauvegardé : une annulation (ou un
+    rétablissement) qui remonte avant le dernier point de reprise ne
+    pourrait pas être rejouée, elle déclenche donc un point de reprise
+    immédiat.
+    """
+
+    def __init__(self, directory=SESSION_DIRECTORY, batch_size=20, checkpoint_interval=200):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self.document = None
+        self.project = None
+        self.segment = 0
+        self.since_checkpoint = 0
+        self._pending = []
+        self._baselines = {}
+        self._job = None
+
+    @staticmethod
+    def has_session(directory=SESSION_DIRECTORY):
+        """Vrai si une session non fermée peut être reprise"""
+        return os.path.exists(os.path.join(directory, CHECKPOINT_NAME))
+
+    def start(self, document):
+        """Commencer une nouvelle session pour `document` (l'ancienne est effacée).
+
+        Un document tout juste repris (recover()) prolonge sa session : son
+        point de reprise et ses segments restent valables jusqu'au suivant.
+        """
+        self.close()
+        checkpoint = os.path.join(os.path.abspath(self.directory), CHECKPOINT_NAME)
+        project = document.project
+        if project is not None and project.path == checkpoint:
+            document.project = None
+            self.project = project
+            self.segment = max(_segments(self.directory), default=0)
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.project = None
+            self.segment = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.document = document
+        document.journal = self
+        # Tant que ce premier point n'est pas écrit, il n'y a rien à reprendre
+        self.checkpoint()
+
+    def record(self, operation):
+        """Ajouter une opération appliquée au document"""
+        self._pending.append(json.dumps(operation.to_dict(), ensure_ascii=False))
+        self.since_checkpoint += 1
+
+        if self._crosses_checkpoint(operation):
+            self.checkpoint(wait=True)
+        elif self.since_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+        elif len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Écrire les opérations en attente et les synchroniser sur disque"""
+        if not self._pending or self.document is None:
+            return
+        with open(self._segment_path(self.segment), "a", encoding="utf-8") as f:
+            f.write("\n".join(self._pending) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = []
+
+    def checkpoint(self, wait=False):
+        """Enregistrer un point de reprise et ouvrir un nouveau segment du journal"""
+        if self._job is not None and not self._job.done():
+            if not wait:
+                # Le point précédent n'est pas fini : réessayer à la prochaine opération
+                return
+            self._job.wait()
+        self.flush()
+
+        document = self.document
+        self.segment += 1
+        self.since_checkpoint = 0
+        self._baselines = {
+            layer: (len(layer.history), layer.history.redo_count) for layer in document.layers
+        }
+
+        capture = DocumentCapture(document)
+        segment = self.segment
+        self._job = FileJob(lambda job: self._write_checkpoint(capture, segment)).start()
+        if wait:
+            self._job.wait()
+
+    def close(self, discard=False):
+        """Terminer la session ; `discard` efface ses fichiers (fermeture normale)"""
+        if self.document is None:
+            return
+        self.flush()
+        if self._job is not None:
+            self._job.wait()
+            self._job = None
+        self.document.journal = None
+        self.document = None
+        if discard:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    @classmethod
+    def recover(cls, directory=SESSION_DIRECTORY, history_budget=64 * 1024 * 1024):
+        """Reconstruire le document de la session : dernier point de reprise + journal"""
+        project = ProjectFile(os.path.join(directory, CHECKPOINT_NAME))
+        document = project.load(history_budget)
+        first = project.index["extra"]["journal"]
+        for segment in sorted(_segments(directory)):
+            if segment >= first:
+                with open(os.path.join(directory, f"journal-{segment}.jsonl"), encoding="utf-8") as f:
+                    document.replay(_read_operations(f))
+        return document
+
+    def _crosses_checkpoint(self, operation):
+        """Vrai si `operation` annule ou rétablit une entrée antérieure au point de reprise"""
+        layer = self.document.layer
+        history = layer.history
+        undo_base, redo_base = self._baselines.get(layer, (0, 0))
+        crosses = (
+            (isinstance(operation, Undo) and len(history) < undo_base)
+            or (isinstance(operation, Redo) and history.redo_count < redo_base)
+        )
+        # Les entrées oubliées (budget mémoire, nouvelle action) abaissent les bases
+        self._baselines[layer] = (min(undo_base, len(history)), min(redo_base, history.redo_count))
+        return crosses
+
+    def _write_checkpoint(self, capture, segment):
+        """Écrire un point de reprise (thread), puis oublier les segments qui le précèdent"""
+        self.project = write_project(
+            capture, os.path.join(self.directory, CHECKPOINT_NAME), self.project,
+            extra={"journal": segment}
+        )
+        for old in _segments(self.directory):
+            if old < segment:
+                os.remove(self._segment_path(old))
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"journal-{segment}.jsonl")
+
+
+def _segments(directory):
+    """Numéros des segments du journal présents dans le dossier"""
+    if not os.path.isdir(directory):
+        return []
+    return [int(match.group(1)) for match in map(_SEGMENT.match, os.listdir(directory)) if match]
+
+
+def _read_operations(f):
+    """Opérations d'un segment ; une dernière ligne tronquée (arrêt brutal) est ignorée"""
+    operations = []
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            operations.append(operation_from_dict(json.loads(line)))
+        except json.JSONDecodeError:
+            break
+    return operations
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Calques d'un document et leur aplatissement incrémental
+"""
+
+from PIL import Image, ImageDraw
+
+
+class Layer:
+    """Calque : image, opacité, visibilité et historique d'annulation propre"""
+
+    def __init__(self, name, image, history, opacity=1.0, visible=True):
+        self.name = name
+        self.image = image
+        self.history = history
+        self.opacity = opacity
+        self.visible = visible
+        # Les images par tuiles se dessinent via Document.painting()
+        self.draw = ImageDraw.Draw(image) if isinstance(image, Image.Image) else None
+
+    def rgba(self, box=None):
+        """Copie RGBA du calque (ou d'une boîte), opacité appliquée au canal alpha"""
+        image = self.image if box is None else self.image.crop(box)
+        image = image.convert("RGBA")
+        if self.opacity < 1:
+            opacity = max(0.0, self.opacity)
+            image.putalpha(image.getchannel("A").point(lambda v: round(v * opacity)))
+        return image
+
+
+class Compositor:
+    """Image aplatie des calques visibles, tenue à jour zone par zone.
+
+    Les calques situés sous le calque actif sont aplatis une fois pour
+    toutes dans `below` (opaque, sur la couleur de fond), ceux du dessus
+    dans `above` (transparent). Une modification du calque actif ne
+    réassemble que ces trois images, sur la seule zone modifiée. Les
+    formes vectorielles (`vectors`), au-dessus de tout, sont rastérisées
+    à chaque fois dans la zone, seulement celles qui la recoupent.
+    """
+
+    def __init__(self, layers, active, background, vectors=None):
+        self.layers = layers
+        self.background = background
+        self.vectors = vectors
+        self.image = Image.new("RGB", layers[0].image.size, background)
+        self.rebuild(active)
+
+    def rebuild(self, active):
+        """Recalculer les caches autour du calque actif, puis toute l'image"""
+        self.active = active
+        size = self.image.size
+
+        below = Image.new("RGBA", size, self.background)
+        for layer in self.layers[:active]:
+            if layer.visible:
+                below.alpha_composite(layer.rgba())
+
+        above = None
+        for layer in self.layers[active + 1:]:
+            if layer.visible:
+                if above is None:
+                    above = layer.rgba()
+                else:
+                    above.alpha_composite(layer.rgba())
+
+        self.below = below
+        self.above = above
+        self.update((0, 0) + size)
+
+    def update(self, box):
+        """Réassembler une zone après modification du calque actif"""
+        region = self.below.crop(box)
+        layer = self.layers[self.active]
+        if layer.visible:
+            region.alpha_composite(layer.rgba(box))
+        if self.above is not None:
+            region.alpha_composite(self.above.crop(box))
+        self._overlay(region, box)
+        self.image.paste(region.convert("RGB"), box[:2])
+
+    def backdrop(self, box):
+        """Zone aplatie sans le calque actif : ce qui apparaît là où il est transparent"""
+        region = self.below.crop(box)
+        if self.above is not None:
+            region.alpha_composite(self.above.crop(box))
+        self._overlay(region, box)
+        return region.convert("RGB")
+
+    def _overlay(self, region, box):
+        if self.vectors:
+            shapes = self.vectors.render(box)
+            if shapes is not None:
+                region.alpha_composite(shapes)
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""
+Modèle d'opérations de dessin sérialisables pour PyPaint
+
+Chaque opération sait se dessiner sur un Document et retourne la boîte
+(x0, y0, x1, y1) qu'elle a modifiée. Les journaux d'opérations sont
+stockés en JSON Lines (une opération par ligne).
+"""
+
+import base64
+import io
+import json
+from dataclasses import asdict, dataclass, field, fields
+
+import numpy as np
+from PIL import Image, ImageColor
+
+from .brush import paint_stroke, spray_particles
+from .fill import scanline_fill
+from .filters import FilterJob, make_filter
+from .fonts import DEFAULT_FAMILY, render_text
+from .regions import clip_box, ordered_box, points_box, union_box
+from .vector import Shape
+
+
+OPERATIONS = {}
+
+
+def register(cls):
+    """Déclarer une classe d'opération sous son nom `kind`"""
+    OPERATIONS[cls.kind] = cls
+    return cls
+
+
+class Operation:
+    """Base des opérations : sérialisation et application"""
+
+    kind = None
+
+    # False pour les opérations qui ne créent pas d'entrée d'historique
+    records_history = True
+
+    def apply(self, document):
+        """Dessiner l'opération sur le document ; retourner la boîte modifiée"""
+        raise NotImplementedError
+
+    def to_dict(self):
+        data = {"op": self.kind}
+        data.update(asdict(self))
+        return data
+
+
+def operation_from_dict(data):
+    """Reconstruire une opération depuis son dictionnaire"""
+    data = dict(data)
+    kind = data.pop("op")
+    try:
+        cls = OPERATIONS[kind]
+    except KeyError:
+        raise ValueError(f"Opération inconnue: {kind}") from None
+    names = {f.name for f in fields(cls)}
+    return cls(**{key: value for key, value in data.items() if key in names})
+
+
+def dump_operations(operations, fp):
+    """Écrire des opérations dans un fichier texte (JSON Lines)"""
+    for operation in operations:
+        fp.write(json.dumps(operation.to_dict(), ensure_ascii=False))
+        fp.write("\n")
+
+
+def load_operations(fp):
+    """Lire les opérations d'un fichier JSON Lines"""
+    return [operation_from_dict(json.loads(line)) for line in fp if line.strip()]
+
+
+@register
+@dataclass
+class Line(Operation):
+    """Ligne ou polyligne (crayon, outil ligne)"""
+
+    kind = "line"
+
+    points: list
+    color: str = "#000000"
+    width: int = 3
+
+    def apply(self, document):
+        box = points_box(self.points, self.width)
+        with document.painting(box) as draw:
+            draw.line(self.points, fill=self.color, width=self.width, joint="curve")
+        return box
+
+
+@register
+@dataclass
+class Stroke(Operation):
+    """Trait de pinceau (crayon) : empreintes anticrénelées le long des points"""
+
+    kind = "stroke"
+
+    points: list
+    color: str = "#000000"
+    width: int = 3
+    hardness: float = 1.0
+
+    def apply(self, document):
+        return paint_stroke(document, self.points, self.color, self.width, self.hardness)
+
+
+@register
+@dataclass
+class Spray(Operation):
+    """Aérographe : `count` gouttes tirées dans un disque de rayon `radius` le long des points"""
+
+    kind = "spray"
+
+    points: list
+    color: str = "#000000"
+    radius: int = 9
+    count: int = 10
+    seed: int = 0
+
+    def apply(self, document):
+        xs, ys = spray_particles(self.points, self.radius, self.count, self.seed)
+        return document.scatter(self.color, xs, ys)
+
+
+@register
+@dataclass
+class Erase(Operation):
+    """Trait de gomme : couleur de fond sur le calque du fond, transparence au-dessus"""
+
+    kind = "erase"
+
+    points: list
+    width: int = 6
+    hardness: float = 1.0
+
+    def apply(self, document):
+        return paint_stroke(document, self.points, document.erase_color, self.width, self.hardness)
+
+
+@register
+@dataclass
+class Rect(Operation):
+    """Contour de rectangle"""
+
+    kind = "rect"
+
+    box: list
+    color: str = "#000000"
+    width: int = 3
+
+    def apply(self, document):
+        box = points_box(self.box, self.width)
+        with document.painting(box) as draw:
+            draw.rectangle(ordered_box(self.box), outline=self.color, width=self.width)
+        return box
+
+
+@register
+@dataclass
+class Ellipse(Operation):
+    """Contour d'ellipse inscrite dans une boîte"""
+
+    kind = "ellipse"
+
+    box: list
+    color: str = "#000000"
+    width: int = 3
+
+    def apply(self, document):
+        box = points_box(self.box, self.width)
+        with document.painting(box) as draw:
+            draw.ellipse(ordered_box(self.box), outline=self.color, width=self.width)
+        return box
+
+
+@register
+@dataclass
+class Fill(Operation):
+    """Remplissage de la zone connexe contenant (x, y)"""
+
+    kind = "fill"
+
+    x: int
+    y: int
+    color: str = "#000000"
+    tolerance: int = 0
+
+    def apply(self, document):
+        image = document.image
+        color = ImageColor.getcolor(self.color, image.mode)
+        if document.tiled:
+            return image.fill(self.x, self.y, color, self.tolerance)
+
+        pixels = np.array(image)
+        box = scanline_fill(pixels, self.x, self.y, color, self.tolerance)
+        if box is None:
+            return None
+        # Recopier uniquement la zone modifiée dans l'image PIL
+        x0, y0, x1, y1 = box
+        image.paste(Image.fromarray(pixels[y0:y1, x0:x1], image.mode), (x0, y0))
+        return box
+
+
+@register
+@dataclass
+class Text(Operation):
+    """Texte dont le coin supérieur gauche est en (x, y)"""
+
+    kind = "text"
+
+    x: int
+    y: int
+    text: str
+    color: str = "#000000"
+    size: int = 12
+    family: str = DEFAULT_FAMILY
+
+    def apply(self, document):
+        # Même rendu (et même cache) que l'aperçu de l'interface
+        raster = render_text(self.text, self.family, self.size)
+        x0, y0, x1, y1 = raster.bbox
+        if x1 <= x0 or y1 <= y0:
+            return None
+        box = (self.x + x0, self.y + y0, self.x + x1, self.y + y1)
+        with document.painting(box) as draw:
+            draw.bitmap(box[:2], raster.mask, fill=self.color)
+        return box
+
+
+@register
+@dataclass
+class Clear(Operation):
+    """Effacement complet du calque actif"""
+
+    kind = "clear"
+
+    def apply(self, document):
+        document.fill_background()
+        return (0, 0, document.width, document.height)
+
+
+@register
+@dataclass
+class ClearRegion(Operation):
+    """Effacement d'une boîte du calque actif (sélection supprimée ou coupée)"""
+
+    kind = "clear_region"
+
+    box: list
+
+    def apply(self, document):
+        return document.clear_region(self.box)
+
+
+@register
+@dataclass
+class MoveRegion(Operation):
+    """Déplacement (ou copie) d'une boîte du calque actif, coin supérieur gauche en (x, y)"""
+
+    kind = "move_region"
+
+    box: list
+    x: int
+    y: int
+    copy: bool = False
+
+    def apply(self, document):
+        box = clip_box(self.box, document.size)
+        if box is None:
+            return None
+        region = document.image.crop(box)
+        source = None if self.copy else document.clear_region(box)
+        return union_box(source, document.paste_region(region, (self.x, self.y)))
+
+
+@register
+@dataclass
+class Paste(Operation):
+    """Image collée avec son coin supérieur gauche en (x, y), pixels en PNG (base64)"""
+
+    kind = "paste"
+
+    x: int
+    y: int
+    data: str
+
+    @classmethod
+    def from_image(cls, image, x, y):
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG", compress_level=1)
+        operation = cls(x, y, base64.b64encode(buffer.getvalue()).decode("ascii"))
+        # Inutile de décoder l'image qu'on vient d'encoder
+        operation._image = image
+        return operation
+
+    def apply(self, document):
+        image = getattr(self, "_image", None)
+        if image is None:
+            image = Image.open(io.BytesIO(base64.b64decode(self.data)))
+        return document.paste_region(image, (self.x, self.y))
+
+
+@register
+@dataclass
+class ApplyFilter(Operation):
+    """Filtre appliqué à tout le calque actif, en une seule entrée d'historique"""
+
+    kind = "filter"
+
+    name: str
+    params: dict = field(default_factory=dict)
+
+    def prepare(self, document, executor):
+        """Lancer le calcul sur un exécuteur ; apply() finit de l'écrire dans le calque actif"""
+        self._job = FilterJob(document.image, make_filter(self.name, self.params)).start(executor)
+        return self._job
+
+    def apply(self, document):
+        job = getattr(self, "_job", None)
+        self._job = None
+        if job is None:
+            return FilterJob(document.image, make_filter(self.name, self.params)).run()
+        return job.write(document.image)
+
+
+@register
+@dataclass
+class AddLayer(Operation):
+    """Nouveau calque transparent au-dessus du calque actif"""
+
+    kind = "add_layer"
+    records_history = False
+
+    name: str = ""
+
+    def apply(self, document):
+        document.add_layer(self.name or None)
+        return None
+
+
+@register
+@dataclass
+class RemoveLayer(Operation):
+    """Suppression d'un calque"""
+
+    kind = "remove_layer"
+    records_history = False
+
+    index: int
+
+    def apply(self, document):
+        document.remove_layer(self.index)
+        return None
+
+
+@register
+@dataclass
+class SelectLayer(Operation):
+    """Changement de calque actif"""
+
+    kind = "select_layer"
+    records_history = False
+
+    index: int
+
+    def apply(self, document):
+        document.select_layer(self.index)
+        return None
+
+
+@register
+@dataclass
+class LayerProperties(Operation):
+    """Opacité et visibilité d'un calque"""
+
+    kind = "layer_properties"
+    records_history = False
+
+    index: int
+    opacity: float = 1.0
+    visible: bool = True
+
+    def apply(self, document):
+        document.set_layer(self.index, self.opacity, self.visible)
+        return None
+
+
+@register
+@dataclass
+class AddShape(Operation):
+    """Forme vectorielle modifiable (ligne, rectangle, ellipse), gardée hors des pixels"""
+
+    kind = "add_shape"
+
+    shape: str
+    points: list
+    color: str = "#000000"
+    width: int = 3
+    # Attribué à l'application (0 : le suivant) puis journalisé, pour que le rejeu retrouve la forme
+    shape_id: int = 0
+
+    def apply(self, document):
+        shape = Shape(self.shape, list(self.points), self.color, self.width)
+        self.shape_id = document.add_shape(shape, self.shape_id or None)
+        # Pas de pixels modifiés : le document redessine lui-même la forme
+        return None
+
+
+@register
+@dataclass
+class ReshapeShape(Operation):
+    """Nouveaux points d'une forme vectorielle (déplacement ou redimensionnement)"""
+
+    kind = "reshape_shape"
+
+    shape_id: int
+    points: list
+
+    def apply(self, document):
+        document.reshape_shape(self.shape_id, self.points)
+        return None
+
+
+@register
+@dataclass
+class RemoveShape(Operation):
+    """Suppression d'une forme vectorielle"""
+
+    kind = "remove_shape"
+
+    shape_id: int
+
+    def apply(self, document):
+        document.remove_shape(self.shape_id)
+        return None
+
+
+@register
+@dataclass
+class FlattenShapes(Operation):
+    """Dessin de toutes les formes vectorielles dans le calque actif (une entrée d'historique)"""
+
+    kind = "flatten_shapes"
+
+    def apply(self, document):
+        return document.flatten_shapes()
+
+
+@register
+@dataclass
+class Commit(Operation):
+    """Fin d'une action : les opérations appliquées depuis la précédente forment une entrée d'historique"""
+
+    kind = "commit"
+    records_history = False
+
+    def apply(self, document):
+        document.commit(mark=False)
+        return None
+
+
+@register
+@dataclass
+class Undo(Operation):
+    """Annulation de la dernière opération (pour rejouer un journal)"""
+
+    kind = "undo"
+    records_history = False
+
+    def apply(self, document):
+        return document.undo()
+
+
+@register
+@dataclass
+class Redo(Operation):
+    """Rétablissement de la dernière opération annulée"""
+
+    kind = "redo"
+    records_history = False
+
+    def apply(self, document):
+        return document.redo()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation de l'interface : durées des gestionnaires, compteurs, trace JSON et cProfile
+"""
+
+import io
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Durées des gestionnaires et compteurs échantillonnés d'une session.
+
+    Chaque mesure alimente une fenêtre glissante par nom (pour les
+    latences affichées en direct) et une trace bornée au format « Trace
+    Event » de Chrome, lisible par chrome://tracing ou Perfetto. Un
+    profil cProfile peut être capturé en plus, à la demande.
+    """
+
+    def __init__(self, window=240, trace_size=100_000):
+        self.window = window
+        self.samples = {}
+        self.counters = {}
+        self.events = deque(maxlen=trace_size)
+        self.origin = time.perf_counter()
+        self.profile = None
+
+    @contextmanager
+    def timing(self, name):
+        """Mesurer la durée du bloc sous le nom `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name, start, end):
+        """Noter une durée (instants de time.perf_counter())"""
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append((end - start) * 1000)
+        self.events.append({
+            "name": name, "ph": "X", "pid": 0, "tid": 0,
+            "ts": round((start - self.origin) * 1e6), "dur": round((end - start) * 1e6),
+        })
+
+    def sample(self, name, value):
+        """Noter la valeur courante d'un compteur (éléments du canvas, mémoire...)"""
+        self.counters[name] = value
+        self.events.append({
+            "name": name, "ph": "C", "pid": 0, "tid": 0,
+            "ts": round((time.perf_counter() - self.origin) * 1e6), "args": {"value": value},
+        })
+
+    def reset(self):
+        """Oublier les mesures et la trace (une capture cProfile en cours continue)"""
+        self.samples.clear()
+        self.counters.clear()
+        self.events.clear()
+        self.origin = time.perf_counter()
+
+    def summary(self):
+        """Par gestionnaire : nombre de mesures récentes, médiane, 95e centile et maximum (ms)"""
+        result = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[name] = {
+                "count": len(ordered),
+                "p50_ms": ordered[len(ordered) // 2],
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max_ms": ordered[-1],
+            }
+        return result
+
+    def trace(self):
+        """Trace complète : événements, résumé et derniers compteurs"""
+        return {
+            "traceEvents": list(self.events),
+            "displayTimeUnit": "ms",
+            "summary": self.summary(),
+            "counters": dict(self.counters),
+        }
+
+    def dump(self, filepath):
+        """Écrire la trace dans un fichier JSON"""
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f)
+
+    @property
+    def profiling(self):
+        return self.profile is not None
+
+    def start_profile(self):
+        """Démarrer une capture cProfile (tout le code Python exécuté jusqu'à stop_profile)"""
+        # cProfile et pstats ne sont chargés qu'à la première capture
+        import cProfile
+
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop_profile(self, filepath=None, limit=30):
+        """Arrêter la capture ; l'écrire (format pstats) si `filepath`, et retourner le résumé texte"""
+        import pstats
+
+        profile, self.profile = self.profile, None
+        if profile is None:
+            return ""
+        profile.disable()
+        if filepath:
+            profile.dump_stats(filepath)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Format de projet PyPaint (.ppx) : tuiles compressées une à une, chargées à la demande
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image, ImageColor
+
+from .document import Document
+from .fileio import FileJob
+
+
+PROJECT_EXTENSION = ".ppx"
+
+# En-tête : signature, version, position et longueur de l'index
+_MAGIC = b"PYPAINT\x00"
+_VERSION = 1
+_HEADER = struct.Struct("<8sH6xQQ")
+
+# Taille des tuiles enregistrées pour les calques en images PIL
+TILE_SIZE = 256
+
+# Part d'octets devenus inutiles au-delà de laquelle le fichier est réécrit en entier
+COMPACT_RATIO = 0.5
+
+_CHANNELS = {"RGB": 3, "RGBA": 4}
+
+
+class _Chunk:
+    """Tuile compressée d'un fichier projet, décompressée seulement quand on l'appelle"""
+
+    __slots__ = ("project", "offset", "length", "digest", "shape")
+
+    def __init__(self, project, offset, length, digest, shape):
+        self.project = project
+        self.offset = offset
+        self.length = length
+        self.digest = digest
+        self.shape = shape
+
+    def data(self):
+        """Octets compressés, tels qu'écrits dans le fichier"""
+        return self.project.read(self.offset, self.length)
+
+    def __call__(self):
+        return np.frombuffer(zlib.decompress(self.data()), dtype=np.uint8).reshape(self.shape)
+
+
+class ProjectFile:
+    """Fichier projet ouvert : son index, et ses tuiles lues par projection mémoire (mmap).
+
+    Le fichier contient un en-tête fixe (signature, version, position de
+    l'index), les tuiles compressées (zlib) l'une après l'autre, puis
+    l'index : un JSON compressé qui décrit le document et situe chaque
+    tuile avec l'empreinte de ses pixels. Une tuile absente de l'index est
+    vide (couleur de fond pour le calque du fond, transparente au-dessus).
+
+    Seuls l'en-tête et l'index sont lus à l'ouverture. Les tuiles d'un
+    document par tuiles ne sont décompressées qu'au premier accès.
+    """
+
+    def __init__(self, filepath):
+        self.path = os.path.abspath(filepath)
+        with open(self.path, "rb") as f:
+            # La projection reste valable après la fermeture du fichier
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, offset, length = _read_header(self._map[:_HEADER.size])
+        if magic != _MAGIC:
+            raise ValueError(f"Ce n'est pas un projet PyPaint: {filepath}")
+        if version > _VERSION:
+            raise ValueError(f"Projet PyPaint d'une version plus récente ({version})")
+        self.header = (offset, length)
+        self.index = json.loads(zlib.decompress(self.read(offset, length)))
+
+    def read(self, offset, length):
+        return self._map[offset:offset + length]
+
+    @property
+    def garbage_ratio(self):
+        """Part du fichier qui ne sert plus (tuiles remplacées, anciens index)"""
+        chunks = {
+            (offset, length)
+            for layer in self.index["layers"]
+            for _, _, offset, length, _ in layer["tiles"]
+        }
+        used = _HEADER.size + self.header[1] + sum(length for _, length in chunks)
+        return 1 - used / len(self._map)
+
+    def chunks(self, layer_index):
+        """Tuiles enregistrées d'un calque : (tx, ty) -> _Chunk"""
+        index = self.index
+        info = index["layers"][layer_index]
+        size = index["tile_size"]
+        channels = _CHANNELS[info["mode"]]
+        chunks = {}
+        for tx, ty, offset, length, digest in info["tiles"]:
+            width = min(size, index["width"] - tx * size)
+            height = min(size, index["height"] - ty * size)
+            chunks[(tx, ty)] = _Chunk(self, offset, length, digest, (height, width, channels))
+        return chunks
+
+    def load(self, history_budget=64 * 1024 * 1024):
+        """Construire le document décrit par le fichier.
+
+        Un document par tuiles ne fait que noter l'emplacement de ses tuiles ;
+        les calques en images PIL sont décompressés tout de suite, car
+        l'aplatissement a besoin de tous leurs pixels.
+        """
+        index = self.index
+        size = index["tile_size"]
+        document = Document(
+            index["width"], index["height"], background=index["background"],
+            history_budget=history_budget, tiled=index["tiled"]
+        )
+        for layer_index, info in enumerate(index["layers"]):
+            if layer_index == 0:
+                layer = document.layer
+                layer.name = info["name"]
+            else:
+                layer = document.add_layer(info["name"])
+            image = layer.image
+            deferred = document.tiled and image.tile_size == size
+            for (tx, ty), chunk in self.chunks(layer_index).items():
+                if deferred:
+                    image.defer(tx, ty, chunk)
+                else:
+                    image.paste(Image.fromarray(chunk(), info["mode"]), (tx * size, ty * size))
+            if not deferred:
+                layer.history.reset(image)
+
+        for layer_index, info in enumerate(index["layers"]):
+            if info["opacity"] < 1 or not info["visible"]:
+                document.set_layer(layer_index, info["opacity"], info["visible"])
+        document.select_layer(index["active"])
+        document.vectors.load(index.get("shapes", []))
+        document.recomposite()
+        document.project = self
+        return document
+
+
+class DocumentCapture:
+    """État figé d'un document, que write_project() peut écrire depuis un autre thread.
+
+    Les calques sont des instantanés (copie d'une image PIL, copie sur
+    écriture d'une TiledImage). Les tuiles encore différées sont gardées
+    telles quelles : elles seront recopiées sans être décompressées.
+    """
+
+    def __init__(self, document):
+        self.meta = {
+            "width": document.width,
+            "height": document.height,
+            "background": document.background,
+            "tiled": document.tiled,
+            "active": document.active,
+            # Les formes vectorielles restent modifiables dans le projet
+            "shapes": document.vectors.to_list(),
+        }
+        self.layers = []
+        for layer_index, layer in enumerate(document.layers):
+            image = layer.image
+            info = {"name": layer.name, "opacity": layer.opacity, "visible": layer.visible, "mode": image.mode}
+            if hasattr(image, "snapshot"):
+                deferred, allocated = image.stored_tiles()
+                self.layers.append((info, image.snapshot(), image.tile_size, image.background, deferred, allocated))
+            else:
+                if layer_index == 0:
+                    blank = ImageColor.getcolor(document.background, image.mode)
+                else:
+                    blank = (0,) * len(image.mode)
+                self.layers.append((info, image.copy(), TILE_SIZE, np.array(blank, dtype=np.uint8), {}, None))
+        self.tile_size = self.layers[0][2]
+
+    def release(self):
+        """Libérer les instantanés"""
+        for _, snapshot, *_ in self.layers:
+            if hasattr(snapshot, "release"):
+                snapshot.release()
+
+
+def write_project(capture, filepath, previous=None, progress=None, compress_level=1, extra=None):
+    """Écrire un état figé (DocumentCapture) ; retourne le ProjectFile du fichier écrit.
+
+    Si `previous` est ce même fichier, tel qu'il est encore sur le disque,
+    seules les tuiles dont l'empreinte a changé sont ajoutées en fin de
+    fichier, suivies d'un nouvel index ; l'en-tête n'est réécrit qu'après,
+    si bien qu'une interruption laisse le fichier dans son état précédent.
+    Sinon (ou si trop d'octets ne servent plus) le fichier est écrit en
+    entier à côté puis remis à sa place. `extra` est un dictionnaire
+    libre rangé dans l'index.
+    """
+    path = os.path.abspath(filepath)
+    if previous is not None and (previous.path != path or _header_on_disk(path) != previous.header):
+        previous = None
+    try:
+        if previous is not None and previous.garbage_ratio <= COMPACT_RATIO:
+            reuse = {
+                digest: (offset, length)
+                for layer in previous.index["layers"]
+                for _, _, offset, length, digest in layer["tiles"]
+            }
+            with open(path, "r+b") as f:
+                f.seek(0, os.SEEK_END)
+                _write_body(f, capture, reuse, progress, compress_level, extra)
+        else:
+            temporary = path + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(bytes(_HEADER.size))
+                _write_body(f, capture, {}, progress, compress_level, extra)
+            os.replace(temporary, path)
+    finally:
+        capture.release()
+    return ProjectFile(path)
+
+
+def _write_body(f, capture, reuse, progress, compress_level, extra):
+    """Écrire les tuiles qui manquent au fichier, l'index, puis l'en-tête"""
+    index = dict(capture.meta, tile_size=capture.tile_size, extra=extra or {}, layers=[])
+    total = sum(-(-capture.meta["width"] // size) * -(-capture.meta["height"] // size)
+                for _, _, size, *_ in capture.layers)
+    done = 0
+
+    for info, snapshot, size, blank, deferred, allocated in capture.layers:
+        tiles = []
+        for ty in range(-(-capture.meta["height"] // size)):
+            for tx in range(-(-capture.meta["width"] // size)):
+                done += 1
+                chunk = deferred.get((tx, ty))
+                if chunk is not None:
+                    digest = chunk.digest
+                    if digest not in reuse:
+                        reuse[digest] = (f.tell(), chunk.length)
+                        f.write(chunk.data())
+                elif allocated is not None and not allocated[ty, tx]:
+                    continue
+                else:
+                    box = (tx * size, ty * size,
+                           min(capture.meta["width"], (tx + 1) * size),
+                           min(capture.meta["height"], (ty + 1) * size))
+                    pixels = np.ascontiguousarray(_read(snapshot, box))
+                    if (pixels == blank).all():
+                        continue
+                    digest = _digest(pixels)
+                    if digest not in reuse:
+                        data = zlib.compress(pixels.tobytes(), compress_level)
+                        reuse[digest] = (f.tell(), len(data))
+                        f.write(data)
+                offset, length = reuse[digest]
+                tiles.append([tx, ty, offset, length, digest])
+            if progress:
+                progress(done / total)
+        index["layers"].append(dict(info, tiles=tiles))
+
+    data = zlib.compress(json.dumps(index).encode("utf-8"), 6)
+    offset = f.tell()
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+    f.seek(0)
+    f.write(_HEADER.pack(_MAGIC, _VERSION, offset, len(data)))
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _read(image, box):
+    if hasattr(image, "read"):
+        return image.read(box)
+    return np.asarray(image.crop(box))
+
+
+def _digest(pixels):
+    """Empreinte d'une tuile (dimensions comprises)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(pixels.shape).encode("ascii"))
+    digest.update(pixels.data)
+    return digest.hexdigest()
+
+
+def _read_header(data):
+    if len(data) < _HEADER.size:
+        return b"", 0, 0, 0
+    return _HEADER.unpack(data)
+
+
+def _header_on_disk(path):
+    """(position, longueur) de l'index d'après l'en-tête actuel du fichier, ou None"""
+    try:
+        with open(path, "rb") as f:
+            _, _, offset, length = _read_header(f.read(_HEADER.size))
+    except OSError:
+        return None
+    return (offset, length)
+
+
+def open_project(filepath, history_budget=64 * 1024 * 1024):
+    """Ouvrir un projet PyPaint (index et tuiles nécessaires seulement)"""
+    return ProjectFile(filepath).load(history_budget)
+
+
+def save_project(document, filepath, progress=None, compress_level=1):
+    """Enregistrer un document en projet ; si c'est déjà son fichier, seules ses tuiles modifiées"""
+    document.project = write_project(
+        DocumentCapture(document), filepath, document.project, progress, compress_level
+    )
+    return document.project
+
+
+def save_project_in_background(document, filepath, compress_level=1):
+    """Enregistrer un projet dans un thread, à partir d'un instantané ; retourne le FileJob démarré.
+
+    Le résultat du job est le nouveau ProjectFile : c'est au thread qui
+    possède le document de le ranger dans `document.project`.
+    """
+    capture = DocumentCapture(document)
+    previous = document.project
+    return FileJob(
+        lambda job: write_project(capture, filepath, previous, job.report, compress_level)
+    ).start()
+
+
+def open_project_in_background(filepath, history_budget=64 * 1024 * 1024):
+    """Ouvrir un projet dans un thread ; retourne le FileJob démarré (résultat : le document)"""
+    return FileJob(lambda job: open_project(filepath, history_budget)).start()
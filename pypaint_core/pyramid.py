@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Pyramide d'images réduites (mipmaps) pour l'affichage zoomé
+"""
+
+import math
+from collections import OrderedDict
+
+from PIL import Image
+
+
+class ImagePyramid:
+    """Niveaux réduits d'une image, calculés par tuiles à la demande et mis en cache.
+
+    Le niveau 0 est l'image elle-même ; le niveau k est réduit d'un
+    facteur 2**k. Une tuile du niveau k est calculée à partir des quatre
+    tuiles correspondantes du niveau k - 1. Une modification n'invalide
+    que les tuiles qui la recouvrent, à chaque niveau.
+
+    Le cache est borné à `max_tiles` tuiles ; en cas de dépassement, ce
+    sont les tuiles des niveaux les plus détaillés qui partent d'abord,
+    car une tuile d'un niveau élevé résume une grande surface.
+    """
+
+    def __init__(self, image, tile_size=256, max_tiles=512):
+        self.image = image
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+
+        self.levels = 0
+        width, height = image.size
+        while max(width, height) > tile_size:
+            width, height = -(-width // 2), -(-height // 2)
+            self.levels += 1
+        self._cache = [OrderedDict() for _ in range(self.levels + 1)]
+        self._cached = 0
+
+    def level_size(self, level):
+        """Taille (largeur, hauteur) d'un niveau"""
+        width, height = self.image.size
+        for _ in range(level):
+            width, height = -(-width // 2), -(-height // 2)
+        return width, height
+
+    def level_for(self, factor):
+        """Niveau adapté à un affichage de `factor` pixels d'image par pixel d'écran"""
+        if factor < 2:
+            return 0
+        return min(self.levels, int(math.log2(factor)))
+
+    def invalidate(self, box=None):
+        """Oublier les tuiles réduites qui recouvrent une zone de l'image (None : toutes)"""
+        if box is None:
+            for cache in self._cache:
+                cache.clear()
+            self._cached = 0
+            return
+        x0, y0, x1, y1 = box
+        size = self.tile_size
+        for level in range(1, self.levels + 1):
+            scale = 2 ** level
+            tx0, ty0 = int(x0) // scale // size, int(y0) // scale // size
+            tx1 = (-(-int(x1) // scale) - 1) // size
+            ty1 = (-(-int(y1) // scale) - 1) // size
+            for ty in range(ty0, ty1 + 1):
+                for tx in range(tx0, tx1 + 1):
+                    if self._cache[level].pop((tx, ty), None) is not None:
+                        self._cached -= 1
+
+    def render(self, box, size):
+        """Rendre la zone `box` de l'image (flottants possibles) à la taille `size` (largeur, hauteur)"""
+        x0, y0, x1, y1 = box
+        factor = (x1 - x0) / max(1, size[0])
+        level = self.level_for(factor)
+        scale = 2 ** level
+
+        # Zone entière du niveau qui contient la boîte demandée
+        width, height = self.level_size(level)
+        lx0, ly0 = max(0.0, x0 / scale), max(0.0, y0 / scale)
+        lx1, ly1 = min(width, x1 / scale), min(height, y1 / scale)
+        ix0, iy0 = max(0, int(lx0)), max(0, int(ly0))
+        ix1, iy1 = min(width, math.ceil(lx1)), min(height, math.ceil(ly1))
+        region = self.region(level, (ix0, iy0, ix1, iy1))
+
+        resample = Image.NEAREST if factor <= 1 else Image.BILINEAR
+        return region.resize(size, resample, box=(lx0 - ix0, ly0 - iy0, lx1 - ix0, ly1 - iy0))
+
+    def region(self, level, box):
+        """Image PIL d'une boîte exprimée en coordonnées du niveau"""
+        if level == 0:
+            return self.image.crop(box)
+
+        x0, y0, x1, y1 = box
+        size = self.tile_size
+        region = Image.new("RGB", (x1 - x0, y1 - y0))
+        for ty in range(y0 // size, (y1 - 1) // size + 1):
+            for tx in range(x0 // size, (x1 - 1) // size + 1):
+                region.paste(self.tile(level, tx, ty), (tx * size - x0, ty * size - y0))
+        return region
+
+    def tile(self, level, tx, ty):
+        """Tuile (tx, ty) du niveau `level`, calculée depuis le niveau inférieur si besoin"""
+        cache = self._cache[level]
+        tile = cache.get((tx, ty))
+        if tile is not None:
+            cache.move_to_end((tx, ty))
+            return tile
+
+        size = self.tile_size
+        width, height = self.level_size(level)
+        x0, y0 = tx * size, ty * size
+        x1, y1 = min(width, x0 + size), min(height, y0 + size)
+
+        scale = 2 ** level
+        blank = getattr(self.image, "is_blank", None)
+        if blank and blank((x0 * scale, y0 * scale, x1 * scale, y1 * scale)):
+            # Zone jamais dessinée d'une image par tuiles : couleur de fond
+            tile = Image.new("RGB", (x1 - x0, y1 - y0), tuple(self.image.background.tolist()))
+        else:
+            below_width, below_height = self.level_size(level - 1)
+            box = (2 * x0, 2 * y0, min(below_width, 2 * x1), min(below_height, 2 * y1))
+            tile = self.region(level - 1, box).reduce(2)
+
+        cache[(tx, ty)] = tile
+        self._cached += 1
+        self._evict()
+        return tile
+
+    def _evict(self):
+        """Respecter max_tiles en oubliant d'abord les niveaux les plus détaillés"""
+        level = 1
+        while self._cached > self.max_tiles and level <= self.levels:
+            if self._cache[level]:
+                self._cache[level].popitem(last=False)
+                self._cached -= 1
+            else:
+                level += 1
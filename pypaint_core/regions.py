@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Boîtes englobantes (x0, y0, x1, y1) des zones modifiées, bornes hautes exclues
+"""
+
+
+def union_box(a, b):
+    """Union de deux boîtes (l'une ou l'autre peut valoir None)"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def clip_box(box, size):
+    """Borner une boîte à une image de taille (largeur, hauteur) ; None si vide"""
+    if box is None:
+        return None
+    width, height = size
+    x0 = max(0, int(box[0]))
+    y0 = max(0, int(box[1]))
+    x1 = min(width, int(box[2]))
+    y1 = min(height, int(box[3]))
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1)
+
+
+def ordered_box(box):
+    """Remettre une boîte dans l'ordre (x0 <= x1, y0 <= y1) attendu par PIL"""
+    x0, y0, x1, y1 = box
+    return [min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)]
+
+
+def points_box(points, width=1):
+    """Boîte d'une suite de coordonnées [x0, y0, x1, y1, ...] tracée avec une épaisseur"""
+    xs = points[0::2]
+    ys = points[1::2]
+    margin = width // 2 + 2
+    return (
+        int(min(xs)) - margin,
+        int(min(ys)) - margin,
+        int(max(xs)) + margin + 1,
+        int(max(ys)) + margin + 1,
+    )
+
+
+def box_area(box):
+    """Surface d'une boîte (0 pour None)"""
+    if box is None:
+        return 0
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage par tuiles projeté en mémoire pour les très grandes images
+"""
+
+import mmap
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image, ImageColor
+
+from .compact import encode_tile
+from .fill import apply_mask, find_spans, spans_box, spans_mask
+from .regions import clip_box
+
+
+# Rendre les pages d'une tuile compactée : libérées du fichier si possible, sinon de la mémoire du processus
+_RELEASE_PAGES = getattr(mmap, "MADV_REMOVE", getattr(mmap, "MADV_DONTNEED", None))
+
+
+class TiledImage:
+    """Image RGB découpée en tuiles carrées, stockées dans un fichier temporaire.
+
+    Les tuiles sont rangées l'une après l'autre dans un fichier projeté
+    en mémoire : seules celles qui sont lues ou écrites sont chargées en
+    mémoire par le système. Une tuile jamais écrite vaut la couleur de
+    fond et n'occupe aucune place (le fichier est creux). Une tuile
+    « différée » (voir defer()) n'est décompressée depuis son fichier
+    projet qu'à sa première lecture ou écriture. Une tuile en aplats peut
+    être rangée sous forme compacte (voir pack()) ; elle retourne dans le
+    fichier, en RGB, dès qu'on écrit dedans.
+
+    L'interface reprend ce dont PyPaint a besoin d'une image PIL : size,
+    mode, crop() et paste().
+    """
+
+    mode = "RGB"
+
+    def __init__(self, width, height, background="white", tile_size=256, directory=None):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.background = np.array(ImageColor.getrgb(background)[:3], dtype=np.uint8)
+        self.cols = -(-width // tile_size)
+        self.rows = -(-height // tile_size)
+
+        shape = (self.rows, self.cols, tile_size, tile_size, 3)
+        self._file = tempfile.TemporaryFile(prefix="pypaint-", suffix=".tiles", dir=directory)
+        self._file.truncate(int(np.prod(shape)))
+        self._map = mmap.mmap(self._file.fileno(), int(np.prod(shape)))
+        self._tiles = np.ndarray(shape, dtype=np.uint8, buffer=self._map)
+        self.allocated = np.zeros((self.rows, self.cols), dtype=bool)
+        # Tuiles à charger à leur premier accès : (tx, ty) -> fonction qui fournit les pixels
+        self.deferred = {}
+        # Tuiles rangées hors du fichier sous forme compacte : (tx, ty) -> CompactTile
+        self.packed = {}
+        self._lock = threading.Lock()
+
+        # Appelés avec (tx, ty) avant toute modification d'une tuile (historique, instantanés)
+        self.write_hooks = []
+
+    @classmethod
+    def from_image(cls, image, **kwargs):
+        """Créer une image par tuiles à partir d'une image PIL"""
+        tiled = cls(image.width, image.height, **kwargs)
+        image = image.convert("RGB")
+        for ty in range(tiled.rows):
+            for tx in range(tiled.cols):
+                box = tiled.tile_box(tx, ty)
+                tiled.write(box[:2], np.asarray(image.crop(box)))
+        return tiled
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    @property
+    def resident_tiles(self):
+        """Nombre de tuiles allouées dans le fichier"""
+        return int(self.allocated.sum())
+
+    @property
+    def stored_bytes(self):
+        """Octets occupés par les tuiles : brutes dans le fichier et compactes en mémoire"""
+        packed = sum(tile.nbytes for tile in list(self.packed.values()))
+        return self.resident_tiles * self.tile_size * self.tile_size * 3 + packed
+
+    def tile_box(self, tx, ty):
+        """Boîte de la tuile (tx, ty) dans l'image"""
+        size = self.tile_size
+        return (tx * size, ty * size, min(self.width, (tx + 1) * size), min(self.height, (ty + 1) * size))
+
+    def tiles_in(self, box):
+        """Coordonnées (tx, ty) des tuiles qui recouvrent une boîte"""
+        box = clip_box(box, self.size)
+        if box is None:
+            return
+        size = self.tile_size
+        x0, y0, x1, y1 = box
+        for ty in range(y0 // size, (y1 - 1) // size + 1):
+            for tx in range(x0 // size, (x1 - 1) // size + 1):
+                yield tx, ty
+
+    def is_blank(self, box):
+        """Vrai si aucune tuile recouvrant la boîte n'a jamais été écrite"""
+        return not any(
+            self.allocated[ty, tx] or (tx, ty) in self.deferred or (tx, ty) in self.packed
+            for tx, ty in self.tiles_in(box)
+        )
+
+    def defer(self, tx, ty, loader):
+        """Différer le chargement d'une tuile : loader() fournira ses pixels au premier accès"""
+        self.deferred[(tx, ty)] = loader
+        self.packed.pop((tx, ty), None)
+        self.allocated[ty, tx] = False
+
+    def stored_tiles(self):
+        """Tuiles différées et masque des tuiles stockées (allouées ou compactes), relevés ensemble"""
+        with self._lock:
+            stored = self.allocated.copy()
+            for tx, ty in self.packed:
+                stored[ty, tx] = True
+            return dict(self.deferred), stored
+
+    def _load(self, tx, ty):
+        """Charger dans le fichier une tuile différée ou compacte ; vrai si la tuile y est alors"""
+        if (tx, ty) not in self.deferred and (tx, ty) not in self.packed:
+            return bool(self.allocated[ty, tx])
+        with self._lock:
+            # Un autre thread a pu la charger entre-temps
+            loader = self.deferred.get((tx, ty))
+            packed = self.packed.get((tx, ty))
+            if loader is not None or packed is not None:
+                bx0, by0, bx1, by1 = self.tile_box(tx, ty)
+                self._tiles[ty, tx, :by1 - by0, :bx1 - bx0] = loader() if loader is not None else packed.decode()
+                self.allocated[ty, tx] = True
+                self.deferred.pop((tx, ty), None)
+                self.packed.pop((tx, ty), None)
+        return True
+
+    def read(self, box):
+        """Copie NumPy (hauteur, largeur, 3) des pixels d'une boîte"""
+        x0, y0, x1, y1 = box
+        out = np.empty((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+        out[...] = self.background
+        for tx, ty in self.tiles_in(box):
+            if (tx, ty) in self.deferred:
+                self._load(tx, ty)
+            bx0, by0, bx1, by1 = self.tile_box(tx, ty)
+            ix0, iy0 = max(x0, bx0), max(y0, by0)
+            ix1, iy1 = min(x1, bx1), min(y1, by1)
+            # Une tuile compacte est décodée sans retourner dans le fichier ; le verrou
+            # évite de lire des pages que pack() vient de rendre
+            with self._lock:
+                packed = self.packed.get((tx, ty))
+                if packed is not None:
+                    source = packed.decode()
+                elif self.allocated[ty, tx]:
+                    source = self._tiles[ty, tx]
+                else:
+                    continue
+                out[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = source[iy0 - by0:iy1 - by0, ix0 - bx0:ix1 - bx0]
+        return out
+
+    def write(self, xy, pixels, hook=True):
+        """Écrire un tableau (hauteur, largeur, 3) avec son coin en xy"""
+        x0, y0 = xy
+        x1, y1 = x0 + pixels.shape[1], y0 + pixels.shape[0]
+        size = self.tile_size
+        for tx, ty in list(self.tiles_in((x0, y0, x1, y1))):
+            self._load(tx, ty)
+            if hook:
+                for write_hook in tuple(self.write_hooks):
+                    write_hook(tx, ty)
+            tile = self._tiles[ty, tx]
+            if not self.allocated[ty, tx]:
+                tile[...] = self.background
+                self.allocated[ty, tx] = True
+            bx0, by0, bx1, by1 = self.tile_box(tx, ty)
+            ix0, iy0 = max(x0, bx0, 0), max(y0, by0, 0)
+            ix1, iy1 = min(x1, bx1), min(y1, by1)
+            tile[iy0 - by0:iy1 - by0, ix0 - bx0:ix1 - bx0] = pixels[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0]
+
+    def crop(self, box):
+        """Extraire une boîte sous forme d'image PIL"""
+        return Image.fromarray(self.read(box), self.mode)
+
+    def paste(self, image, xy=(0, 0)):
+        """Coller une image PIL avec son coin supérieur gauche en xy"""
+        x, y = xy
+        # Par bandes d'une rangée de tuiles : jamais de copie complète de l'image en mémoire
+        for top in range(0, image.height, self.tile_size):
+            band = image.crop((0, top, image.width, min(image.height, top + self.tile_size)))
+            if band.mode != self.mode:
+                band = band.convert(self.mode)
+            self.write((x, y + top), np.asarray(band))
+
+    def pack(self, box=None):
+        """Ranger sous forme compacte (voir compact.py) les tuiles allouées d'une boîte qui s'y prêtent.
+
+        Une tuile en aplats ou en traits ne garde que son encodage et ses
+        pages du fichier sont rendues ; une tuile revenue à la couleur de
+        fond n'est plus stockée du tout. Une photo ou un dégradé reste
+        dans le fichier. Retourne le nombre de tuiles rangées.
+        """
+        if box is None:
+            box = (0, 0, self.width, self.height)
+        count = 0
+        for tx, ty in list(self.tiles_in(box)):
+            if not self.allocated[ty, tx]:
+                continue
+            bx0, by0, bx1, by1 = self.tile_box(tx, ty)
+            tile = encode_tile(self._tiles[ty, tx, :by1 - by0, :bx1 - bx0])
+            if tile.kind == "raw":
+                continue
+            blank = tile.kind == "uniform" and tile.equals(np.broadcast_to(self.background, tile.shape))
+            with self._lock:
+                if not blank:
+                    self.packed[(tx, ty)] = tile
+                self.allocated[ty, tx] = False
+                self._release(tx, ty)
+            count += 1
+        return count
+
+    def _release(self, tx, ty):
+        """Rendre au système les pages du fichier d'une tuile qui n'y est plus"""
+        if _RELEASE_PAGES is None:
+            return
+        length = self.tile_size * self.tile_size * 3
+        start = (ty * self.cols + tx) * length
+        # madvise() ne porte que sur des pages entières
+        first = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+        last = (start + length) // mmap.PAGESIZE * mmap.PAGESIZE
+        if last > first:
+            try:
+                self._map.madvise(_RELEASE_PAGES, first, last - first)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remettre toutes les tuiles à la couleur de fond"""
+        stored = {(int(tx), int(ty)) for ty, tx in zip(*np.nonzero(self.allocated))}
+        for tx, ty in sorted(stored | set(self.deferred) | set(self.packed)):
+            for write_hook in tuple(self.write_hooks):
+                write_hook(tx, ty)
+        self.allocated[...] = False
+        self.deferred.clear()
+        self.packed.clear()
+
+    def fill(self, x, y, color, tolerance=0):
+        """Remplissage scanline, lu et écrit par bandes de tuiles. Retourne la boîte modifiée"""
+        spans = find_spans(
+            lambda y0, y1: self.read((0, y0, self.width, y1)),
+            self.width, self.height, x, y, color, tolerance
+        )
+        if spans is None:
+            return None
+
+        box = spans_box(spans)
+        x0, y0, x1, y1 = box
+        for band in range(y0 - y0 % self.tile_size, y1, self.tile_size):
+            band_box = (x0, max(y0, band), x1, min(y1, band + self.tile_size))
+            pixels = self.read(band_box)
+            apply_mask(pixels, spans_mask(spans, band_box), color)
+            self.write(band_box[:2], pixels)
+        return box
+
+    def to_image(self):
+        """Assembler l'image complète (attention à la mémoire pour les grands formats)"""
+        return self.crop((0, 0, self.width, self.height))
+
+    def snapshot(self):
+        """Instantané en lecture seule, par copie sur écriture"""
+        return TileSnapshot(self)
+
+    def close(self):
+        """Libérer le fichier temporaire"""
+        if self._tiles is not None:
+            self._tiles = None
+            self.packed = {}
+            try:
+                self._map.close()
+            except BufferError:
+                # Une vue sur les tuiles existe encore : la projection sera fermée avec elle
+                pass
+            self._file.close()
+
+
+class TileSnapshot:
+    """État figé d'une TiledImage, sans copie complète.
+
+    Une tuile n'est copiée que si l'image est modifiée pendant que
+    l'instantané existe ; release() arrête le suivi. Les lectures peuvent
+    venir d'un autre thread (enregistrement en arrière-plan) : un verrou
+    les ordonne avec les copies faites avant chaque écriture.
+    """
+
+    mode = "RGB"
+
+    def __init__(self, image):
+        self.image = image
+        self.width = image.width
+        self.height = image.height
+        self.tile_size = image.tile_size
+        self.saved = {}
+        self._lock = threading.Lock()
+        image.write_hooks.append(self._save)
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+    def _save(self, tx, ty):
+        with self._lock:
+            if (tx, ty) not in self.saved:
+                self.saved[(tx, ty)] = self.image.read(self.image.tile_box(tx, ty))
+
+    def read(self, box):
+        """Copie NumPy des pixels d'une boîte, telle qu'au moment de l'instantané"""
+        x0, y0, x1, y1 = box
+        with self._lock:
+            out = self.image.read(box)
+            for tx, ty in self.image.tiles_in(box):
+                before = self.saved.get((tx, ty))
+                if before is None:
+                    continue
+                bx0, by0, bx1, by1 = self.image.tile_box(tx, ty)
+                ix0, iy0 = max(x0, bx0), max(y0, by0)
+                ix1, iy1 = min(x1, bx1), min(y1, by1)
+                out[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0] = before[iy0 - by0:iy1 - by0, ix0 - bx0:ix1 - bx0]
+        return out
+
+    def crop(self, box):
+        return Image.fromarray(self.read(box), self.mode)
+
+    def to_image(self):
+        return self.crop((0, 0, self.width, self.height))
+
+    def release(self):
+        """Cesser de suivre l'image et libérer les tuiles copiées"""
+        if self._save in self.image.write_hooks:
+            self.image.write_hooks.remove(self._save)
+        self.saved = {}
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Formes vectorielles modifiables (lignes, rectangles, ellipses) et leur index spatial
+"""
+
+import math
+from dataclasses import asdict, dataclass
+
+from PIL import Image, ImageDraw
+
+from .regions import ordered_box, points_box, union_box
+
+
+SHAPE_KINDS = ("line", "rect", "ellipse")
+
+
+@dataclass
+class Shape:
+    """Forme conservée telle quelle : deux points (extrémités ou coins opposés), couleur, épaisseur"""
+
+    kind: str
+    points: list
+    color: str = "#000000"
+    width: int = 3
+
+    def __post_init__(self):
+        if self.kind not in SHAPE_KINDS:
+            raise ValueError(f"Forme inconnue: {self.kind}")
+
+    @property
+    def box(self):
+        return points_box(self.points, self.width)
+
+    def draw(self, draw):
+        """Dessiner la forme, exactement comme les opérations Line, Rect et Ellipse"""
+        if self.kind == "line":
+            draw.line(self.points, fill=self.color, width=self.width, joint="curve")
+        elif self.kind == "rect":
+            draw.rectangle(ordered_box(self.points), outline=self.color, width=self.width)
+        else:
+            draw.ellipse(ordered_box(self.points), outline=self.color, width=self.width)
+
+    def distance(self, x, y):
+        """Distance approchée (px) d'un point au tracé de la forme"""
+        x0, y0, x1, y1 = self.points
+        if self.kind == "line":
+            dx, dy = x1 - x0, y1 - y0
+            length = dx * dx + dy * dy
+            t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - x0) * dx + (y - y0) * dy) / length))
+            return math.hypot(x - (x0 + t * dx), y - (y0 + t * dy))
+
+        left, top, right, bottom = ordered_box(self.points)
+        if self.kind == "rect":
+            if left <= x <= right and top <= y <= bottom:
+                return min(x - left, right - x, y - top, bottom - y)
+            return math.hypot(max(left - x, 0, x - right), max(top - y, 0, y - bottom))
+
+        rx, ry = max(1.0, (right - left) / 2), max(1.0, (bottom - top) / 2)
+        radius = math.hypot((x - (left + right) / 2) / rx, (y - (top + bottom) / 2) / ry)
+        return abs(radius - 1) * min(rx, ry)
+
+    def hit(self, x, y, tolerance=3):
+        """Vrai si (x, y) tombe sur le tracé (les contours PIL sont dessinés vers l'intérieur)"""
+        margin = self.width if self.kind != "line" else self.width / 2
+        return self.distance(x, y) <= margin + tolerance
+
+
+class GridIndex:
+    """Index spatial en grille uniforme : chaque clé est rangée dans les cases que couvre sa boîte"""
+
+    def __init__(self, cell=128):
+        self.cell = cell
+        self.cells = {}
+
+    def _cells(self, box):
+        cell = self.cell
+        for cy in range(math.floor(box[1] / cell), math.floor((box[3] - 1) / cell) + 1):
+            for cx in range(math.floor(box[0] / cell), math.floor((box[2] - 1) / cell) + 1):
+                yield cx, cy
+
+    def insert(self, key, box):
+        for cell in self._cells(box):
+            self.cells.setdefault(cell, set()).add(key)
+
+    def remove(self, key, box):
+        for cell in self._cells(box):
+            keys = self.cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+
+    def query(self, box):
+        """Clés dont une case recoupe la boîte (candidats : leur boîte peut ne pas la toucher)"""
+        found = set()
+        for cell in self._cells(box):
+            found |= self.cells.get(cell, set())
+        return found
+
+    def clear(self):
+        self.cells.clear()
+
+
+class VectorLayer:
+    """Formes du document, au-dessus des calques, indexées pour le clic et le redessin partiel.
+
+    Les formes ne sont pas dans les pixels des calques : render() ne
+    rastérise, dans une boîte, que celles que l'index y trouve. Elles ne
+    sont écrites dans un calque qu'à l'aplatissement (FlattenShapes).
+    L'ordre d'empilement est celui des identifiants (ordre de création).
+    """
+
+    def __init__(self, cell=128):
+        self.shapes = {}
+        self.index = GridIndex(cell)
+        self.next_id = 1
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def add(self, shape, shape_id=None):
+        """Ajouter une forme ; retourne son identifiant"""
+        if shape_id is None:
+            shape_id = self.next_id
+        self.next_id = max(self.next_id, shape_id + 1)
+        self.shapes[shape_id] = shape
+        self.index.insert(shape_id, shape.box)
+        return shape_id
+
+    def remove(self, shape_id):
+        """Retirer une forme ; retourne la boîte qu'elle occupait"""
+        shape = self.shapes.pop(shape_id)
+        self.index.remove(shape_id, shape.box)
+        return shape.box
+
+    def reshape(self, shape_id, points):
+        """Changer les points d'une forme (déplacement, redimensionnement) ; retourne la boîte à redessiner"""
+        shape = self.shapes[shape_id]
+        old = shape.box
+        self.index.remove(shape_id, old)
+        shape.points = [int(v) for v in points]
+        self.index.insert(shape_id, shape.box)
+        return union_box(old, shape.box)
+
+    def restore(self, states):
+        """Remettre des formes dans un état noté (None : absente).
+
+        Retourne l'état remplacé, sous la même forme, et la boîte à redessiner.
+        """
+        replaced = {}
+        box = None
+        for shape_id, shape in states.items():
+            replaced[shape_id] = self.shapes.get(shape_id)
+            if replaced[shape_id] is not None:
+                box = union_box(box, self.remove(shape_id))
+            if shape is not None:
+                self.add(shape, shape_id)
+                box = union_box(box, shape.box)
+        return replaced, box
+
+    def move(self, shape_id, dx, dy):
+        x0, y0, x1, y1 = self.shapes[shape_id].points
+        return self.reshape(shape_id, [x0 + dx, y0 + dy, x1 + dx, y1 + dy])
+
+    def hit(self, x, y, tolerance=3):
+        """Identifiant de la forme la plus haute sous (x, y), ou None"""
+        candidates = self.index.query((x - tolerance, y - tolerance, x + tolerance + 1, y + tolerance + 1))
+        for shape_id in sorted(candidates, reverse=True):
+            if self.shapes[shape_id].hit(x, y, tolerance):
+                return shape_id
+        return None
+
+    def overlapping(self, box):
+        """Identifiants des formes dont la boîte recoupe `box`, dans l'ordre d'empilement"""
+        return sorted(
+            shape_id for shape_id in self.index.query(box)
+            if _intersects(self.shapes[shape_id].box, box)
+        )
+
+    def render(self, box):
+        """Image RGBA des formes dans une boîte (None si aucune n'y passe)"""
+        shape_ids = self.overlapping(box)
+        if not shape_ids:
+            return None
+        region = Image.new("RGBA", (box[2] - box[0], box[3] - box[1]), (0, 0, 0, 0))
+        # Décaler l'origine plutôt que les coordonnées de chaque forme
+        draw = ImageDraw.Draw(region)
+        for shape_id in shape_ids:
+            shape = self.shapes[shape_id]
+            x0, y0, x1, y1 = shape.points
+            Shape(shape.kind, [x0 - box[0], y0 - box[1], x1 - box[0], y1 - box[1]],
+                  shape.color, shape.width).draw(draw)
+        return region
+
+    def clear(self):
+        self.shapes.clear()
+        self.index.clear()
+
+    def to_list(self):
+        """Formes sérialisables (avec leur identifiant), pour les fichiers projet"""
+        return [dict(asdict(shape), id=shape_id) for shape_id, shape in self.shapes.items()]
+
+    def load(self, shapes):
+        """Remplacer les formes par celles d'une liste produite par to_list()"""
+        self.clear()
+        for data in shapes:
+            data = dict(data)
+            shape_id = data.pop("id")
+            self.add(Shape(**data), shape_id)
+
+
+def _intersects(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Reprise de session : l'historique rejoué regroupe les opérations comme pendant la session
+"""
+
+import numpy as np
+
+from pypaint_core import Document, Journal, Line, Redo, Spray, Stroke, Undo
+
+
+def _grouped_session(directory):
+    """Session où plusieurs opérations forment une seule action (trait en plusieurs morceaux)"""
+    document = Document(200, 150)
+    journal = Journal(str(directory))
+    journal.start(document)
+    # Un trait de crayon arrive par morceaux et n'est validé qu'au relâchement
+    for segment in ([10, 10, 60, 40], [60, 40, 120, 30], [120, 30, 180, 90]):
+        document.apply(Stroke(segment, "#ff0000", 5), commit=False)
+    document.commit()
+    document.apply(Line([20, 120, 180, 20], "#0000ff", 3), commit=False)
+    document.apply(Line([20, 20, 180, 120], "#0000ff", 3), commit=False)
+    document.commit()
+    document.apply(Undo())
+    journal.close()
+    return document
+
+
+def test_recover_keeps_grouped_commits(tmp_path):
+    live = _grouped_session(tmp_path)
+    recovered = Journal.recover(str(tmp_path))
+    assert np.array_equal(np.array(live.composite), np.array(recovered.composite))
+    assert len(recovered.history) == len(live.history)
+
+    # Annuler après la reprise retire tout le trait, comme dans la session
+    live.apply(Undo())
+    recovered.apply(Undo())
+    assert np.array_equal(np.array(live.composite), np.array(recovered.composite))
+
+    live.apply(Redo())
+    recovered.apply(Redo())
+    assert np.array_equal(np.array(live.composite), np.array(recovered.composite))
+
+
+def test_recover_spray_gesture_is_one_action(tmp_path):
+    # Jet d'aérographe : un lot de gouttes par image, un seul commit au relâchement
+    live = Document(200, 150)
+    journal = Journal(str(tmp_path))
+    journal.start(live)
+    live.apply(Line([10, 140, 190, 140], "#000000", 3))
+    for seed, segment in enumerate(([40, 40, 70, 50], [70, 50, 110, 60], [110, 60, 150, 80])):
+        live.apply(Spray(segment, "#00aa00", 15, 300, seed), commit=False)
+    live.commit()
+    journal.close()
+
+    recovered = Journal.recover(str(tmp_path))
+    live.apply(Undo())
+    recovered.apply(Undo())
+    assert len(recovered.history) == len(live.history) == 1
+    assert np.array_equal(np.array(live.composite), np.array(recovered.composite))